@@ -1,28 +1,54 @@
+import time
+_start = time.perf_counter()
+
+import os
+
+# Tempi di avvio misurati (secondi), riportati da print_startup_report
+STARTUP_TIMES = {}
+try:
+    import psutil
+    # Dalla nascita del processo (o dal fork del worker) all'inizio di app.py
+    STARTUP_TIMES['processo fino ad app.py'] = time.time() - psutil.Process().create_time() - (time.perf_counter() - _start)
+except ImportError:
+    pass
+
 import dash
 from dash import html, dcc
 from flask import Flask
-import os
-
+STARTUP_TIMES['import dash/flask'] = time.perf_counter() - _start
 
+# Con LAZY_PAGES=0 i moduli delle pagine vengono importati subito (utile con gunicorn --preload)
+LAZY_PAGES = os.environ.get("LAZY_PAGES", "1") != "0"
 
 # Inizializzazione del server Flask e Dash
 server = Flask(__name__)
 app = dash.Dash(__name__, server=server)
 
+# Callback della ricerca, registrati una sola volta per tutte le pagine
 from ricerca import register_search_callbacks
 register_search_callbacks(app)
 
-# Importa le app dei worker
-import rendimenti_volatilita
-rendimenti_volatilita.register_callbacks(app)  # ✅ Ora i callback sono nel server principale
+# Endpoint /metrics e misura delle risposte dei callback
+from metriche import register_metrics
+register_metrics(server)
 
+# Callback di tutte le pagine: i moduli delle pagine vengono importati alla prima visita o al primo callback
+from pagine import PAGES, load_page, register_page_callbacks
+started = time.perf_counter()
+register_page_callbacks(app)
+STARTUP_TIMES['dichiarazione dei callback'] = time.perf_counter() - started
 
-import rendimenti_asset
-rendimenti_asset.register_callbacks(app)  # ✅ Ora i callback sono nel server principale
+def print_startup_report():
+    """ Stampa i tempi di avvio misurati finora. """
+    print("⏱️ Tempi di avvio:")
+    for name, seconds in STARTUP_TIMES.items():
+        print(f"   {name}: {seconds * 1000:.0f} ms")
 
-
-import nuovi_massimi_anno
-nuovi_massimi_anno.register_callbacks(app)  # ✅ Ora i callback sono nel server principale
+if not LAZY_PAGES:
+    for module_name, _, _ in PAGES.values():
+        load_page(module_name)
+STARTUP_TIMES['import app.py'] = time.perf_counter() - _start
+print_startup_report()
 
 # Layout base di Dash
 app.layout = html.Div([
@@ -37,31 +63,19 @@ app.layout = html.Div([
 )
 def display_page(pathname):
     if pathname == '/':
+        links = []
+        for path, (_, label, _) in PAGES.items():
+            links.extend([dcc.Link(label, href=path), html.Br()])
         return html.Div([
             html.H1('QUANT-REA Dashboard'),
             html.P('Seleziona un\'analisi:'),
-            html.Div([
-                dcc.Link('Analisi Asset', href='/asset'),
-                html.Br(),
-                dcc.Link('Analisi Volatilità', href='/volatilita'),
-                html.Br(),
-                dcc.Link('Nuovi Massimi nell anno', href='/nuovimaxanno')
-            ])
+            html.Div(links[:-1])
         ])
-    elif pathname == '/asset':
-        return rendimenti_asset.layout
-    elif pathname == '/volatilita':
-        return rendimenti_volatilita.layout
-    elif pathname == '/nuovimaxanno':
-        return nuovi_massimi_anno.layout    
+    elif pathname in PAGES:
+        return load_page(PAGES[pathname][0]).layout
     else:
         return '404 - Pagina non trovata'
 
-# Registra i callback delle altre app
-app.callback_map.update(rendimenti_volatilita.app.callback_map)
-app.callback_map.update(rendimenti_asset.app.callback_map)
-app.callback_map.update(nuovi_massimi_anno.app.callback_map)
-
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     app.run_server(host='0.0.0.0', port=port)
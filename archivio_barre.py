@@ -0,0 +1,181 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Colonne salvate su disco (una per file, float64) oltre al tempo in int64 ns
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+BAR_STORE_DIR = os.environ.get("BAR_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bar_store"))
+
+
+class BarStore:
+    """ Archivio su disco delle barre OHLCV, una cartella per (exchange:symbol, intervallo).
+
+    Ogni colonna è un file binario grezzo letto con np.memmap, così i worker che leggono
+    la stessa storia condividono le pagine del sistema operativo invece di tenerne una copia
+    ciascuno. Le barre nuove vengono accodate ai file; meta.json (sostituito in modo atomico)
+    indica la generazione dei file e quante righe sono valide.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or BAR_STORE_DIR
+
+    def _series_dir(self, key):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{key[0]}_{key[1]}")
+        return os.path.join(self.root, name)
+
+    def _column_path(self, directory, column, generation):
+        suffix = 'i8' if column == 'time' else 'f8'
+        return os.path.join(directory, f"{column}.{generation}.{suffix}")
+
+    def _read_meta(self, directory):
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, directory, meta):
+        tmp_path = os.path.join(directory, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+    @contextmanager
+    def _locked(self, key):
+        """ Lock esclusivo sulla serie, valido anche tra processi diversi. """
+        directory = self._series_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield directory
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, key):
+        """ Restituisce (frame, meta) con le colonne mappate in sola lettura, oppure (None, None). """
+        directory = self._series_dir(key)
+        # Un secondo tentativo copre il caso in cui un altro processo abbia appena riscritto la serie
+        for _ in range(2):
+            meta = self._read_meta(directory)
+            if not meta or meta['length'] == 0:
+                return None, None
+
+            length, generation = meta['length'], meta['generation']
+            try:
+                times = np.memmap(self._column_path(directory, 'time', generation), dtype='i8', mode='r',
+                                  shape=(length,))
+                columns = {column: np.memmap(self._column_path(directory, column, generation), dtype='f8',
+                                             mode='r', shape=(length,))
+                           for column in BAR_COLUMNS}
+            except (OSError, ValueError):
+                continue
+
+            index = pd.DatetimeIndex(times.view('M8[ns]'), name='datetime')
+            return pd.DataFrame(columns, index=index, copy=False), meta
+        return None, None
+
+    def write(self, key, frame, n_bars):
+        """ Riscrive da zero la serie con una nuova generazione di file. """
+        with self._locked(key) as directory:
+            meta = self._read_meta(directory) or {'generation': 0}
+            old_generation = meta.get('generation', 0) if meta.get('length') else None
+            generation = meta['generation'] + 1
+            self._write_columns(directory, frame, generation, mode='wb')
+            self._write_meta(directory, {
+                'generation': generation, 'length': len(frame), 'n_bars': n_bars,
+                'fetched_at': time.time(),
+            })
+            # I lettori con i vecchi file già mappati continuano a vederli finché non li chiudono
+            if old_generation is not None:
+                self._remove_generation(directory, old_generation)
+
+    def append(self, key, frame):
+        """ Accoda le barre successive all'ultima salvata.
+
+        Una barra con lo stesso orario dell'ultima salvata la sostituisce (l'ultima barra può
+        essere ancora in formazione); le barre precedenti vengono ignorate. Le righe nuove
+        vengono scritte oltre la lunghezza indicata da meta.json, che i lettori non vedono;
+        per sostituire l'ultima riga invece i file vengono copiati in una nuova generazione,
+        perché altri processi possono averla mappata in quel momento.
+        Restituisce False se la serie non esiste e va scritta con write().
+        """
+        with self._locked(key) as directory:
+            meta = self._read_meta(directory)
+            if not meta or meta['length'] == 0:
+                return False
+
+            length, generation = meta['length'], meta['generation']
+            times = np.memmap(self._column_path(directory, 'time', generation), dtype='i8', mode='r', shape=(length,))
+            last_time = int(times[-1])
+            del times
+
+            new_times = frame.index.values.astype('M8[ns]').view('i8')
+            frame = frame[new_times >= last_time]
+            old_generation = None
+            if not frame.empty and int(frame.index.values.astype('M8[ns]').view('i8')[0]) == last_time:
+                # Nuova generazione con le righe salvate tranne l'ultima, poi le barre scaricate dalla sua posizione
+                old_generation, generation = generation, generation + 1
+                for column in ['time'] + BAR_COLUMNS:
+                    target = self._column_path(directory, column, generation)
+                    shutil.copyfile(self._column_path(directory, column, old_generation), target)
+                    os.truncate(target, (length - 1) * 8)
+                length -= 1
+            if not frame.empty:
+                # Scrive dalla riga `length` in poi: eventuali avanzi di una scrittura interrotta vengono sovrascritti
+                self._write_columns(directory, frame, generation, mode='r+b', offset_rows=length)
+
+            meta.update({'generation': generation, 'length': length + len(frame), 'fetched_at': time.time()})
+            self._write_meta(directory, meta)
+            # I lettori con i vecchi file già mappati continuano a vederli finché non li chiudono
+            if old_generation is not None:
+                self._remove_generation(directory, old_generation)
+            return True
+
+    def _remove_generation(self, directory, generation):
+        for column in ['time'] + BAR_COLUMNS:
+            try:
+                os.remove(self._column_path(directory, column, generation))
+            except OSError:
+                pass
+
+    def read_state(self, key, name):
+        """ Stato derivato dalla serie salvato con write_state (dict di array), oppure None. """
+        try:
+            with np.load(os.path.join(self._series_dir(key), f"{name}.state.npz")) as data:
+                return {field: data[field] for field in data.files}
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def write_state(self, key, name, state):
+        """ Salva accanto alla serie uno stato derivato (es. statistiche mobili), sostituito in modo atomico. """
+        directory = self._series_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f"{name}.state.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez(tmp_path, **state)
+        os.replace(tmp_path, os.path.join(directory, f"{name}.state.npz"))
+
+    def _write_columns(self, directory, frame, generation, mode, offset_rows=0):
+        values = {'time': frame.index.values.astype('M8[ns]').view('i8')}
+        for column in BAR_COLUMNS:
+            values[column] = frame[column].to_numpy(dtype='f8')
+        # Il tempo per ultimo: una riga è valida solo quando meta.json ne conta la lunghezza
+        for column in BAR_COLUMNS + ['time']:
+            path = self._column_path(directory, column, generation)
+            with open(path, mode) as f:
+                if offset_rows:
+                    f.seek(offset_rows * 8)
+                values[column].tofile(f)
+
+
+# Archivio condiviso da tutti i moduli
+bar_store = BarStore()
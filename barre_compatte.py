@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Scatto di prezzo da preservare: una colonna di prezzi resta in float32 solo se ogni valore
+# convertito cade entro mezzo scatto dall'originale (con scatti di 1e-4, prezzi sotto 1024 circa)
+BAR_PRICE_TICK = float(os.environ.get("BAR_PRICE_TICK", 1e-4))
+# Per i volumi (conteggi) l'errore deve restare sotto mezza unità
+VOLUME_ATOL = 0.5
+
+
+def compact_column(values, atol):
+    """ La colonna in float32 se nessun valore cambia di più di atol nella conversione, altrimenti in float64. """
+    values = np.asarray(values, dtype='f8')
+    with np.errstate(over='ignore'):
+        narrow = values.astype('f4')
+    widened = narrow.astype('f8')
+    finite = np.isfinite(values)
+    # Fuori dall'intervallo del float32 (overflow) la conversione non è accettabile
+    if not np.array_equal(finite, np.isfinite(widened)):
+        return values
+    if np.all(np.abs(widened[finite] - values[finite]) <= atol):
+        return narrow
+    return values
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class CompactBars:
+    """ Barre di una serie come struttura di array: orari in int64 ns, un array per colonna
+    (float32 se l'errore resta entro mezzo scatto di prezzo, vedi compact_column) e simbolo
+    e intervallo salvati una volta sola.
+
+    Gli array sono in sola lettura e to_frame() li avvolge in un DataFrame senza copiarli,
+    con le sole colonne richieste: le pagine che usano le chiusure non materializzano il resto.
+    """
+
+    __slots__ = ('symbol', 'interval', 'times', 'columns')
+
+    def __init__(self, symbol, interval, times, columns):
+        self.symbol = symbol
+        self.interval = interval
+        self.times = _read_only(np.ascontiguousarray(times, dtype='i8'))
+        self.columns = {name: _read_only(np.ascontiguousarray(values)) for name, values in columns.items()}
+
+    @classmethod
+    def from_frame(cls, frame, symbol=None, interval=None):
+        """ Barre compatte da un DataFrame con DatetimeIndex; le colonne non numeriche (es. 'symbol') sono scartate. """
+        times = frame.index.values.astype('M8[ns]').view('i8')
+        columns = {name: compact_column(frame[name].to_numpy(dtype='f8'),
+                                        VOLUME_ATOL if name == 'volume' else BAR_PRICE_TICK / 2)
+                   for name in frame.columns if pd.api.types.is_numeric_dtype(frame[name])}
+        return cls(symbol, interval, times, columns)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    @property
+    def last_time(self):
+        return pd.Timestamp(int(self.times[-1]))
+
+    def to_frame(self, n_bars=None, columns=None):
+        """ DataFrame delle ultime n_bars barre (tutte se None) con le colonne richieste (tutte se None). """
+        start = 0 if n_bars is None else max(len(self.times) - n_bars, 0)
+        names = list(self.columns) if columns is None else [name for name in columns if name in self.columns]
+        index = pd.DatetimeIndex(self.times[start:].view('M8[ns]'), name='datetime')
+        return pd.DataFrame({name: self.columns[name][start:] for name in names}, index=index, copy=False)
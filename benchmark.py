@@ -0,0 +1,253 @@
+""" Benchmark offline delle pagine e della ricerca, con dati sintetici al posto di TradingView.
+
+Misura get_asset_data e update_page (il callback registrato dall'app) di ogni pagina (a freddo, con tutte le cache vuote,
+e a caldo) per diverse lunghezze della storia, e update_dropdown_options su universi
+sintetici di ticker. Per ogni misura registra tempo (mediana e minimo delle ripetizioni),
+picco di memoria allocata (tracemalloc) e byte JSON inviati al browser; i risultati
+finiscono in un file JSON confrontabile tra commit diversi.
+
+Uso:
+    python benchmark.py
+    python benchmark.py --bars 1000,10000 --universe 10000 --repeat 3
+    python benchmark.py --compare bench_results/abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PAGES = ['rendimenti_volatilita', 'rendimenti_asset', 'nuovi_massimi_anno']
+DEFAULT_BARS = [1000, 10000, 50000, 100000]
+DEFAULT_UNIVERSE = [10000, 100000, 500000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+BENCH_TICKER = "NASDAQ:BENCH"
+# Peggioramento oltre il quale il confronto segnala una regressione
+REGRESSION_RATIO = 1.2
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return result.stdout.strip() or "sconosciuto"
+    except (OSError, subprocess.SubprocessError):
+        return "sconosciuto"
+
+
+def measure(fn, repeat, setup=None):
+    """ Esegue fn `repeat` volte (setup prima di ognuna, fuori dal tempo) più una sotto tracemalloc. """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'wall_s_median': statistics.median(times), 'wall_s_min': min(times),
+            'wall_s_runs': times, 'peak_mem_bytes': peak}, result
+
+
+def payload_bytes(outputs):
+    """ Byte del JSON degli output del callback, serializzati come fa Dash. """
+    from plotly.io.json import to_json_plotly
+    if not isinstance(outputs, (tuple, list)):
+        outputs = [outputs]
+    return len(to_json_plotly(list(outputs)))
+
+
+def reset_caches():
+    """ Svuota cache in memoria, memo delle analisi, cache condivisa e archivio su disco.
+
+    La cache condivisa è sempre quella in memoria del processo (REDIS_URL=memory://, vedi main):
+    flushdb non tocca mai un server Redis vero.
+    """
+    from archivio_barre import bar_store
+    from cache_barre import bar_cache
+    from cache_condivisa import shared_cache
+    from memo_analisi import analytics_memo
+
+    bar_cache.clear()
+    analytics_memo.clear()
+    assert shared_cache.url.startswith("memory://"), "il benchmark non deve svuotare un Redis vero"
+    shared_cache.client.flushdb()
+    shutil.rmtree(bar_store.root, ignore_errors=True)
+
+
+def bench_pages(bars_sizes, repeat, report):
+    import importlib
+
+    for name in PAGES:
+        module = importlib.import_module(name)
+        # update_page prende anche l'intervallo nelle pagine che lo hanno (None: giornaliero)
+        args = (BENCH_TICKER,) if name == 'rendimenti_asset' else (BENCH_TICKER, None)
+        default_bars = module.N_BARS
+        try:
+            for n_bars in bars_sizes:
+                module.N_BARS = n_bars
+                # Prima chiamata non misurata: genera la storia sintetica e scalda gli import
+                reset_caches()
+                module.update_page(*args)
+
+                for mode, setup in (('cold', reset_caches), ('warm', None)):
+                    stats, _ = measure(lambda: module.get_asset_data(BENCH_TICKER), repeat, setup)
+                    report({'benchmark': f"{name}.get_asset_data", 'size': n_bars, 'mode': mode, **stats})
+
+                    stats, outputs = measure(lambda: module.update_page(*args), repeat, setup)
+                    report({'benchmark': f"{name}.update_page", 'size': n_bars, 'mode': mode,
+                            'payload_bytes': payload_bytes(outputs), **stats})
+        finally:
+            module.N_BARS = default_bars
+
+
+def search_queries(universe):
+    """ Una ricerca per ogni livello dell'indice: ticker esatto, prefisso, parola, sottostringa, nessun risultato. """
+    long_tickers = universe['Ticker'][universe['Ticker'].str.len() >= 4]
+    return {
+        'ticker_esatto': universe['Ticker'].iloc[0],
+        'prefisso_ticker': long_tickers.iloc[0][:3],
+        'prefisso_parola': 'Quant',
+        'sottostringa': 'arma',
+        'nessun_risultato': 'zqxw',
+    }
+
+
+def bench_search(universe_sizes, repeat, workdir, report):
+    import dash
+    from flask import Flask
+    import ricerca
+    from dati_sintetici import synthetic_universe
+    from indice_ticker import TickerIndex
+
+    for n_rows in universe_sizes:
+        # Il CSV dei ticker è letto dalla cartella corrente (ricerca.TICKERS_CSV)
+        directory = os.path.join(workdir, f"universo_{n_rows}")
+        os.makedirs(directory, exist_ok=True)
+        os.chdir(directory)
+        universe = synthetic_universe(n_rows)
+        universe.to_csv(ricerca.TICKERS_CSV, index=False)
+
+        stats, _ = measure(lambda: TickerIndex(ricerca.load_tickers_from_csv()), repeat)
+        report({'benchmark': 'ricerca.TickerIndex', 'size': n_rows, 'mode': 'build', **stats})
+
+        app = dash.Dash(__name__, server=Flask(__name__))
+        app.layout = ricerca.get_search_layout()
+        ricerca.register_search_callbacks(app)
+        client = app.server.test_client()
+        output = '..search-dropdown.options...search-status.children...debug-dropdown-value.children..'
+
+        for query_type, query in search_queries(universe).items():
+            body = {'output': output,
+                    'outputs': [{'id': 'search-dropdown', 'property': 'options'},
+                                {'id': 'search-status', 'property': 'children'},
+                                {'id': 'debug-dropdown-value', 'property': 'children'}],
+                    'inputs': [{'id': 'search-dropdown', 'property': 'search_value', 'value': query}],
+                    'state': [{'id': 'search-dropdown', 'property': 'options', 'value': []}],
+                    'changedPropIds': ['search-dropdown.search_value']}
+            stats, response = measure(lambda: client.post('/_dash-update-component', json=body), repeat)
+            report({'benchmark': 'ricerca.update_dropdown_options', 'size': n_rows, 'mode': query_type,
+                    'payload_bytes': len(response.get_data()), **stats})
+
+        # Ricerca nel browser: l'universo compresso scaricato una volta al posto delle richieste per tasto
+        app = dash.Dash(__name__, server=Flask(__name__))
+        app.layout = ricerca.get_search_layout()
+        ricerca.register_search_callbacks(app, clientside=True)
+        client = app.server.test_client()
+        stats, response = measure(lambda: client.get(ricerca.SEARCH_UNIVERSE_URL, headers={'Accept-Encoding': 'gzip'}),
+                                  repeat, setup=lambda: ricerca.__dict__.update(_universe_asset=None))
+        report({'benchmark': 'ricerca.universo', 'size': n_rows, 'mode': 'gzip',
+                'payload_bytes': len(response.get_data()), **stats})
+
+
+def compare(results, previous_path):
+    """ Stampa il rapporto tra le mediane attuali e quelle di un file precedente. """
+    with open(previous_path) as f:
+        previous = json.load(f)
+    old = {(r['benchmark'], r['size'], r['mode']): r for r in previous['results']}
+    print(f"\nConfronto con {previous_path} (commit {previous.get('commit')}):")
+    for result in results:
+        before = old.get((result['benchmark'], result['size'], result['mode']))
+        if before is None:
+            continue
+        ratio = result['wall_s_median'] / before['wall_s_median'] if before['wall_s_median'] else float('inf')
+        flag = "⚠️" if ratio > REGRESSION_RATIO else "  "
+        print(f"{flag} {result['benchmark']:<40} {result['size']:>7} {result['mode']:<16} "
+              f"{before['wall_s_median'] * 1000:9.2f} ms -> {result['wall_s_median'] * 1000:9.2f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline con dati sintetici")
+    parser.add_argument('--bars', default=",".join(map(str, DEFAULT_BARS)), help="Lunghezze della storia")
+    parser.add_argument('--universe', default=",".join(map(str, DEFAULT_UNIVERSE)), help="Righe dell'universo")
+    parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni di ogni misura")
+    parser.add_argument('--gap-prob', type=float, default=0.002, help="Probabilità di una barra mancante")
+    parser.add_argument('--skip-weekends', action='store_true', help="Calendario senza fine settimana")
+    parser.add_argument('--output', help="File dei risultati (default: bench_results/<commit>.json)")
+    parser.add_argument('--compare', help="File di un benchmark precedente da confrontare")
+    args = parser.parse_args()
+
+    bars_sizes = [int(n) for n in args.bars.split(",") if n]
+    universe_sizes = [int(n) for n in args.universe.split(",") if n]
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"{git_commit()}.json"))
+    previous = os.path.abspath(args.compare) if args.compare else None
+
+    # Archivio e cache dei lavori in una cartella temporanea, prima di importare i moduli
+    workdir = tempfile.mkdtemp(prefix="quantrea-bench-")
+    os.environ['BAR_STORE_DIR'] = os.path.join(workdir, "bar_store")
+    os.environ['JOBS_CACHE_DIR'] = os.path.join(workdir, "jobs_cache")
+    # Cache condivisa solo in memoria: reset_caches la svuota tra una misura e l'altra
+    os.environ['REDIS_URL'] = "memory://"
+    # La sorgente sintetica non ha limiti di richieste: il pianificatore non deve rallentare le misure
+    os.environ.setdefault('FETCH_RATE', "1000000")
+    os.environ.setdefault('FETCH_BURST', "1000000")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from dati_sintetici import install_synthetic_provider
+    install_synthetic_provider(gap_prob=args.gap_prob, skip_weekends=args.skip_weekends)
+
+    import numpy as np
+    import pandas as pd
+
+    results = []
+
+    def report(result):
+        results.append(result)
+        extra = f"  {result['payload_bytes'] / 1024:8.1f} KB" if 'payload_bytes' in result else ""
+        print(f"{result['benchmark']:<40} {result['size']:>7} {result['mode']:<16} "
+              f"{result['wall_s_median'] * 1000:9.2f} ms  {result['peak_mem_bytes'] / 2 ** 20:8.1f} MB{extra}")
+
+    try:
+        bench_pages(bars_sizes, args.repeat, report)
+        bench_search(universe_sizes, args.repeat, workdir, report)
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({'commit': git_commit(), 'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                   'platform': platform.platform(), 'repeat': args.repeat, 'results': results}, f, indent=1)
+    print(f"✅ Risultati salvati in {output}")
+
+    if previous:
+        compare(results, previous)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from barre_compatte import CompactBars
+
+# Durata di una barra per ciascun intervallo di TradingView (in secondi)
+INTERVAL_SECONDS = {
+    '1': 60, '3': 180, '5': 300, '15': 900, '30': 1800, '45': 2700,
+    '1H': 3600, '2H': 7200, '3H': 10800, '4H': 14400,
+    '1D': 86400, '1W': 7 * 86400, '1M': 30 * 86400,
+}
+
+# Limiti della cache configurabili da ambiente: il budget di memoria vale per ogni processo (worker)
+BAR_CACHE_MAX_MB = float(os.environ.get("BAR_CACHE_MAX_MB", 256))
+BAR_CACHE_MIN_TTL = float(os.environ.get("BAR_CACHE_MIN_TTL", 300))
+BAR_CACHE_MAX_TTL = float(os.environ.get("BAR_CACHE_MAX_TTL", 900))
+
+
+def bar_expiry(last_bar, interval_value, now=None):
+    """ Calcola la scadenza (epoch) di una serie a partire dalla data dell'ultima barra.
+
+    Se la prossima barra non è ancora iniziata la serie resta valida fino ad allora
+    (al massimo BAR_CACHE_MAX_TTL, perché l'ultima barra può essere ancora in formazione);
+    se invece dovrebbe già esistere una barra più recente si ricontrolla dopo BAR_CACHE_MIN_TTL.
+    """
+    now = time.time() if now is None else now
+    period = INTERVAL_SECONDS.get(interval_value, 86400)
+    last_bar = pd.Timestamp(last_bar)
+    if last_bar.tzinfo is not None:
+        last_epoch = last_bar.timestamp()
+    else:
+        # tvDatafeed restituisce orari locali senza fuso
+        last_epoch = time.mktime(last_bar.to_pydatetime().timetuple())
+    next_bar = last_epoch + period
+    if next_bar <= now:
+        return now + BAR_CACHE_MIN_TTL
+    return now + min(next_bar - now, BAR_CACHE_MAX_TTL)
+
+
+class BarCache:
+    """ Cache LRU delle barre OHLCV, condivisa dal processo e limitata in memoria.
+
+    Le chiavi sono coppie (exchange:symbol, intervallo). Le serie sono tenute in forma
+    compatta (CompactBars, float32 dove la precisione lo consente) e ogni voce ricorda
+    quante barre erano state richieste, così le richieste più corte vengono servite
+    tagliando la coda della storia già presente. Oltre il budget si scartano prima le
+    serie scadute e poi quelle usate meno di recente.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = int(BAR_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._entries = OrderedDict()  # chiave -> (barre compatte, n_bars, scadenza, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_compact(self, key, n_bars):
+        """ Restituisce le barre compatte in cache se coprono n_bars barre, oppure None. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= time.time() or entry[1] < n_bars:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, key, n_bars, columns=None):
+        """ Restituisce le ultime n_bars barre in cache (solo le colonne `columns`, se indicate), oppure None. """
+        bars = self.get_compact(key, n_bars)
+        # Il DataFrame avvolge gli array della cache (in sola lettura): chi chiama può aggiungere colonne
+        return None if bars is None else bars.to_frame(n_bars, columns)
+
+    def put(self, key, bars, n_bars, expires_at=None):
+        """ Inserisce una serie (DataFrame o CompactBars); oltre il budget di memoria si scartano le serie fredde. """
+        if bars is None or len(bars) == 0:
+            return
+        if not isinstance(bars, CompactBars):
+            bars = CompactBars.from_frame(bars, *key)
+        if expires_at is None:
+            expires_at = bar_expiry(bars.last_time, key[1])
+        nbytes = bars.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._entries[key] = (bars, n_bars, expires_at, nbytes)
+            self._bytes += nbytes
+            if self._bytes > self.max_bytes:
+                self._evict(key)
+
+    def _evict(self, keep):
+        """ Libera memoria fino a rientrare nel budget: prima le serie scadute, poi le meno usate. """
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if entry[2] <= now and key != keep]:
+            self._bytes -= self._entries.pop(key)[3]
+            self.evictions += 1
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[3]
+            self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """ Statistiche della cache (voci, simboli, byte occupati, hit, miss e scarti). """
+        with self._lock:
+            return {'entries': len(self._entries), 'symbols': len({key[0] for key in self._entries}),
+                    'bytes': self._bytes, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+# Istanza condivisa da tutte le pagine del processo
+bar_cache = BarCache()
@@ -0,0 +1,352 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# URL del server Redis (es. redis://localhost:6379/0); "memory://" usa il sostituto in memoria
+REDIS_URL = os.environ.get("REDIS_URL", "")
+SHARED_CACHE_PREFIX = os.environ.get("SHARED_CACHE_PREFIX", "quantrea:")
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get("LOCAL_CACHE_MAX_ENTRIES", 512))
+# Durata dei risultati delle analisi (le chiavi includono già l'orario dell'ultima barra)
+ANALYTICS_TTL = int(os.environ.get("ANALYTICS_TTL", 86400))
+# Giorni di richieste contati per scegliere i ticker da precaricare (i conteggi più vecchi scadono)
+POPULAR_DAYS = int(os.environ.get("POPULAR_DAYS", 7))
+
+
+class MemoryRedis:
+    """ Sostituto in memoria del client redis (solo i comandi usati qui).
+
+    Serve sia da ripiego locale quando Redis non è configurato o non risponde,
+    sia da stand-in per provare la cache senza un server.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # chiave -> (valore, scadenza)
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def _item(self, key):
+        """ (valore, scadenza) della chiave, None se manca o è scaduta (da chiamare con il lock). """
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._item(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+            self._data.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        with self._lock:
+            item = self._item(key)
+            if item is None:
+                return False
+            self._data[key] = (item[0], time.time() + seconds)
+            return True
+
+    def zincrby(self, key, amount, member):
+        if isinstance(member, str):
+            member = member.encode()
+        with self._lock:
+            item = self._item(key) or ({}, None)
+            self._data[key] = item
+            scores = item[0]
+            scores[member] = scores.get(member, 0) + amount
+            return scores[member]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        with self._lock:
+            item = self._item(key)
+            scores = dict(item[0]) if item is not None else {}
+        ranked = sorted(scores, key=scores.get, reverse=True)[start:None if end == -1 else end + 1]
+        return [(member, float(scores[member])) for member in ranked] if withscores else ranked
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+def pack_bars(frame, n_bars, expires_at):
+    """ Serializza le barre in un blob compatto: intestazione JSON + colonne grezze. """
+    columns = list(frame.columns)
+    header = json.dumps({'length': len(frame), 'columns': columns, 'n_bars': n_bars,
+                         'expires_at': expires_at}).encode()
+    parts = [struct.pack('<I', len(header)), header, frame.index.values.astype('M8[ns]').view('i8').tobytes()]
+    parts.extend(frame[column].to_numpy(dtype='f8').tobytes() for column in columns)
+    return b''.join(parts)
+
+
+def unpack_bars(blob):
+    """ Ricostruisce (frame, n_bars, expires_at) da pack_bars senza copiare le colonne. """
+    header_size = struct.unpack_from('<I', blob)[0]
+    header = json.loads(blob[4:4 + header_size])
+    length, offset = header['length'], 4 + header_size
+    times = np.frombuffer(blob, dtype='i8', count=length, offset=offset)
+    columns = {}
+    for i, column in enumerate(header['columns']):
+        columns[column] = np.frombuffer(blob, dtype='f8', count=length, offset=offset + 8 * length * (i + 1))
+    index = pd.DatetimeIndex(times.view('M8[ns]'), name='datetime')
+    return pd.DataFrame(columns, index=index, copy=False), header['n_bars'], header['expires_at']
+
+
+# Tipi di array salvati come byte grezzi (bool, interi, float, date); il resto diventa una lista JSON
+RAW_KINDS = 'biufmM'
+
+
+def _encode(value, buffers):
+    """ Descrizione JSON di un valore; i dati degli array finiscono in `buffers`. """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating, np.bool_)):
+        return value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, pd.DataFrame):
+        return {'t': 'frame', 'index': _encode(value.index, buffers),
+                'names': [_encode(name, buffers) for name in value.columns],
+                'columns': [_encode(value.iloc[:, i].to_numpy(), buffers) for i in range(value.shape[1])]}
+    if isinstance(value, pd.Series):
+        return {'t': 'series', 'name': _encode(value.name, buffers), 'index': _encode(value.index, buffers),
+                'values': _encode(value.to_numpy(), buffers)}
+    if isinstance(value, pd.Index):
+        return {'t': 'index', 'name': _encode(value.name, buffers), 'values': _encode(value.to_numpy(), buffers)}
+    if isinstance(value, pd.Timestamp):
+        return {'t': 'timestamp', 'value': value.isoformat()}
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in RAW_KINDS:
+            buffers.append(np.ascontiguousarray(value).tobytes())
+            return {'t': 'array', 'dtype': value.dtype.str, 'length': len(value), 'buffer': len(buffers) - 1}
+        return {'t': 'list', 'items': [_encode(item, buffers) for item in value.tolist()]}
+    if isinstance(value, (list, tuple)):
+        return {'t': 'tuple' if isinstance(value, tuple) else 'list', 'items': [_encode(item, buffers) for item in value]}
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {'t': 'dict', 'items': {key: _encode(item, buffers) for key, item in value.items()}}
+    raise TypeError(f"Tipo non salvabile nella cache condivisa: {type(value).__name__}")
+
+
+def _decode(spec, buffers):
+    if not isinstance(spec, dict):
+        return spec
+    kind = spec['t']
+    if kind == 'array':
+        dtype = np.dtype(spec['dtype'])
+        if dtype.kind not in RAW_KINDS:
+            raise ValueError(f"Tipo di array non ammesso: {spec['dtype']}")
+        return np.frombuffer(buffers[spec['buffer']], dtype=dtype, count=spec['length']).copy()
+    if kind in ('list', 'tuple'):
+        items = [_decode(item, buffers) for item in spec['items']]
+        return tuple(items) if kind == 'tuple' else items
+    if kind == 'dict':
+        return {key: _decode(item, buffers) for key, item in spec['items'].items()}
+    if kind == 'timestamp':
+        return pd.Timestamp(spec['value'])
+    if kind == 'index':
+        return pd.Index(_decode(spec['values'], buffers), name=_decode(spec['name'], buffers))
+    if kind == 'series':
+        return pd.Series(_decode(spec['values'], buffers), index=_decode(spec['index'], buffers),
+                         name=_decode(spec['name'], buffers))
+    if kind == 'frame':
+        index = _decode(spec['index'], buffers)
+        names = [_decode(name, buffers) for name in spec['names']]
+        columns = [_decode(column, buffers) for column in spec['columns']]
+        frame = pd.DataFrame(dict(enumerate(columns)), index=index)
+        frame.columns = names
+        return frame
+    raise ValueError(f"Tipo sconosciuto nella cache condivisa: {kind}")
+
+
+def pack_object(value):
+    """ Serializza un risultato di analisi (DataFrame, Series, array, numeri, stringhe, liste, tuple, dict)
+    senza pickle: intestazione JSON + array grezzi, compressi. Da Redis si leggono solo dati, mai codice. """
+    buffers = []
+    header = json.dumps(_encode(value, buffers)).encode()
+    sizes = [len(buffer) for buffer in buffers]
+    prefix = struct.pack('<II', len(header), len(sizes)) + struct.pack(f'<{len(sizes)}Q', *sizes)
+    return zlib.compress(b''.join([prefix, header, *buffers]), 1)
+
+
+def unpack_object(blob):
+    """ Ricostruisce un valore salvato con pack_object. """
+    data = zlib.decompress(blob)
+    header_size, n_buffers = struct.unpack_from('<II', data)
+    sizes = struct.unpack_from(f'<{n_buffers}Q', data, 8)
+    offset = 8 + 8 * n_buffers
+    spec = json.loads(data[offset:offset + header_size])
+    offset += header_size
+    buffers = []
+    for size in sizes:
+        buffers.append(data[offset:offset + size])
+        offset += size
+    return _decode(spec, buffers)
+
+
+class SharedCache:
+    """ Cache condivisa tra i worker gunicorn, appoggiata su Redis quando disponibile.
+
+    Contiene le barre (formato compatto di pack_bars) e i risultati delle analisi
+    (pack_object: solo dati, niente pickle). Se Redis non è configurato, o smette di rispondere, si ripiega
+    su una MemoryRedis locale al processo. Gli errori di Redis contano come miss.
+    """
+
+    def __init__(self, url=None, client=None, prefix=SHARED_CACHE_PREFIX):
+        self.url = REDIS_URL if url is None else url
+        self.prefix = prefix
+        self._client = client
+        self._fallback = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def client(self):
+        """ Client creato al primo uso, così l'import non apre connessioni. """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._connect()
+        return self._client
+
+    def _connect(self):
+        if self.url.startswith("memory://"):
+            return MemoryRedis()
+        if self.url:
+            try:
+                import redis
+                client = redis.Redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+                client.ping()
+                return client
+            except Exception as e:
+                print(f"Redis non disponibile, uso la cache locale: {str(e)}")
+        self._fallback = True
+        return MemoryRedis(max_entries=LOCAL_CACHE_MAX_ENTRIES)
+
+    @property
+    def is_shared(self):
+        """ False quando si sta usando il ripiego locale al posto di Redis. """
+        self.client
+        return not self._fallback
+
+    def _get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Errore nella lettura dalla cache condivisa: {str(e)}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _set(self, key, value, ttl):
+        try:
+            self.client.set(self.prefix + key, value, ex=max(int(ttl), 1))
+        except Exception as e:
+            self.errors += 1
+            print(f"Errore nella scrittura sulla cache condivisa: {str(e)}")
+
+    def get_bars(self, key):
+        """ Restituisce (frame, n_bars, expires_at) per la chiave (exchange:symbol, intervallo), oppure None. """
+        blob = self._get(f"bars:{key[0]}:{key[1]}")
+        return None if blob is None else unpack_bars(blob)
+
+    def set_bars(self, key, frame, n_bars, expires_at):
+        self._set(f"bars:{key[0]}:{key[1]}", pack_bars(frame, n_bars, expires_at), expires_at - time.time())
+
+    def get_object(self, key):
+        """ Restituisce un risultato di analisi salvato con set_object, oppure None (anche se illeggibile). """
+        blob = self._get(key)
+        if blob is None:
+            return None
+        try:
+            return unpack_object(blob)
+        except Exception as e:
+            self.errors += 1
+            print(f"Errore nella lettura dalla cache condivisa: {str(e)}")
+            return None
+
+    def set_object(self, key, value, ttl=ANALYTICS_TTL):
+        try:
+            blob = pack_object(value)
+        except TypeError as e:
+            print(f"Errore nella scrittura sulla cache condivisa: {str(e)}")
+            return
+        self._set(key, blob, ttl)
+
+    def _popular_key(self, days_ago=0):
+        day = time.strftime("%Y-%m-%d", time.gmtime(time.time() - days_ago * 86400))
+        return f"{self.prefix}popular:{day}"
+
+    def record_request(self, ticker):
+        """ Conta una richiesta interattiva del ticker (per scegliere cosa precaricare).
+
+        Un conteggio per giorno, che scade dopo POPULAR_DAYS giorni: i ticker non più
+        richiesti escono dalla classifica da soli.
+        """
+        key = self._popular_key()
+        try:
+            self.client.zincrby(key, 1, ticker)
+            self.client.expire(key, POPULAR_DAYS * 86400)
+        except Exception as e:
+            self.errors += 1
+            print(f"Errore nella scrittura sulla cache condivisa: {str(e)}")
+
+    def top_requested(self, n):
+        """ I ticker più richiesti negli ultimi POPULAR_DAYS giorni, dal più popolare. """
+        if n <= 0:
+            return []
+        totals = {}
+        try:
+            for days_ago in range(POPULAR_DAYS):
+                for ticker, count in self.client.zrevrange(self._popular_key(days_ago), 0, -1, withscores=True):
+                    ticker = ticker.decode() if isinstance(ticker, bytes) else ticker
+                    totals[ticker] = totals.get(ticker, 0) + count
+        except Exception as e:
+            self.errors += 1
+            print(f"Errore nella lettura dalla cache condivisa: {str(e)}")
+            return []
+        return sorted(totals, key=totals.get, reverse=True)[:n]
+
+    def stats(self):
+        """ Contatori di hit/miss ed errori della cache condivisa. """
+        if self._fallback:
+            backend = 'local'
+        else:
+            backend = 'memory' if isinstance(self.client, MemoryRedis) else 'redis'
+        return {'backend': backend, 'hits': self.hits,
+                'misses': self.misses, 'errors': self.errors}
+
+
+# Istanza condivisa da tutti i moduli
+shared_cache = SharedCache()
+
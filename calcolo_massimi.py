@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+
+def year_starts(index):
+    """ Posizioni della prima barra di ogni anno solare in un DatetimeIndex ordinato. """
+    years = np.asarray(index.year)
+    if len(years) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+
+
+def new_high_kernel(close, starts):
+    """ Nuovi massimi dell'anno solare su un array di chiusure, in un solo passaggio per anno.
+
+    `close` è un array 1-D (una serie) o 2-D (simboli x barre, allineati sulle stesse date,
+    con NaN dove un simbolo non ha la barra); `starts` sono gli indici di inizio anno.
+    Una barra è un nuovo massimo se chiude sopra tutte le chiusure precedenti dello stesso
+    anno: la prima barra valida dell'anno non lo è mai.
+
+    Restituisce, sempre in forma 2-D:
+    - is_new_high (simboli x barre, bool) e new_high_count (conteggio progressivo nell'anno);
+    - number_of_new_highs, first_close e last_close (simboli x anni).
+    """
+    close = np.atleast_2d(np.asarray(close, dtype='f8'))
+    n_symbols, n_bars = close.shape
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.append(starts[1:], n_bars)
+    n_years = len(starts)
+
+    valid = ~np.isnan(close)
+    filled = np.where(valid, close, -np.inf)
+
+    # Uscite preallocate
+    running_max = np.empty_like(filled)
+    is_new_high = np.empty((n_symbols, n_bars), dtype=bool)
+    new_high_count = np.empty((n_symbols, n_bars), dtype=np.int64)
+    number_of_new_highs = np.zeros((n_symbols, n_years), dtype=np.int64)
+    first_close = np.full((n_symbols, n_years), np.nan)
+    last_close = np.full((n_symbols, n_years), np.nan)
+    rows = np.arange(n_symbols)
+
+    for year, (start, end) in enumerate(zip(starts, ends)):
+        segment = filled[:, start:end]
+        np.maximum.accumulate(segment, axis=1, out=running_max[:, start:end])
+
+        # Massimo fino alla barra precedente (-inf se non c'è ancora una chiusura valida nell'anno)
+        previous_max = np.empty_like(segment)
+        previous_max[:, 0] = -np.inf
+        previous_max[:, 1:] = running_max[:, start:end - 1]
+        np.logical_and(segment > previous_max, previous_max > -np.inf, out=is_new_high[:, start:end])
+        np.cumsum(is_new_high[:, start:end], axis=1, out=new_high_count[:, start:end])
+        number_of_new_highs[:, year] = new_high_count[:, end - 1]
+
+        # Prima e ultima chiusura valida dell'anno
+        segment_valid = valid[:, start:end]
+        has_valid = segment_valid.any(axis=1)
+        first = segment_valid.argmax(axis=1)
+        last = segment_valid.shape[1] - 1 - segment_valid[:, ::-1].argmax(axis=1)
+        first_close[has_valid, year] = close[rows[has_valid], start + first[has_valid]]
+        last_close[has_valid, year] = close[rows[has_valid], start + last[has_valid]]
+
+    return is_new_high, new_high_count, number_of_new_highs, first_close, last_close
+
+
+def new_highs_batch(closes):
+    """ Versione per molti simboli: `closes` è un DataFrame date x simboli.
+
+    Restituisce due DataFrame anni x simboli: numero di nuovi massimi e rendimento
+    dell'anno in percentuale (dalla prima all'ultima chiusura).
+    """
+    closes = closes.sort_index()
+    starts = year_starts(closes.index)
+    _, _, number_of_new_highs, first_close, last_close = new_high_kernel(closes.to_numpy(dtype='f8').T, starts)
+    years = pd.Index(closes.index.year[starts], name='year')
+    new_highs = pd.DataFrame(number_of_new_highs.T, index=years, columns=closes.columns)
+    yearly_return_pct = pd.DataFrame(100.0 * (last_close / first_close - 1).T, index=years, columns=closes.columns)
+    return new_highs, yearly_return_pct
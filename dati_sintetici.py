@@ -0,0 +1,194 @@
+import enum
+import sys
+import threading
+import time
+import types
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Lunghezza della storia generata per ogni simbolo: ogni richiesta ne restituisce la coda,
+# così richieste di lunghezze diverse vedono la stessa serie (come su TradingView).
+# Con il calendario di 7 giorni 120000 barre giornaliere partono dal 1693 (limite di pandas: 1677)
+SYNTHETIC_MAX_BARS = 120000
+
+# Festività fisse (mese, giorno) tolte dal calendario giornaliero
+HOLIDAYS = ((1, 1), (5, 1), (7, 4), (12, 25), (12, 26))
+
+# Durata di una barra per intervallo (valori di tvDatafeed.Interval)
+BAR_SECONDS = {
+    "1": 60, "3": 180, "5": 300, "15": 900, "30": 1800, "45": 2700,
+    "1H": 3600, "2H": 7200, "3H": 10800, "4H": 14400,
+    "1D": 86400, "1W": 7 * 86400, "1M": 30 * 86400,
+}
+
+EXCHANGES = ['NASDAQ', 'NYSE', 'AMEX', 'MIL', 'XETR', 'LSE', 'TSX', 'ASX', 'BINANCE', 'EURONEXT']
+NAME_WORDS = ['Alpha', 'Beta', 'Global', 'Capital', 'Energy', 'Bio', 'Tech', 'Pharma', 'Solar', 'Green',
+              'Mining', 'Gold', 'Silver', 'Digital', 'Systems', 'Networks', 'Motors', 'Foods', 'Retail',
+              'Finance', 'Bank', 'Insurance', 'Realty', 'Logistics', 'Health', 'Medical', 'Water', 'Steel',
+              'Aero', 'Marine', 'Quantum', 'Data', 'Cloud', 'Media', 'Games', 'Textile', 'Chemicals']
+NAME_SUFFIXES = ['Inc', 'Corp', 'Holdings', 'Group', 'S.p.A.', 'AG', 'PLC', 'Ltd', 'ETF', 'Trust']
+
+
+def _seed(*parts):
+    return zlib.crc32(":".join(map(str, parts)).encode())
+
+
+def synthetic_history(symbol, interval_value="1D", n_bars=SYNTHETIC_MAX_BARS, end=None,
+                      gap_prob=0.002, holidays=HOLIDAYS, skip_weekends=False):
+    """ Serie OHLCV deterministica: passeggiata aleatoria lognormale che termina a `end`.
+
+    Per gli intervalli giornalieri il calendario salta le festività `holidays` e, se
+    richiesto, i fine settimana; con probabilità gap_prob una barra manca del tutto
+    (buco nei dati) e l'apertura può staccarsi dalla chiusura precedente (gap di prezzo).
+    Gli stessi argomenti producono sempre la stessa serie.
+    """
+    step = BAR_SECONDS.get(interval_value, 86400)
+    daily = step >= 86400
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now().normalize()
+    if daily:
+        end = end.normalize()
+    rng = np.random.default_rng(_seed(symbol, interval_value))
+
+    # Istanti candidati (a ritroso da end) da cui togliere festività, fine settimana e buchi
+    n_candidates = int(n_bars * (1.6 if daily and skip_weekends else 1.1)) + 10
+    offsets = np.arange(n_candidates - 1, -1, -1, dtype=np.int64) * step
+    index = pd.DatetimeIndex(end.value - offsets * 1_000_000_000)
+    keep = rng.random(n_candidates) >= gap_prob
+    if daily and step == 86400:
+        if holidays:
+            month_day = index.month * 100 + index.day
+            keep &= ~np.isin(month_day, [m * 100 + d for m, d in holidays])
+        if skip_weekends:
+            keep &= index.dayofweek < 5
+    index = index[keep][-n_bars:]
+    n = len(index)
+
+    # Rendimenti giornalieri con volatilità che cambia a regimi e qualche salto in apertura
+    volatility = 0.01 * np.exp(np.repeat(rng.normal(0, 0.4, n // 250 + 1), 250)[:n])
+    gaps = np.where(rng.random(n) < 0.01, rng.normal(0, 3 * 0.01, n), 0.0)
+    intraday = rng.normal(0.0002, 1.0, n) * volatility
+    close = 100.0 * np.exp(np.cumsum(gaps + intraday))
+    open_ = np.empty(n)
+    open_[0] = close[0] / np.exp(intraday[0])
+    open_[1:] = close[:-1] * np.exp(gaps[1:])
+    spread = np.abs(rng.normal(0, 0.5, n)) * volatility
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = np.round(rng.lognormal(12, 1, n))
+
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                        index=pd.DatetimeIndex(index, name='datetime'))
+
+
+def synthetic_universe(n_rows, seed=0):
+    """ Universo di n_rows ticker fittizi (colonne Ticker, Descrizione, Exchange) come all_tickers.csv. """
+    rng = np.random.default_rng(seed)
+    # Ticker unici: numeri distinti scritti in base 26 (da 1 a 5 lettere)
+    codes = rng.choice(26 ** 5 - 1, size=n_rows, replace=False) + 1
+    letters = []
+    while codes.any():
+        letters.append(np.where(codes > 0, np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))[codes % 26], ''))
+        codes = codes // 26
+    tickers = pd.Series(letters[0])
+    for column in letters[1:]:
+        tickers = pd.Series(column) + tickers
+
+    words = np.array(NAME_WORDS)
+    first = pd.Series(words[rng.integers(0, len(words), n_rows)])
+    second = pd.Series(words[rng.integers(0, len(words), n_rows)])
+    suffix = pd.Series(np.array(NAME_SUFFIXES)[rng.integers(0, len(NAME_SUFFIXES), n_rows)])
+    descriptions = first + " " + second + " " + suffix
+    exchanges = pd.Series(np.array(EXCHANGES)[rng.integers(0, len(EXCHANGES), n_rows)])
+    return pd.DataFrame({'Ticker': tickers, 'Descrizione': descriptions, 'Exchange': exchanges})
+
+
+class SyntheticTvDatafeed:
+    """ Sostituto offline di TvDatafeed: stessa get_hist, barre da synthetic_history.
+
+    DELAY simula la latenza di rete di ogni chiamata; END fissa l'ultima barra (default: oggi).
+    Le storie generate restano in memoria (per classe) per non rigenerarle a ogni chiamata.
+    """
+
+    DELAY = 0.0
+    END = None
+    GAP_PROB = 0.002
+    HOLIDAYS = HOLIDAYS
+    SKIP_WEEKENDS = False
+    MAX_SERIES = 256
+
+    _histories = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, username=None, password=None):
+        self.token = "synthetic_token"
+        self.calls = 0
+
+    def _history(self, exchange, symbol, interval_value):
+        key = (exchange, symbol, interval_value)
+        with self._lock:
+            if key in self._histories:
+                self._histories.move_to_end(key)
+                return self._histories[key]
+        history = synthetic_history(f"{exchange}:{symbol}", interval_value, end=self.END,
+                                    gap_prob=self.GAP_PROB, holidays=self.HOLIDAYS,
+                                    skip_weekends=self.SKIP_WEEKENDS)
+        with self._lock:
+            self._histories[key] = history
+            while len(self._histories) > self.MAX_SERIES:
+                self._histories.popitem(last=False)
+        return history
+
+    def get_hist(self, symbol, exchange="NSE", interval=None, n_bars=10, fut_contract=None, extended_session=False):
+        self.calls += 1
+        if self.DELAY:
+            time.sleep(self.DELAY)
+        interval_value = getattr(interval, 'value', interval) or "1D"
+        bars = self._history(exchange, symbol, interval_value).iloc[-n_bars:].copy()
+        bars.insert(0, 'symbol', f"{exchange}:{symbol}")
+        return bars
+
+
+class Interval(enum.Enum):
+    """ Copia di tvDatafeed.Interval, usata solo se il pacchetto non è installato. """
+    in_1_minute = "1"
+    in_3_minute = "3"
+    in_5_minute = "5"
+    in_15_minute = "15"
+    in_30_minute = "30"
+    in_45_minute = "45"
+    in_1_hour = "1H"
+    in_2_hour = "2H"
+    in_3_hour = "3H"
+    in_4_hour = "4H"
+    in_daily = "1D"
+    in_weekly = "1W"
+    in_monthly = "1M"
+
+
+def install_synthetic_provider(**options):
+    """ Sostituisce TvDatafeed con SyntheticTvDatafeed per tutto il processo.
+
+    Va chiamata prima di aprire sessioni (il pool importa TvDatafeed solo al primo
+    collegamento). Se tvDatafeed non è installato viene registrato un modulo con
+    Interval e il sostituto, così le pagine si importano anche offline.
+    options: DELAY, END, GAP_PROB, HOLIDAYS, SKIP_WEEKENDS.
+    """
+    provider = type('SyntheticTvDatafeed', (SyntheticTvDatafeed,), {k.upper(): v for k, v in options.items()})
+    with SyntheticTvDatafeed._lock:
+        SyntheticTvDatafeed._histories.clear()
+    try:
+        import tvDatafeed
+    except ImportError:
+        tvDatafeed = types.ModuleType('tvDatafeed')
+        tvDatafeed.Interval = Interval
+        sys.modules['tvDatafeed'] = tvDatafeed
+    tvDatafeed.TvDatafeed = provider
+
+    # Sessioni già aperte dal pool (se importato) sono del fornitore precedente
+    pool_module = sys.modules.get('pool_tv')
+    if pool_module is not None:
+        pool_module.tv_pool.reset()
+    return provider
@@ -0,0 +1,309 @@
+import os
+import time
+
+from tvDatafeed import Interval
+
+from archivio_barre import bar_store
+from barre_compatte import CompactBars
+from cache_barre import bar_cache, bar_expiry
+from cache_condivisa import shared_cache
+from fornitori import bars_since, get_provider, split_ticker
+from metriche import inc
+from single_flight import SingleFlight
+
+# Tolleranza sul confronto delle barre già salvate (oltre: storia rettificata, es. split)
+ADJUSTMENT_TOLERANCE = 1e-6
+
+# Modalità live: la coda si riscarica se l'archivio è più vecchio di tanti secondi
+LIVE_MAX_AGE = float(os.environ.get("LIVE_MAX_AGE", 5))
+
+# Politiche di caricamento delle pagine (load_bars): attendere la sorgente se la serie è scaduta,
+# servire subito quella salvata (stale-while-revalidate), riconvalidarla, oppure la coda live
+FRESH = 'fresca'
+STALE_OK = 'scaduta'
+REVALIDATE = 'riconvalida'
+LIVE = 'live'
+
+# Caricamenti in corso, uno per (exchange:symbol, intervallo)
+fetch_flight = SingleFlight()
+
+
+def series_key(ticker, interval):
+    """ Chiave della serie nelle cache e nell'archivio: ("EXCHANGE:SYMBOL", intervallo). """
+    exchange, symbol = split_ticker(ticker)
+    return f"{exchange}:{symbol}", interval.value
+
+
+def _is_adjusted(stored, tail):
+    """ True se la barra penultima salvata non coincide più con quella scaricata. """
+    if len(stored) < 2:
+        return False
+    previous = stored.index[-2]
+    if previous not in tail.index:
+        return False
+    old_close = stored['close'].iloc[-2]
+    new_close = tail.at[previous, 'close']
+    return abs(new_close - old_close) > ADJUSTMENT_TOLERANCE * max(abs(old_close), 1.0)
+
+
+def _is_fresh(stored, meta, interval, max_age=None):
+    """ True se la serie salvata non è ancora scaduta (con max_age: aggiornata da meno di max_age secondi). """
+    if max_age is not None:
+        return time.time() - meta['fetched_at'] < max_age
+    return bar_expiry(stored.index[-1], interval.value, now=meta['fetched_at']) > time.time()
+
+
+def _read_store(key, interval, n_bars, max_age=None):
+    """ Serie salvata, metadati e barre della coda da scaricare:
+    0 se la serie è ancora fresca, None se va scaricata la storia intera.
+    Con max_age la serie è fresca solo se aggiornata da meno di max_age secondi.
+    """
+    stored, meta = bar_store.read(key)
+    covers_request = stored is not None and (len(stored) >= n_bars or meta['length'] < meta['n_bars'])
+    if not covers_request:
+        inc('quant_cache_requests_total', cache='archivio', result='miss')
+        return stored, meta, None
+    # Serie ancora fresca: nessuna chiamata alla sorgente
+    if _is_fresh(stored, meta, interval, max_age):
+        inc('quant_cache_requests_total', cache='archivio', result='hit')
+        return stored, meta, 0
+    inc('quant_cache_requests_total', cache='archivio', result='coda')
+    return stored, meta, min(bars_since(stored.index[-1], interval), n_bars)
+
+
+def _merge_tail(key, stored, tail):
+    """ Accoda all'archivio la coda scaricata; None se non si aggancia o la storia è stata rettificata. """
+    if tail is None:
+        return stored
+    if tail.index[0] <= stored.index[-1] and not _is_adjusted(stored, tail):
+        bar_store.append(key, tail)
+        stored, _ = bar_store.read(key)
+        return stored
+    return None
+
+
+def _history_size(n_bars, meta):
+    return max(n_bars, meta['n_bars'] if meta else 0)
+
+
+def _save_history(key, stored, bars, n_bars):
+    """ Riscrive la serie con la storia intera scaricata (se il download fallisce resta quella salvata). """
+    if bars is None:
+        return stored
+    bar_store.write(key, bars, n_bars)
+    stored, _ = bar_store.read(key)
+    return stored
+
+
+def _load_or_fetch(key, interval, n_bars, max_age=None):
+    """ Legge la serie dall'archivio su disco e scarica solo la coda mancante. """
+    provider = get_provider()
+    stored, meta, n_tail = _read_store(key, interval, n_bars, max_age)
+    if n_tail == 0:
+        return stored
+    if n_tail is not None:
+        merged = _merge_tail(key, stored, provider.get_history(key[0], interval, n_tail))
+        if merged is not None:
+            return merged
+    size = _history_size(n_bars, meta)
+    return _save_history(key, stored, provider.get_history(key[0], interval, size), size)
+
+
+def get_bars(ticker, n_bars, interval=Interval.in_daily, columns=None):
+    """ Restituisce le ultime n_bars barre del ticker, passando dalla cache condivisa.
+
+    Le pagine chiedono lunghezze diverse della stessa storia: una richiesta più corta
+    di una già in cache viene servita tagliando la serie, senza tornare alla sorgente.
+    Sotto la cache in memoria ci sono la cache condivisa tra i worker (Redis) e l'archivio
+    su disco, che sopravvive ai riavvii e viene aggiornato scaricando solo le barre
+    successive all'ultima salvata.
+
+    Le barre arrivano dalla cache in forma compatta (float32 dove la precisione lo consente,
+    array in sola lettura): con `columns` si materializzano solo le colonne indicate.
+    """
+    key = series_key(ticker, interval)
+
+    bars = bar_cache.get(key, n_bars, columns)
+    inc('quant_cache_requests_total', cache='barre_memoria', result='miss' if bars is None else 'hit')
+    if bars is not None:
+        return bars
+    return _get_loaded(key, interval, n_bars, columns)
+
+
+def _get_loaded(key, interval, n_bars, columns=None):
+    """ get_bars dopo la cache in memoria: un solo caricamento per serie anche con richieste concorrenti. """
+    # Le richieste concorrenti per la stessa serie aspettano un solo caricamento;
+    # se quello in corso era più corto del necessario se ne avvia un altro
+    while True:
+        loaded = fetch_flight.do(key, _load, key, interval, n_bars)
+        if loaded is None:
+            return None
+        bars, covered = loaded
+        if covered >= n_bars:
+            return bars.to_frame(n_bars, columns)
+
+
+def get_stale_bars(ticker, n_bars, interval=Interval.in_daily, columns=None):
+    """ Stale-while-revalidate: (barre, scadute) senza attendere la sorgente se l'archivio ha già la serie.
+
+    Una serie scaduta viene restituita così com'è, senza metterla in cache: chi la mostra
+    la segnala come non aggiornata e la riconvalida poi con revalidate_bars. Le serie
+    fresche passano dalle cache come in get_bars, quelle assenti vengono scaricate.
+    """
+    key = series_key(ticker, interval)
+    bars = bar_cache.get(key, n_bars, columns)
+    inc('quant_cache_requests_total', cache='barre_memoria', result='miss' if bars is None else 'hit')
+    if bars is not None:
+        return bars, False
+    shared = _get_shared(key, n_bars)
+    if shared is not None:
+        return shared[0].to_frame(n_bars, columns), False
+    stored, _, n_tail = _read_store(key, interval, n_bars)
+    if n_tail:
+        return _stale_frame(key, stored, n_bars, columns), True
+    return _get_loaded(key, interval, n_bars, columns), False
+
+
+def revalidate_bars(ticker, n_bars, interval=Interval.in_daily, columns=None):
+    """ Aggiorna dalla sorgente una serie servita scaduta: (barre, scadute).
+
+    Stale-if-error: se la sorgente fallisce o non restituisce barre nuove si continua a
+    servire la serie salvata, ancora segnalata come scaduta.
+    """
+    key = series_key(ticker, interval)
+    try:
+        bars = get_bars(ticker, n_bars, interval, columns)
+    except Exception as e:
+        print(f"Errore nell'aggiornamento di {ticker}, restano le barre salvate: {str(e)}")
+        bars = None
+    stored, meta = bar_store.read(key)
+    if stored is None or stored.empty:
+        return bars, False
+    # Barre più recenti dell'archivio locale: arrivate fresche dalla cache condivisa
+    if bars is not None and (_is_fresh(stored, meta, interval) or bars.index[-1] > stored.index[-1]):
+        return bars, False
+    return _stale_frame(key, stored, n_bars, columns), True
+
+
+def _stale_frame(key, stored, n_bars, columns=None):
+    """ Ultime n_bars barre salvate, compattate come quelle della cache (stessi valori, stessa memoizzazione delle analisi). """
+    return CompactBars.from_frame(stored.iloc[-n_bars:], *key).to_frame(columns=columns)
+
+
+def load_bars(ticker, n_bars, interval=Interval.in_daily, columns=None, policy=FRESH):
+    """ Barre del ticker con la politica di caricamento `policy`: (barre, scadute). """
+    if policy == STALE_OK:
+        return get_stale_bars(ticker, n_bars, interval, columns)
+    if policy == REVALIDATE:
+        return revalidate_bars(ticker, n_bars, interval, columns)
+    if policy == LIVE:
+        return get_live_bars(ticker, n_bars, interval, columns=columns), False
+    return get_bars(ticker, n_bars, interval, columns), False
+
+
+def get_live_bars(ticker, n_bars, interval, max_age=LIVE_MAX_AGE, columns=None):
+    """ Come get_bars ma per la modalità live: senza aspettare la scadenza delle cache
+    scarica le barre successive all'ultima salvata, se l'archivio non è stato aggiornato
+    negli ultimi max_age secondi (più client che interrogano la stessa serie fanno una sola richiesta).
+    """
+    key = series_key(ticker, interval)
+    bars = fetch_flight.do(('live',) + key, _load_or_fetch, key, interval, n_bars, max_age)
+    if bars is None or bars.empty:
+        return None
+    bars, _ = _publish(key, bars, n_bars, interval)
+    return bars.to_frame(n_bars, columns)
+
+
+def get_bars_many(tickers, n_bars, interval=Interval.in_daily, columns=None):
+    """ Come get_bars per una lista di ticker: dict ticker -> ultime n_bars barre (senza i ticker senza dati).
+
+    Le serie che non sono in cache né fresche nell'archivio vengono scaricate con al più
+    due richieste in blocco alla sorgente (le code da accodare e le storie intere),
+    invece di una richiesta per ticker.
+    """
+    provider = get_provider()
+    results, pending = {}, {}
+    for ticker in dict.fromkeys(tickers):
+        key = series_key(ticker, interval)
+        bars = bar_cache.get(key, n_bars, columns)
+        inc('quant_cache_requests_total', cache='barre_memoria', result='miss' if bars is None else 'hit')
+        if bars is None:
+            shared = _get_shared(key, n_bars)
+            bars = shared[0].to_frame(n_bars, columns) if shared is not None else None
+        if bars is not None:
+            results[ticker] = bars
+        else:
+            pending[ticker] = key
+
+    loaded, tails, full = {}, {}, {}
+    for ticker, key in pending.items():
+        stored, meta, n_tail = _read_store(key, interval, n_bars)
+        if n_tail == 0:
+            loaded[ticker] = stored
+        elif n_tail is None:
+            full[ticker] = (stored, meta)
+        else:
+            tails[ticker] = (stored, meta, n_tail)
+
+    if tails:
+        n_tail = max(n_tail for _, _, n_tail in tails.values())
+        fetched = provider.get_history_many([pending[t][0] for t in tails], interval, n_bars=n_tail)
+        for ticker, (stored, meta, _) in tails.items():
+            merged = _merge_tail(pending[ticker], stored, fetched.get(pending[ticker][0]))
+            if merged is not None:
+                loaded[ticker] = merged
+            else:
+                full[ticker] = (stored, meta)
+
+    if full:
+        size = max(_history_size(n_bars, meta) for _, meta in full.values())
+        fetched = provider.get_history_many([pending[t][0] for t in full], interval, n_bars=size)
+        for ticker, (stored, _) in full.items():
+            loaded[ticker] = _save_history(pending[ticker], stored, fetched.get(pending[ticker][0]), size)
+
+    for ticker, bars in loaded.items():
+        if bars is not None and not bars.empty:
+            bars, _ = _publish(pending[ticker], bars, n_bars, interval)
+            results[ticker] = bars.to_frame(n_bars, columns)
+    return {ticker: results[ticker] for ticker in dict.fromkeys(tickers) if ticker in results}
+
+
+def _get_shared(key, n_bars):
+    """ Serie compatta dalla cache condivisa tra i worker e barre coperte, se copre la richiesta ed è ancora valida. """
+    # Solo con un Redis reale: in locale basterebbe la cache in memoria
+    if not shared_cache.is_shared:
+        return None
+    shared = shared_cache.get_bars(key)
+    if shared is not None:
+        bars, covered, expires_at = shared
+        if covered >= n_bars and expires_at > time.time():
+            inc('quant_cache_requests_total', cache='barre_condivisa', result='hit')
+            bars = CompactBars.from_frame(bars, *key)
+            bar_cache.put(key, bars, covered, expires_at)
+            return bars, covered
+    inc('quant_cache_requests_total', cache='barre_condivisa', result='miss')
+    return None
+
+
+def _publish(key, bars, n_bars, interval):
+    """ Mette la serie caricata nella cache in memoria e in quella condivisa;
+    restituisce la serie compatta e le barre coperte. """
+    covered = max(n_bars, len(bars))
+    compact = CompactBars.from_frame(bars, *key)
+    bar_cache.put(key, compact, covered)
+    if shared_cache.is_shared:
+        shared_cache.set_bars(key, bars, covered, bar_expiry(bars.index[-1], interval.value))
+    return compact, covered
+
+
+def _load(key, interval, n_bars):
+    """ Carica la serie dalla cache condivisa, dall'archivio o dalla sorgente e la mette in cache:
+    restituisce (barre compatte, barre coperte) oppure None. """
+    shared = _get_shared(key, n_bars)
+    if shared is not None:
+        return shared
+
+    bars = _load_or_fetch(key, interval, n_bars)
+    if bars is None or bars.empty:
+        return None
+    return _publish(key, bars, n_bars, interval)
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+# Punti massimi inviati al browser per ogni traccia
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", 2000))
+# Punti massimi di una traccia zoomata: oltre questa soglia anche la finestra visibile viene ridotta
+CHART_ZOOM_MAX_POINTS = int(os.environ.get("CHART_ZOOM_MAX_POINTS", 50000))
+
+
+def lttb_indices(x, y, n_out):
+    """ Indici dei punti scelti dall'algoritmo Largest-Triangle-Three-Buckets.
+
+    Adatto alle linee: conserva la forma della serie (picchi compresi) con n_out punti.
+    x e y devono essere numerici e senza NaN.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='f8')
+    y = np.asarray(y, dtype='f8')
+    # Il primo e l'ultimo punto restano fissi, gli altri sono divisi in n_out - 2 secchi
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # Medie di ogni secchio calcolate in blocco; per l'ultimo secchio si usa l'ultimo punto
+    avg_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    px, py = x[0], y[0]
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = avg_x[i + 1], avg_y[i + 1]
+        # Area del triangolo (a meno di un fattore 2) tra punto precedente, candidato e media successiva
+        areas = np.abs((px - ax) * (y[start:end] - py) - (px - x[start:end]) * (ay - py))
+        best = start + int(areas.argmax())
+        selected[i + 1] = best
+        px, py = x[best], y[best]
+    return selected
+
+
+def minmax_indices(y, n_buckets):
+    """ Indici del minimo e del massimo di ogni secchio, in ordine temporale.
+
+    Adatto alle barre: nessun picco o crollo sparisce dal grafico. Restituisce al più
+    2 * n_buckets indici; i NaN vengono ignorati.
+    """
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype='f8')
+    size = -(-n // n_buckets)
+    padded = np.full(size * n_buckets, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+    valid = ~np.isnan(padded).all(axis=1)
+
+    offsets = np.arange(n_buckets) * size
+    low = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1) + offsets
+    high = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1) + offsets
+    return np.unique(np.concatenate([low[valid], high[valid]]))
+
+
+def decimate(x, y, kind, max_points=CHART_MAX_POINTS):
+    """ Riduce una traccia a circa max_points punti: LTTB per le linee, min/max per le barre.
+
+    x è un DatetimeIndex (o un array), y una Series o un array; restituisce (x, y) ridotti.
+    """
+    y_values = np.asarray(y, dtype='f8')
+    valid = np.flatnonzero(~np.isnan(y_values))
+    if len(valid) <= max_points:
+        return x[valid], y_values[valid]
+    if kind == 'bar':
+        chosen = valid[minmax_indices(y_values[valid], max_points // 2)]
+    else:
+        x_numeric = np.asarray(x[valid].asi8 if hasattr(x, 'asi8') else x[valid], dtype='f8')
+        chosen = valid[lttb_indices(x_numeric, y_values[valid], max_points)]
+    return x[chosen], y_values[chosen]
@@ -0,0 +1,227 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from archivio_barre import BAR_COLUMNS
+from cache_barre import INTERVAL_SECONDS
+from metriche import observe
+from pianificatore import current_priority, fetch_priority, fetch_scheduler
+
+# Sorgente delle barre: "tradingview" (default), "yfinance" o "local"
+DATA_PROVIDER = os.environ.get("DATA_PROVIDER", "tradingview")
+# Cartella dei file della sorgente locale: <EXCHANGE>_<SYMBOL>_<intervallo>.csv (o .parquet)
+LOCAL_BARS_DIR = os.environ.get("LOCAL_BARS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_bars"))
+
+# Suffissi di Yahoo Finance per gli exchange di TradingView (assenti = nessun suffisso)
+YAHOO_SUFFIXES = {'MIL': '.MI', 'XETR': '.DE', 'FWB': '.F', 'LSE': '.L', 'EURONEXT': '.PA', 'BME': '.MC',
+                  'SIX': '.SW', 'TSX': '.TO', 'ASX': '.AX', 'TSE': '.T', 'HKEX': '.HK'}
+YAHOO_INTERVALS = {'1': '1m', '5': '5m', '15': '15m', '30': '30m', '1H': '1h',
+                   '1D': '1d', '1W': '1wk', '1M': '1mo'}
+# Storia massima servita da Yahoo per gli intervalli intraday (giorni, con un giorno di margine)
+YAHOO_LOOKBACK_DAYS = {'1m': 6, '5m': 59, '15m': 59, '30m': 59, '1h': 729}
+
+
+def split_ticker(ticker):
+    """ Divide un ticker "EXCHANGE:SYMBOL" nelle sue due parti. """
+    exchange, symbol = ticker.split(":") if ":" in ticker else ("", ticker)
+    return exchange, symbol
+
+
+def normalize_bars(bars):
+    """ Indice temporale ordinato e sole colonne OHLCV in float64; None se non resta nulla. """
+    if bars is None or bars.empty:
+        return None
+    bars = bars.rename(columns=str.lower)
+    bars.index = pd.to_datetime(bars.index)
+    if bars.index.tz is not None:
+        bars.index = bars.index.tz_localize(None)
+    bars = bars.sort_index()[BAR_COLUMNS].astype('f8')
+    bars = bars[~np.isnan(bars['close'].to_numpy())]
+    return bars if not bars.empty else None
+
+
+def bars_since(start, interval):
+    """ Stima per eccesso delle barre dell'intervallo dopo `start` (più due di sovrapposizione). """
+    elapsed = pd.Timestamp.now() - pd.Timestamp(start)
+    return max(int(elapsed.total_seconds() // INTERVAL_SECONDS.get(interval.value, 86400)), 0) + 2
+
+
+def start_for_bars(n_bars, interval):
+    """ Data da cui chiedere per avere almeno le ultime n_bars barre dell'intervallo.
+
+    Stima per eccesso: le barre ci sono solo nei giorni (e nelle ore) di borsa, quindi si
+    contano una volta e mezza in tempo di calendario, più una settimana di margine.
+    """
+    seconds = INTERVAL_SECONDS.get(interval.value, 86400) * n_bars * 1.5
+    return pd.Timestamp.now() - pd.Timedelta(seconds=seconds) - pd.Timedelta(days=7)
+
+
+class DataProvider:
+    """ Sorgente di barre OHLCV. Le sottoclassi implementano get_history per un ticker;
+    get_history_many scarica una lista di ticker con al più max_workers richieste in parallelo
+    (le sorgenti con un vero scaricamento in blocco la ridefiniscono).
+    """
+
+    name = "base"
+    max_workers = 1
+
+    def get_history(self, ticker, interval, n_bars):
+        raise NotImplementedError
+
+    def get_history_many(self, tickers, interval, start=None, n_bars=None):
+        """ Barre di più ticker: dict ticker -> DataFrame (i ticker senza dati mancano).
+
+        Si indica `start` (dalla data in poi) oppure `n_bars` (le ultime n barre).
+        """
+        if n_bars is None:
+            n_bars = bars_since(start, interval)
+        tickers = list(dict.fromkeys(tickers))
+        # I thread del pool non ereditano il contesto: la priorità del chiamante va passata a mano
+        priority = current_priority()
+
+        def fetch(ticker):
+            try:
+                with fetch_priority(priority):
+                    return ticker, self.get_history(ticker, interval, n_bars)
+            except Exception as e:
+                print(f"Errore nel recupero dati di {ticker} ({self.name}): {str(e)}")
+                return ticker, None
+
+        with ThreadPoolExecutor(max_workers=max(min(self.max_workers, len(tickers)), 1)) as pool:
+            results = dict(pool.map(fetch, tickers))
+        return {ticker: _since(bars, start) for ticker, bars in results.items() if bars is not None}
+
+
+def _since(bars, start):
+    return bars if start is None else bars[bars.index >= pd.Timestamp(start)]
+
+
+class TradingViewProvider(DataProvider):
+    """ TradingView tramite il pool di sessioni: una richiesta per ticker, in parallelo
+    fino alla dimensione del pool, al ritmo consentito dal pianificatore (fetch_scheduler). """
+
+    name = "tradingview"
+
+    @property
+    def max_workers(self):
+        from pool_tv import tv_pool
+        return tv_pool.size
+
+    def get_history(self, ticker, interval, n_bars):
+        from pool_tv import tv_pool
+        exchange, symbol = split_ticker(ticker)
+
+        def fetch():
+            started = time.perf_counter()
+            try:
+                bars = tv_pool.get_hist(symbol=symbol, exchange=exchange, interval=interval, n_bars=n_bars)
+            finally:
+                observe('quant_tv_fetch_seconds', time.perf_counter() - started)
+            # Nessuna barra (simbolo inesistente o incompleto): None, senza nuovi tentativi né backoff
+            return normalize_bars(bars)
+
+        return fetch_scheduler.call(fetch)
+
+
+class YFinanceProvider(DataProvider):
+    """ Yahoo Finance: tutta la lista in un solo yf.download (che parallelizza da sé). """
+
+    name = "yfinance"
+
+    @staticmethod
+    def yahoo_symbol(ticker):
+        exchange, symbol = split_ticker(ticker)
+        return symbol + YAHOO_SUFFIXES.get(exchange, '')
+
+    def get_history(self, ticker, interval, n_bars):
+        return self.get_history_many([ticker], interval, n_bars=n_bars).get(ticker)
+
+    def get_history_many(self, tickers, interval, start=None, n_bars=None):
+        """ Con n_bars si scaricano solo le barre dalla data stimata con start_for_bars (es. le code
+        da accodare all'archivio); la storia intera (period='max') solo se la stima va oltre il 1970.
+        Gli intervalli intraday partono al più dal limite di Yahoo (YAHOO_LOOKBACK_DAYS), oltre il quale
+        non restituisce nulla; gli intervalli che Yahoo non ha (es. 4H) non restituiscono barre.
+        """
+        import yfinance as yf
+
+        tickers = list(dict.fromkeys(tickers))
+        yahoo_interval = YAHOO_INTERVALS.get(interval.value)
+        if yahoo_interval is None:
+            print(f"Intervallo {interval.value} non disponibile su yfinance")
+            return {}
+        if not tickers:
+            return {}
+        symbols = {self.yahoo_symbol(t): t for t in tickers}
+        if start is None and n_bars:
+            start = start_for_bars(n_bars, interval)
+            if start.year < 1970:
+                start = None
+        lookback = YAHOO_LOOKBACK_DAYS.get(yahoo_interval)
+        if lookback is not None:
+            earliest = pd.Timestamp.now().normalize() - pd.Timedelta(days=lookback)
+            start = earliest if start is None else max(pd.Timestamp(start), earliest)
+        options = {'start': pd.Timestamp(start).strftime("%Y-%m-%d")} if start is not None else {'period': 'max'}
+        try:
+            frame = yf.download(list(symbols), interval=yahoo_interval,
+                                group_by='ticker', auto_adjust=False, threads=True, progress=False, **options)
+        except Exception as e:
+            print(f"Errore nel recupero dati da yfinance: {str(e)}")
+            return {}
+        if frame is None or frame.empty:
+            return {}
+
+        results = {}
+        for symbol, ticker in symbols.items():
+            if isinstance(frame.columns, pd.MultiIndex):
+                if symbol not in frame.columns.get_level_values(0):
+                    continue
+                bars = normalize_bars(frame[symbol].copy())
+            else:
+                bars = normalize_bars(frame.copy())
+            if bars is not None:
+                results[ticker] = bars.iloc[-n_bars:] if n_bars else bars
+        return results
+
+
+class LocalFileProvider(DataProvider):
+    """ File locali (CSV o Parquet) con indice temporale e colonne OHLCV, letti in parallelo. """
+
+    name = "local"
+    max_workers = 8
+
+    def __init__(self, directory=None):
+        self.directory = directory or LOCAL_BARS_DIR
+
+    def path(self, ticker, interval):
+        exchange, symbol = split_ticker(ticker)
+        base = os.path.join(self.directory, f"{exchange}_{symbol}_{interval.value}")
+        return base + ".parquet" if os.path.exists(base + ".parquet") else base + ".csv"
+
+    def get_history(self, ticker, interval, n_bars):
+        path = self.path(ticker, interval)
+        if not os.path.exists(path):
+            return None
+        if path.endswith(".parquet"):
+            bars = pd.read_parquet(path)
+        else:
+            bars = pd.read_csv(path, index_col=0)
+        bars = normalize_bars(bars)
+        return bars.iloc[-n_bars:] if bars is not None else None
+
+
+PROVIDERS = {'tradingview': TradingViewProvider, 'yfinance': YFinanceProvider, 'local': LocalFileProvider}
+
+_provider = None
+
+
+def get_provider():
+    """ Sorgente configurata con DATA_PROVIDER (creata alla prima richiesta). """
+    global _provider
+    if _provider is None:
+        if DATA_PROVIDER not in PROVIDERS:
+            raise ValueError(f"DATA_PROVIDER sconosciuto: {DATA_PROVIDER} (validi: {', '.join(PROVIDERS)})")
+        _provider = PROVIDERS[DATA_PROVIDER]()
+    return _provider
@@ -0,0 +1,90 @@
+import base64
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Tipi numerici che plotly.js decodifica dagli array base64 ({'dtype', 'bdata'})
+TYPED_ARRAY_DTYPES = {'f8', 'f4', 'i4', 'i2', 'i1', 'u4', 'u2', 'u1'}
+
+# Tracce usate dalle pagine: del template di plotly si tengono solo i loro stili
+TEMPLATE_TRACES = ('bar', 'scatter', 'scattergl')
+
+# Layout comune dei grafici delle pagine (tema scuro)
+DARK_LAYOUT = {'height': 500, 'paper_bgcolor': '#121212', 'plot_bgcolor': '#121212', 'font': {'color': 'white'}}
+
+
+@functools.lru_cache(maxsize=None)
+def _template():
+    """ Template predefinito di plotly (quello che go.Figure mette in ogni figura), calcolato una volta. """
+    import plotly.io as pio
+
+    template = pio.templates[pio.templates.default].to_plotly_json()
+    return {'data': {kind: template['data'][kind] for kind in TEMPLATE_TRACES if kind in template['data']},
+            'layout': template['layout']}
+
+
+def is_dates(values):
+    return isinstance(values, pd.DatetimeIndex) or np.asarray(values).dtype.kind == 'M'
+
+
+def encode_array(values, typed=True):
+    """ Valori di una traccia: array base64 per i numeri (con typed), liste per il resto.
+
+    Le date diventano millisecondi dal 1970 (NaT come NaN), che plotly.js legge come
+    date su un asse di tipo 'date'. Senza typed si usano liste: servono alle tracce
+    a cui la modalità live accoda punti con extendData, che non estende gli array base64.
+    """
+    if is_dates(values):
+        moments = np.asarray(values, dtype='M8[ns]')
+        if not typed:
+            return moments.astype('M8[ms]').astype('i8').tolist()
+        values = np.where(np.isnat(moments), np.nan, moments.view('i8') / 1e6)
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu' and values.dtype.itemsize == 8:
+        fits = values.size == 0 or np.iinfo('i4').min <= values.min() and values.max() <= np.iinfo('i4').max
+        values = values.astype('i4' if fits else 'f8')
+    dtype = values.dtype.str.lstrip('<|=')
+    if not typed or dtype not in TYPED_ARRAY_DTYPES:
+        return values.tolist()
+    return {'dtype': dtype, 'bdata': base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')}
+
+
+def trace(kind, x, y, name, typed=True, **style):
+    """ Traccia come dict ('bar', 'scatter', 'scattergl'), con gli stili passati così come sono (es. marker, line, mode). """
+    return {'type': kind, 'x': encode_array(x, typed), 'y': encode_array(y, typed), 'name': name, **style}
+
+
+def hline(y, color, dash='dash', annotation=None):
+    """ Linea orizzontale su tutta la larghezza (come add_hline) ed eventuale etichetta in alto a destra. """
+    shape = {'type': 'line', 'xref': 'x domain', 'x0': 0, 'x1': 1, 'yref': 'y', 'y0': y, 'y1': y,
+             'line': {'color': color, 'dash': dash}}
+    label = None
+    if annotation is not None:
+        label = {'showarrow': False, 'text': annotation, 'x': 1, 'xanchor': 'right', 'xref': 'x domain',
+                 'y': y, 'yanchor': 'bottom', 'yref': 'y'}
+    return shape, label
+
+
+def figure(traces, title, xaxis_title, yaxis_title, dates=False, lines=(), x_range=None, **layout):
+    """ Figura come dict pronta per dcc.Graph: stesso risultato di go.Figure + update_layout con DARK_LAYOUT,
+    senza i validatori di plotly. Con dates l'asse x è di date (le x delle tracce sono in millisecondi);
+    `lines` sono i risultati di hline, `layout` altre chiavi del layout. """
+    xaxis = {'title': {'text': xaxis_title}}
+    if dates:
+        xaxis['type'] = 'date'
+    if x_range is not None:
+        xaxis['range'] = [pd.Timestamp(value).isoformat() for value in x_range]
+    full_layout = {'template': _template(), **DARK_LAYOUT, 'title': {'text': title}, 'xaxis': xaxis,
+                   'yaxis': {'title': {'text': yaxis_title}}, **layout}
+    if lines:
+        full_layout['shapes'] = [shape for shape, _ in lines]
+        annotations = [label for _, label in lines if label is not None]
+        if annotations:
+            full_layout['annotations'] = annotations
+    return {'data': list(traces), 'layout': full_layout}
+
+
+def empty_figure():
+    """ Figura vuota, come go.Figure(). """
+    return {'data': [], 'layout': {'template': _template()}}
@@ -0,0 +1,116 @@
+import bisect
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+
+# Numero massimo di opzioni restituite al dropdown per ogni ricerca
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 50))
+
+# Righe candidate verificate per ogni blocco della ricerca per sottostringa
+SUBSTRING_CHUNK = 2048
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TickerIndex:
+    """ Indice di ricerca dei ticker, costruito una volta dal DataFrame di all_tickers.csv.
+
+    I risultati sono ordinati per rilevanza: ticker esatto, prefisso del ticker,
+    prefisso di una parola della descrizione e infine sottostringa qualsiasi.
+    Ogni livello si ferma appena sono state raccolte abbastanza opzioni, quindi il costo
+    di una ricerca non dipende dalla dimensione dell'universo.
+    """
+
+    def __init__(self, df):
+        tickers = df['Ticker'].fillna('').astype(str).tolist()
+        descriptions = df['Descrizione'].fillna('').astype(str).tolist()
+        exchanges = df['Exchange'].fillna('').astype(str).tolist()
+
+        # Opzioni del dropdown già pronte, una per riga
+        self.options = [{'label': f"{t} - {d} ({e})", 'value': f"{e}:{t}"}
+                        for t, d, e in zip(tickers, descriptions, exchanges)]
+        self._tickers = [t.lower() for t in tickers]
+        self._descriptions = [d.lower() for d in descriptions]
+
+        # Ticker esatti e ticker ordinati per la ricerca per prefisso
+        self._exact = defaultdict(list)
+        for row, ticker in enumerate(self._tickers):
+            self._exact[ticker].append(row)
+        ticker_order = sorted(range(len(self._tickers)), key=self._tickers.__getitem__)
+        self._sorted_tickers = [self._tickers[row] for row in ticker_order]
+        self._sorted_ticker_rows = ticker_order
+
+        # Parole delle descrizioni ordinate per la ricerca per prefisso di parola
+        words = sorted((word, row) for row, text in enumerate(self._descriptions)
+                       for word in set(_WORD_RE.findall(text)))
+        self._sorted_words = [word for word, _ in words]
+        self._sorted_word_rows = [row for _, row in words]
+
+        # Indice invertito dei trigrammi di ticker e descrizione
+        postings = defaultdict(list)
+        for row, (ticker, description) in enumerate(zip(self._tickers, self._descriptions)):
+            for trigram in _trigrams(ticker) | _trigrams(description):
+                postings[trigram].append(row)
+        self._postings = {trigram: np.array(rows, dtype=np.int32) for trigram, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.options)
+
+    def _prefix_rows(self, sorted_keys, rows, prefix):
+        start = bisect.bisect_left(sorted_keys, prefix)
+        for i in range(start, len(sorted_keys)):
+            if not sorted_keys[i].startswith(prefix):
+                break
+            yield rows[i]
+
+    def _substring_rows(self, query):
+        postings = [self._postings.get(trigram) for trigram in _trigrams(query)]
+        if not postings or any(posting is None for posting in postings):
+            return
+        postings.sort(key=len)
+        # Si parte dalla lista più corta e la si filtra a blocchi con le altre (ricerca binaria
+        # vettoriale), così una ricerca con molti risultati si ferma ai primi blocchi
+        first, others = postings[0], postings[1:]
+        exact = len(query) == 3
+        for start in range(0, len(first), SUBSTRING_CHUNK):
+            candidates = first[start:start + SUBSTRING_CHUNK]
+            for posting in others:
+                positions = np.minimum(np.searchsorted(posting, candidates), len(posting) - 1)
+                candidates = candidates[posting[positions] == candidates]
+                if len(candidates) == 0:
+                    break
+            for row in candidates.tolist():
+                # Con più di tre caratteri i trigrammi comuni non bastano: si verifica la sottostringa
+                if exact or query in self._tickers[row] or query in self._descriptions[row]:
+                    yield row
+
+    def search(self, query, limit=None):
+        """ Restituisce al massimo `limit` opzioni del dropdown ordinate per rilevanza. """
+        limit = SEARCH_MAX_RESULTS if limit is None else limit
+        query = (query or '').strip().lower()
+        if not query:
+            return []
+
+        tiers = [
+            iter(self._exact.get(query, ())),
+            self._prefix_rows(self._sorted_tickers, self._sorted_ticker_rows, query),
+            self._prefix_rows(self._sorted_words, self._sorted_word_rows, query),
+            self._substring_rows(query),
+        ]
+        seen = set()
+        results = []
+        for rows in tiers:
+            for row in rows:
+                if row in seen:
+                    continue
+                seen.add(row)
+                results.append(self.options[row])
+                if len(results) >= limit:
+                    return results
+        return results
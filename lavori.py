@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import dash.dependencies as dd
+
+from metriche import flush as flush_metrics, timed
+
+# Cartella della coda dei lavori in background e durata dei risultati riutilizzabili
+JOBS_CACHE_DIR = os.environ.get("JOBS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs_cache"))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 300))
+JOB_LOCK_TIMEOUT = int(os.environ.get("JOB_LOCK_TIMEOUT", 120))
+
+# Stile del messaggio di avanzamento mentre un lavoro è in corso (e a lavoro finito)
+PROGRESS_VISIBLE = {'color': 'yellow', 'marginTop': '10px', 'textAlign': 'center', 'display': 'block'}
+PROGRESS_HIDDEN = {'color': 'yellow', 'marginTop': '10px', 'textAlign': 'center', 'display': 'none'}
+
+_jobs_cache = None
+_jobs_cache_lock = threading.Lock()
+_current = threading.local()
+
+
+def get_jobs_cache():
+    """ Cache su disco usata dal gestore dei lavori; None se diskcache non è installato. """
+    global _jobs_cache
+    if _jobs_cache is None:
+        with _jobs_cache_lock:
+            if _jobs_cache is None:
+                try:
+                    import diskcache
+                    import multiprocess  # noqa: F401 (richiesti dal gestore dei lavori di Dash)
+                    import psutil  # noqa: F401
+                except ImportError:
+                    print("diskcache/multiprocess/psutil non installati: i callback pesanti restano sincroni")
+                    return None
+                _jobs_cache = diskcache.Cache(JOBS_CACHE_DIR)
+    return _jobs_cache
+
+
+def report_progress(message):
+    """ Aggiorna il messaggio di avanzamento del lavoro in corso (nessun effetto fuori da un lavoro). """
+    set_progress = getattr(_current, 'set_progress', None)
+    if set_progress is not None:
+        set_progress([message])
+
+
+@contextmanager
+def job_lock(cache, key, timeout=JOB_LOCK_TIMEOUT):
+    """ Lock tra processi sulla cache dei lavori.
+
+    Un lavoro annullato viene terminato senza rilasciare il lock: se il processo che lo
+    detiene non esiste più il lock viene considerato scaduto e ripreso subito.
+    """
+    import psutil
+
+    lock_key = f"job-lock:{key}"
+    deadline = time.monotonic() + timeout
+    waiting = False
+    while not cache.add(lock_key, os.getpid(), expire=timeout):
+        if not waiting:
+            report_progress("⏳ Caricamento già in corso, attendo il risultato...")
+            waiting = True
+        holder = cache.get(lock_key)
+        if holder is not None and not psutil.pid_exists(holder):
+            cache.delete(lock_key)
+        elif time.monotonic() > deadline:
+            break
+        else:
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        if cache.get(lock_key) == os.getpid():
+            cache.delete(lock_key)
+
+
+def register_background_callback(app, name, func, outputs, inputs, dedupe_key=None, progress_id='loading-message',
+                                 lock_timeout=JOB_LOCK_TIMEOUT, prevent_initial_call=False):
+    """ Registra `func` come callback in background su un gestore locale (processi + diskcache).
+
+    Il lavoro gira in un processo separato, così il worker web resta libero; il messaggio
+    `progress_id` della pagina mostra l'avanzamento (vedi report_progress). Un nuovo
+    valore dell'input annulla il lavoro precedente, e cambiare pagina lo annulla sempre.
+    Lavori concorrenti con la stessa chiave (di default il ticker) vengono eseguiti uno
+    alla volta: il secondo riusa il risultato del primo se è per la stessa pagina, altrimenti
+    trova le barre già salvate su disco invece di riscaricarle.
+    Con progress_id None il lavoro gira senza messaggio di avanzamento (es. aggiornamenti
+    silenziosi di dati già mostrati). Se diskcache non è disponibile il callback viene
+    registrato come sincrono.
+
+    Le cache in memoria del processo del lavoro vanno perse con lui, ma non serve Redis:
+    le barre scaricate restano nell'archivio su disco e i risultati delle analisi nella
+    cache dei lavori (vedi memo_analisi), entrambi letti anche dal worker web.
+    """
+    cache = get_jobs_cache()
+    if cache is None:
+        app.callback(outputs, inputs, prevent_initial_call=prevent_initial_call)(func)
+        return
+
+    from dash import DiskcacheManager
+
+    dedupe_key = dedupe_key or (lambda *args: args[0])
+    # Risultati riutilizzabili per JOB_RESULT_TTL secondi a parità di pagina e input
+    manager = DiskcacheManager(cache, cache_by=[lambda: name, lambda: int(time.time() // JOB_RESULT_TTL)],
+                               expire=JOB_RESULT_TTL)
+
+    def run_job(set_progress, *args):
+        _current.set_progress = set_progress
+        try:
+            if set_progress is not None:
+                set_progress(["🔄 Caricamento dati in corso..."])
+            result_key = f"job-result:{name}:{args!r}:{int(time.time() // JOB_RESULT_TTL)}"
+            with job_lock(cache, dedupe_key(*args), lock_timeout):
+                result = cache.get(result_key)
+                if result is None:
+                    with timed(name, 'total'):
+                        result = func(*args)
+                    cache.set(result_key, result, expire=JOB_RESULT_TTL)
+                return result
+        finally:
+            _current.set_progress = None
+            # Il processo del lavoro termina senza atexit: le sue misure vanno scritte adesso
+            flush_metrics()
+
+    def run_silent_job(*args):
+        # Senza progress Dash non passa set_progress al lavoro
+        return run_job(None, *args)
+
+    job, progress = run_silent_job, {}
+    if progress_id is not None:
+        job = run_job
+        progress = {'progress': [dd.Output(progress_id, 'children')],
+                    'running': [(dd.Output(progress_id, 'style'), PROGRESS_VISIBLE, PROGRESS_HIDDEN)]}
+    app.callback(
+        outputs,
+        inputs,
+        background=True,
+        manager=manager,
+        cancel=[dd.Input('url', 'pathname')],
+        prevent_initial_call=prevent_initial_call,
+        **progress
+    )(job)
@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import OrderedDict
+
+from cache_condivisa import ANALYTICS_TTL, pack_object, shared_cache, unpack_object
+from lavori import get_jobs_cache
+from metriche import inc
+
+# Numero massimo di risultati tenuti in memoria dal processo
+ANALYTICS_MEMO_SIZE = int(os.environ.get("ANALYTICS_MEMO_SIZE", 64))
+
+
+class AnalyticsMemo:
+    """ Memoizzazione dei risultati delle analisi, chiave (modulo, ticker, ultima barra, parametri).
+
+    Finché non arriva una barra nuova (o l'ultima non cambia chiusura) la chiave resta la
+    stessa e il calcolo viene saltato del tutto. Sotto la memoria locale c'è la cache
+    condivisa, così un risultato calcolato da un altro worker non viene ricalcolato; senza
+    Redis ne fa le veci la cache su disco dei lavori, condivisa dai processi della macchina
+    (i lavori in background calcolano in un processo separato da quello del worker web).
+    Quando entra il risultato di una barra nuova quello precedente dello stesso
+    (modulo, ticker, parametri) viene scartato subito.
+    """
+
+    def __init__(self, max_entries=ANALYTICS_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # chiave completa -> risultato
+        self._latest = {}  # (modulo, ticker, parametri) -> chiave completa più recente
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(module, ticker, bars, params=()):
+        params = tuple(sorted(params.items())) if isinstance(params, dict) else tuple(params)
+        return module, ticker, params, int(bars.index[-1].value), float(bars['close'].iloc[-1])
+
+    def get_or_compute(self, module, ticker, bars, compute, params=()):
+        """ Restituisce il risultato di compute(bars), calcolandolo solo se non è già noto. """
+        key = self.make_key(module, ticker, bars, params)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                inc('quant_cache_requests_total', cache='analisi_memoria', result='hit')
+                return self._entries[key]
+            self.misses += 1
+        inc('quant_cache_requests_total', cache='analisi_memoria', result='miss')
+
+        shared_key = "analytics:" + ":".join(map(str, key))
+        result = _load_shared(shared_key)
+        inc('quant_cache_requests_total', cache='analisi_condivisa', result='miss' if result is None else 'hit')
+        if result is None:
+            result = compute(bars)
+            if result is None:
+                return None
+            _store_shared(shared_key, result)
+
+        with self._lock:
+            previous = self._latest.get(key[:3])
+            if previous is not None and previous != key:
+                self._entries.pop(previous, None)
+            self._latest[key[:3]] = key
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                if self._latest.get(evicted[:3]) == evicted:
+                    del self._latest[evicted[:3]]
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def _load_shared(key):
+    """ Risultato salvato da un altro processo: cache condivisa oppure, senza Redis, cache dei lavori. """
+    if shared_cache.is_shared:
+        return shared_cache.get_object(key)
+    cache = get_jobs_cache()
+    blob = cache.get(key) if cache is not None else None
+    if blob is None:
+        return None
+    try:
+        return unpack_object(blob)
+    except Exception as e:
+        print(f"Errore nella lettura dalla cache dei lavori: {str(e)}")
+        return None
+
+
+def _store_shared(key, result):
+    if shared_cache.is_shared:
+        shared_cache.set_object(key, result)
+        return
+    cache = get_jobs_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, pack_object(result), expire=ANALYTICS_TTL)
+    except TypeError as e:
+        print(f"Errore nella scrittura sulla cache dei lavori: {str(e)}")
+
+
+# Istanza condivisa dalle pagine del processo
+analytics_memo = AnalyticsMemo()
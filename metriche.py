@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Con METRICS_ENABLED=0 tutte le misure diventano operazioni vuote
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Ogni quanti secondi un processo scrive nei contatori condivisi le misure accumulate in memoria
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 10))
+
+# Limiti dei secchi degli istogrammi (secondi e byte)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+# Metriche esposte: nome -> (tipo, descrizione, secchi)
+METRICS = {
+    'quant_callback_stage_seconds': ('histogram', "Durata delle fasi dei callback (fetch, compute, figure, total)",
+                                     LATENCY_BUCKETS),
+    'quant_tv_fetch_seconds': ('histogram', "Durata delle chiamate a TradingView", LATENCY_BUCKETS),
+    'quant_request_seconds': ('histogram', "Durata delle richieste sincrone a /_dash-update-component",
+                              LATENCY_BUCKETS),
+    'quant_response_bytes': ('histogram', "Byte JSON restituiti al browser dai callback (figure comprese)",
+                             SIZE_BUCKETS),
+    'quant_cache_requests_total': ('counter', "Richieste alle cache per livello ed esito (hit/miss)", None),
+    'quant_fetch_queue_depth': ('gauge', "Richieste in coda verso la sorgente per priorità", None),
+    'quant_fetch_wait_seconds': ('histogram', "Attesa in coda delle richieste alla sorgente per priorità",
+                                 LATENCY_BUCKETS),
+    'quant_fetch_retries_total': ('counter', "Nuovi tentativi dopo un errore della sorgente", None),
+    'quant_fetch_rejected_total': ('counter', "Richieste alla sorgente rifiutate (coda piena o attesa troppo lunga)",
+                                   None),
+}
+
+PREFIX = "metric|"
+
+# Indicatori letti al momento dell'esposizione: nome -> funzione che restituisce coppie (etichette, valore)
+_gauges = {}
+
+
+class LocalStore:
+    """ Contatori in memoria del processo, usati se diskcache non è disponibile. """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def incr_many(self, deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._values[key] = self._values.get(key, 0) + delta
+
+    def drain(self):
+        """ Restituisce i valori accumulati e li azzera. """
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class DiskStore:
+    """ Contatori nella cache su disco dei lavori, condivisi da worker web e lavori in background. """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def incr_many(self, deltas):
+        # Una sola transazione SQLite per tutto il blocco di misure
+        with self.cache.transact():
+            for key, delta in deltas.items():
+                self.cache.incr(PREFIX + key, delta, default=0)
+
+    def items(self):
+        values = []
+        for key in self.cache.iterkeys():
+            if isinstance(key, str) and key.startswith(PREFIX):
+                value = self.cache.get(key)
+                if value is not None:
+                    values.append((key[len(PREFIX):], value))
+        return values
+
+
+_store = None
+_store_lock = threading.Lock()
+
+# Misure del processo non ancora scritte nei contatori condivisi
+_pending = LocalStore()
+_last_flush = time.monotonic()
+
+
+def _reset_after_fork():
+    # Il figlio (lavoro in background, processo dello screener) non deve riscrivere le misure del padre
+    global _pending, _last_flush
+    _pending = LocalStore()
+    _last_flush = time.monotonic()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from lavori import get_jobs_cache
+                cache = get_jobs_cache()
+                _store = DiskStore(cache) if cache is not None else LocalStore()
+    return _store
+
+
+def _series(name, labels):
+    return name + "|" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+
+def flush():
+    """ Scrive nei contatori condivisi le misure accumulate in memoria dal processo.
+
+    Avviene al più ogni METRICS_FLUSH_SECONDS durante le misure, a ogni lettura di /metrics
+    e alla fine dei lavori in background (i cui processi terminano senza atexit).
+    """
+    global _last_flush
+    _last_flush = time.monotonic()
+    values = _pending.drain()
+    if not values:
+        return
+    try:
+        get_store().incr_many(values)
+    except Exception as e:
+        print(f"Errore nel salvataggio delle metriche: {str(e)}")
+
+
+def _record(deltas):
+    # Sul percorso delle richieste solo un aggiornamento in memoria; la scrittura condivisa è periodica
+    _pending.incr_many(deltas)
+    if time.monotonic() - _last_flush >= METRICS_FLUSH_SECONDS:
+        flush()
+
+
+def observe(name, value, **labels):
+    """ Registra un valore in un istogramma. """
+    if not METRICS_ENABLED:
+        return
+    buckets = METRICS[name][2]
+    series = _series(name, labels)
+    # Si salva solo il secchio più piccolo che contiene il valore: i cumulativi si fanno in lettura
+    _record({f"{series}|b{bisect_left(buckets, value)}": 1, f"{series}|sum": value, f"{series}|count": 1})
+
+
+def inc(name, amount=1, **labels):
+    """ Incrementa un contatore. """
+    if not METRICS_ENABLED:
+        return
+    _record({f"{_series(name, labels)}|count": amount})
+
+
+@contextmanager
+def timed(callback, stage):
+    """ Misura la durata di una fase (fetch, compute, figure, total) di un callback. """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('quant_callback_stage_seconds', time.perf_counter() - started, callback=callback, stage=stage)
+
+
+def register_gauge(name, collect):
+    """ Registra un indicatore: collect() restituisce una lista di coppie (dict di etichette, valore). """
+    _gauges[name] = collect
+
+
+def render():
+    """ Testo nel formato di esposizione di Prometheus.
+
+    Quelle del processo che risponde sono sempre aggiornate; gli altri processi scrivono le
+    proprie ogni METRICS_FLUSH_SECONDS mentre misurano e alla fine dei lavori in background.
+    """
+    flush()
+    series = {}
+    for key, value in get_store().items():
+        name_labels, field = key.rsplit("|", 1)
+        name, labels = name_labels.split("|", 1)
+        series.setdefault(name, {}).setdefault(labels, {})[field] = value
+    for name, collect in _gauges.items():
+        try:
+            for labels, value in collect():
+                series.setdefault(name, {})[_series(name, labels).split("|", 1)[1]] = {'count': value}
+        except Exception as e:
+            print(f"Errore nella lettura della metrica {name}: {str(e)}")
+
+    def braces(labels):
+        return f"{{{labels}}}" if labels else ""
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, fields in sorted(series.get(name, {}).items()):
+            if kind in ('counter', 'gauge'):
+                lines.append(f"{name}{braces(labels)} {fields.get('count', 0)}")
+                continue
+            sep = "," if labels else ""
+            cumulative = 0
+            for i, bound in enumerate(buckets):
+                cumulative += fields.get(f"b{i}", 0)
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {fields.get("count", 0)}')
+            lines.append(f"{name}_sum{braces(labels)} {fields.get('sum', 0)}")
+            lines.append(f"{name}_count{braces(labels)} {fields.get('count', 0)}")
+    return "\n".join(lines) + "\n"
+
+
+def register_metrics(server):
+    """ Aggiunge /metrics al server Flask e misura le risposte dei callback Dash. """
+    from flask import Response, g, request
+
+    @server.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @server.after_request
+    def _record_response(response):
+        if not METRICS_ENABLED or request.path != '/_dash-update-component' or response.status_code != 200:
+            return response
+        # Solo le risposte con i dati dei callback (non l'avvio o l'attesa dei lavori in background)
+        if b'"response"' not in response.get_data()[:64]:
+            return response
+        try:
+            payload = request.get_json(silent=True) or {}
+            output = payload.get('output', '').lstrip('.').split('.')[0] or 'sconosciuto'
+            observe('quant_response_bytes', response.calculate_content_length() or 0, output=output)
+            if 'cacheKey' not in request.args and 'metrics_started' in g:
+                observe('quant_request_seconds', time.perf_counter() - g.metrics_started, output=output)
+        except Exception as e:
+            print(f"Errore nella misura della risposta: {str(e)}")
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
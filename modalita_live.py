@@ -0,0 +1,127 @@
+import os
+
+import dash.dependencies as dd
+import numpy as np
+from dash import dcc, html
+from dash.exceptions import PreventUpdate
+from tvDatafeed import Interval
+
+from grafici import encode_array
+
+# Frequenza di aggiornamento della modalità live e barre intraday caricate
+LIVE_POLL_SECONDS = float(os.environ.get("LIVE_POLL_SECONDS", 15))
+LIVE_N_BARS = int(os.environ.get("LIVE_N_BARS", 5000))
+# Punti tenuti da ogni traccia: extendData scarta i più vecchi oltre questo limite
+LIVE_MAX_POINTS = int(os.environ.get("LIVE_MAX_POINTS", 20000))
+
+# Intervalli selezionabili: il giornaliero è la vista statica, gli intraday attivano la modalità live
+LIVE_INTERVALS = [
+    ("Giornaliero", Interval.in_daily),
+    ("Live 1 minuto", Interval.in_1_minute),
+    ("Live 5 minuti", Interval.in_5_minute),
+    ("Live 15 minuti", Interval.in_15_minute),
+    ("Live 30 minuti", Interval.in_30_minute),
+    ("Live 1 ora", Interval.in_1_hour),
+    ("Live 4 ore", Interval.in_4_hour),
+]
+
+
+def parse_interval(value):
+    """ Interval dal valore del selettore (giornaliero se assente o sconosciuto). """
+    try:
+        return Interval(value) if value else Interval.in_daily
+    except ValueError:
+        return Interval.in_daily
+
+
+def is_live(interval):
+    return interval != Interval.in_daily
+
+
+def interval_label(interval):
+    return next((label for label, value in LIVE_INTERVALS if value == interval), interval.value)
+
+
+def get_live_layout(prefix):
+    """ Selettore dell'intervallo, timer e stato del client per la modalità live della pagina `prefix`. """
+    return html.Div(style={'textAlign': 'center', 'marginTop': '10px'}, children=[
+        dcc.Dropdown(
+            id=f'{prefix}-live-interval',
+            options=[{'label': label, 'value': interval.value} for label, interval in LIVE_INTERVALS],
+            value=Interval.in_daily.value,
+            clearable=False,
+            style={'width': '220px', 'display': 'inline-block', 'color': 'black', 'verticalAlign': 'middle'}
+        ),
+        html.Span(id=f'{prefix}-live-status', style={'marginLeft': '10px', 'color': 'lime'}),
+        dcc.Interval(id=f'{prefix}-live-timer', interval=int(LIVE_POLL_SECONDS * 1000), disabled=True),
+        # Ultima barra confermata già disegnata: il timer manda solo quelle successive
+        dcc.Store(id=f'{prefix}-live-state')
+    ])
+
+
+def confirmed(data, interval):
+    """ In modalità live l'ultima barra può essere ancora in formazione: si disegna solo dalla successiva. """
+    return data.iloc[:-1] if is_live(interval) else data
+
+
+def live_state(ticker, interval, data):
+    """ Stato del client dopo aver disegnato `data` (None nella vista giornaliera). """
+    if not is_live(interval) or len(data) < 2:
+        return None
+    return {'ticker': ticker, 'interval': interval.value, 'last': int(data.index[-2].value)}
+
+
+def new_rows(data, state):
+    """ Barre confermate di `data` successive all'ultima già inviata al client. """
+    times = data.index.values.astype('M8[ns]').view('i8')[:-1]
+    return data.iloc[np.searchsorted(times, state['last'], side='right'):len(data) - 1]
+
+
+def extend_data(*series, traces=None):
+    """ Valore di extendData di un dcc.Graph: ogni serie (indice temporale) in coda alla sua traccia
+    (di default la prima serie alla traccia 0, la seconda alla 1, ...), con le date in millisecondi
+    come nelle figure di grafici.py. """
+    traces = list(traces) if traces is not None else list(range(len(series)))
+    return ({'x': [encode_array(values.index, typed=False) for values in series],
+             'y': [encode_array(values.to_numpy(dtype='f8'), typed=False) for values in series]}, traces, LIVE_MAX_POINTS)
+
+
+def register_live_callbacks(app, prefix, graph_ids, extend_graphs):
+    """ Registra il timer della modalità live della pagina `prefix`.
+
+    Il timer è attivo solo con un intervallo intraday; a ogni scatto
+    extend_graphs(ticker, interval, state) restituisce (extendData di ogni grafico
+    in graph_ids, nuovo stato) oppure None se non ci sono barre nuove. La risposta
+    contiene solo i punti nuovi: le figure già nel browser non vengono riinviate.
+    """
+    def toggle_timer(interval_value):
+        interval = parse_interval(interval_value)
+        if not is_live(interval):
+            return True, ""
+        return False, f"🟢 Aggiornamento ogni {LIVE_POLL_SECONDS:g} s"
+
+    app.callback(
+        [dd.Output(f'{prefix}-live-timer', 'disabled'), dd.Output(f'{prefix}-live-status', 'children')],
+        [dd.Input(f'{prefix}-live-interval', 'value')]
+    )(toggle_timer)
+
+    def on_tick(n_intervals, ticker, interval_value, state):
+        interval = parse_interval(interval_value)
+        # Stato di un altro ticker o intervallo: le figure nuove sono ancora in costruzione
+        if (not ticker or not is_live(interval) or not state
+                or state.get('ticker') != ticker or state.get('interval') != interval.value):
+            raise PreventUpdate
+        result = extend_graphs(ticker, interval, state)
+        if result is None:
+            raise PreventUpdate
+        extensions, state = result
+        return (*extensions, state)
+
+    app.callback(
+        [dd.Output(graph_id, 'extendData') for graph_id in graph_ids]
+        + [dd.Output(f'{prefix}-live-state', 'data', allow_duplicate=True)],
+        [dd.Input(f'{prefix}-live-timer', 'n_intervals')],
+        [dd.State('selected-ticker', 'value'), dd.State(f'{prefix}-live-interval', 'value'),
+         dd.State(f'{prefix}-live-state', 'data')],
+        prevent_initial_call=True
+    )(on_tick)
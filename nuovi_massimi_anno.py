@@ -1,19 +1,27 @@
-import os
 import dash
 from dash import html, dcc
-import dash.dependencies as dd
-import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-from tvDatafeed import TvDatafeed, Interval
-from ricerca import get_search_layout, register_search_callbacks
+from tvDatafeed import Interval
+from ricerca import get_search_layout
+from dati_storici import FRESH, LIVE, REVALIDATE, STALE_OK, load_bars, series_key
+from cache_condivisa import shared_cache
+from memo_analisi import analytics_memo
+from lavori import report_progress
+from metriche import timed
+from calcolo_massimi import new_high_kernel, year_starts
+from piramide_barre import BarPyramid, get_pyramid
+from grafici import empty_figure, figure, hline, trace
+from modalita_live import (LIVE_N_BARS, confirmed, extend_data, get_live_layout, interval_label, is_live,
+                           live_state, new_rows, parse_interval)
+from rivalidazione import get_stale_layout, stale_outputs
+
+# Barre giornaliere richieste per l'analisi
+N_BARS = 10000
 
 # Inizializzazione dell'app Dash (Worker)
 app = dash.Dash(__name__, server=False)
 
-# Connessione a TradingView
-tv = TvDatafeed()
-
 # Layout della pagina per i nuovi massimi annuali
 layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'padding': '20px'}, children=[
     html.H1("Nuovi Massimi nell'Anno", style={'textAlign': 'center', 'color': 'cyan'}),
@@ -21,12 +29,18 @@ layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'paddin
     # ✅ Sezione di ricerca con valore selezionato
     get_search_layout(),
 
+    # Vista giornaliera o live su un intervallo intraday
+    get_live_layout('massimi'),
+
     # ✅ Input nascosto per salvare il ticker selezionato
     dcc.Input(id='selected-ticker', type='text', value="", style={'display': 'none'}),
 
     # Messaggio di caricamento AJAX
     html.Div(id='loading-message', style={'color': 'yellow', 'marginTop': '10px', 'textAlign': 'center', 'display': 'none'}),
 
+    # Avviso dei dati salvati non aggiornati (fuori dallo spinner: i grafici restano visibili)
+    get_stale_layout('massimi'),
+
     # Spinner di caricamento
     dcc.Loading(
         id="loading-spinner",
@@ -44,119 +58,171 @@ layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'paddin
 
 app.layout = layout
 
-# ✅ Registra i callback della ricerca direttamente nel worker
-register_search_callbacks(app)
+def compute_analytics(asset_data, key=None):
+    """ Nuovi massimi dell'anno solare, loro conteggio e rendimento di ogni anno.
+
+    Prima e ultima chiusura di ogni anno vengono dalla piramide delle barre della serie
+    `key` (senza chiave se ne costruisce una al momento dalle sole barre ricevute).
+    """
+    # get_bars restituisce già un DatetimeIndex ordinato: si riordina solo se necessario
+    if not asset_data.index.is_monotonic_increasing:
+        asset_data = asset_data.sort_index()
+    index = asset_data.index
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    close = asset_data['close'].to_numpy(dtype='f8')
+
+    # Calcolo nuovi massimi annuali sull'array delle chiusure (un solo passaggio per anno)
+    starts = year_starts(index)
+    is_new_high, new_high_count, number_of_new_highs, _, _ = new_high_kernel(close, starts)
+    pyramid = get_pyramid(key, asset_data) if key is not None else BarPyramid().update(asset_data)
+    years = pyramid.level('Y', since=asset_data.index[0])
+
+    asset_data = pd.DataFrame({
+        'Close': close,
+        'is_new_high_year': is_new_high[0],
+        'new_high_count_year': new_high_count[0]
+    }, index=index)
+
+    # Analisi aggregata per anno (anni di calendario della piramide)
+    first_close = years['first_close'].to_numpy()
+    last_close = years['close'].to_numpy()
+    yearly_data = pd.DataFrame({
+        'year': years.index.year,
+        'number_of_new_highs': number_of_new_highs[0],
+        'first_close': first_close,
+        'last_close': last_close,
+        'yearly_return_pct': 100.0 * (last_close / first_close - 1)
+    })
+
+    return asset_data, yearly_data
 
 # Funzione per ottenere i dati dei nuovi massimi annuali
-def get_asset_data(ticker):
+def get_asset_data(ticker, interval=Interval.in_daily, refresh=False):
+    """ Barre e analisi del ticker; con refresh (modalità live) scarica subito le barre nuove. """
+    return load_asset_data(ticker, interval, LIVE if refresh else FRESH)[0]
+
+def load_asset_data(ticker, interval=Interval.in_daily, policy=FRESH):
+    """ Barre e analisi del ticker e barre scadute, con la politica di caricamento `policy` (vedi dati_storici.load_bars). """
     try:
         if not ticker:
-            return None
+            return None, False
 
-        exchange, symbol = ticker.split(":") if ":" in ticker else ("", ticker)
-        asset_data = tv.get_hist(symbol=symbol, exchange=exchange, interval=Interval.in_daily, n_bars=10000)
+        n_bars = LIVE_N_BARS if is_live(interval) else N_BARS
+        with timed('nuovi_massimi_anno', 'fetch'):
+            asset_data, stale = load_bars(ticker, n_bars, interval, ['close'], policy)
 
         if asset_data is None or asset_data.empty:
-            return None
-
-        asset_data.index = pd.to_datetime(asset_data.index).tz_localize(None)
-        asset_data.sort_index(inplace=True)
-        asset_data.rename(columns={'close': 'Close'}, inplace=True)
-
-        # Calcolo nuovi massimi annuali
-        asset_data['year'] = asset_data.index.year
-        asset_data['rolling_max_year'] = asset_data.groupby('year')['Close'].cummax()
-        asset_data['rolling_max_shifted_year'] = asset_data.groupby('year')['rolling_max_year'].shift(1)
-        asset_data['is_new_high_year'] = asset_data['Close'] > asset_data['rolling_max_shifted_year']
-        asset_data['new_high_count_year'] = asset_data.groupby('year')['is_new_high_year'].cumsum()
-
-        # Analisi aggregata per anno
-        yearly_data = asset_data.groupby('year').agg(
-            number_of_new_highs=('is_new_high_year', 'sum'),
-            first_close=('Close', 'first'),
-            last_close=('Close', 'last')
-        )
-        yearly_data['yearly_return_pct'] = 100.0 * (yearly_data['last_close'] / yearly_data['first_close'] - 1)
-        yearly_data.reset_index(inplace=True)
-
-        return asset_data, yearly_data
+            return None, stale
+
+        # Il calcolo viene rifatto solo quando arriva una barra nuova
+        with timed('nuovi_massimi_anno', 'compute'):
+            key = series_key(ticker, interval)
+            return analytics_memo.get_or_compute('nuovi_massimi_anno', ticker, asset_data,
+                                                 lambda bars: compute_analytics(bars, key),
+                                                 params={'n_bars': n_bars, 'interval': interval.value}), stale
 
     except Exception as e:
         print(f"Errore nel recupero dati: {str(e)}")
-        return None
+        return None, False
 
 # ✅ Callback per aggiornare i grafici dopo la selezione del ticker
-def update_graphs(ticker):
+def update_graphs(ticker, interval_value=None):
+    return build_page(ticker, parse_interval(interval_value))[0]
+
+def build_page(ticker, interval, policy=FRESH):
+    """ Grafici della pagina, barre scadute (True se disegnati con le barre salvate in attesa
+    dell'aggiornamento) e dati usati per disegnarli (None se non ci sono). """
     if not ticker:
-        return go.Figure(), go.Figure(), go.Figure(), go.Figure()
+        return (empty_figure(), empty_figure(), empty_figure(), empty_figure()), False, None
 
-    data = get_asset_data(ticker)
+    report_progress(f"📡 Recupero dati di {ticker}...")
+    data, stale = load_asset_data(ticker, interval, policy)
 
     if data is None:
-        return go.Figure(), go.Figure(), go.Figure(), go.Figure()
+        # Riconvalida senza dati: restano i grafici già mostrati (stale-if-error)
+        return (empty_figure(), empty_figure(), empty_figure(), empty_figure()), stale or policy == REVALIDATE, None
+
+    # Contano solo i ticker con dati: i ticker incompleti digitati nella ricerca non vanno precaricati
+    if policy != REVALIDATE:
+        shared_cache.record_request(ticker)
+
+    report_progress("📊 Costruzione dei grafici...")
+    with timed('nuovi_massimi_anno', 'figure'):
+        return build_figures(data, ticker, interval), stale, data
+
+def update_page(ticker, interval_value):
+    """ Grafici, stato della modalità live (ultima barra disegnata) e della riconvalida.
+
+    Nella vista giornaliera le barre salvate scadute vengono disegnate subito e aggiornate
+    in background; la modalità live ha già il suo aggiornamento periodico.
+    """
+    interval = parse_interval(interval_value)
+    figures, stale, data = build_page(ticker, interval, FRESH if is_live(interval) else STALE_OK)
+    # Lo stato live viene dalle stesse barre dei grafici, così il timer riparte dall'ultima disegnata
+    return (*figures, live_state(ticker, interval, data[0]) if data is not None else None,
+            *stale_outputs(ticker, interval, stale))
+
+def extend_graphs(ticker, interval, state):
+    """ Modalità live: prezzo, nuovi massimi e conteggio delle sole barre confermate dopo l'ultima disegnata.
+
+    I grafici per anno (rendimento e scatter) restano quelli dell'ultimo caricamento completo.
+    """
+    data = get_asset_data(ticker, interval, refresh=True)
+    if data is None:
+        return None
+    df = data[0]
+    rows = new_rows(df, state)
+    if rows.empty:
+        return None
+    # Prezzo nella traccia 0, marcatori dei nuovi massimi nella traccia 1
+    highs = rows.loc[rows['is_new_high_year'], 'Close']
+    extensions = [extend_data(rows['Close'], highs), extend_data(rows['new_high_count_year'])]
+    return extensions, live_state(ticker, interval, df)
 
+def build_figures(data, ticker, interval=Interval.in_daily):
+    """ Grafici dei nuovi massimi, del loro conteggio e del rendimento annuo. """
     df, yearly_data = data
+    df = confirmed(df, interval)
+    if is_live(interval):
+        ticker = f"{ticker} ({interval_label(interval)})"
+
+    # In modalità live prezzo, massimi e conteggio restano liste: extendData non accoda agli array base64
+    typed = not is_live(interval)
+    highs = df.loc[df['is_new_high_year'], 'Close']
 
     # 🔹 Grafico massimi annuali
-    nuovi_massimi_fig = go.Figure()
-    nuovi_massimi_fig.add_trace(go.Scatter(
-        x=df.index, y=df['Close'], mode='lines', name='Prezzo', line=dict(color='blue')))
-    nuovi_massimi_fig.add_trace(go.Scatter(
-        x=df.index[df['is_new_high_year']],
-        y=df.loc[df['is_new_high_year'], 'Close'],
-        mode='markers', marker=dict(color='red', size=5), name='Nuovi Massimi Anno'))
-    nuovi_massimi_fig.update_layout(title=f"{ticker} Nuovi Massimi Annuali",
-                                    xaxis_title="Anno", yaxis_title="Prezzo",
-                                    height=500, paper_bgcolor='#121212',
-                                    plot_bgcolor='#121212', font=dict(color='white'))
+    nuovi_massimi_fig = figure(
+        [trace('scatter', df.index, df['Close'], 'Prezzo', typed, mode='lines', line={'color': 'blue'}),
+         trace('scatter', highs.index, highs, 'Nuovi Massimi Anno', typed, mode='markers',
+               marker={'color': 'red', 'size': 5})],
+        f"{ticker} Nuovi Massimi Annuali", "Anno", "Prezzo", dates=True)
 
     # 🔹 Grafico contatore nuovi massimi
-    contatore_massimi_fig = go.Figure()
-    contatore_massimi_fig.add_trace(go.Scatter(
-        x=df.index, y=df['new_high_count_year'], mode='lines', name="Conteggio Nuovi Massimi", line=dict(color='orange')))
-    contatore_massimi_fig.update_layout(title="Conteggio Nuovi Massimi per Anno",
-                                        xaxis_title="Anno", yaxis_title="Conteggio",
-                                        height=500, paper_bgcolor='#121212',
-                                        plot_bgcolor='#121212', font=dict(color='white'))
+    contatore_massimi_fig = figure(
+        [trace('scatter', df.index, df['new_high_count_year'], "Conteggio Nuovi Massimi", typed, mode='lines',
+               line={'color': 'orange'})],
+        "Conteggio Nuovi Massimi per Anno", "Anno", "Conteggio", dates=True)
 
     # 🔹 Grafico rendimento annuo
-    rendimento_annuo_fig = go.Figure(data=[
-        go.Bar(x=yearly_data['year'], y=yearly_data['yearly_return_pct'], name="Rendimento Annuo", marker_color='green')
-    ])
-    rendimento_annuo_fig.update_layout(title=f"{ticker} Rendimento Annuo (%)",
-                                       xaxis_title="Anno", yaxis_title="Rendimento (%)",
-                                       height=500, paper_bgcolor='#121212',
-                                       plot_bgcolor='#121212', font=dict(color='white'))
+    rendimento_annuo_fig = figure(
+        [trace('bar', yearly_data['year'], yearly_data['yearly_return_pct'], "Rendimento Annuo", marker={'color': 'green'})],
+        f"{ticker} Rendimento Annuo (%)", "Anno", "Rendimento (%)")
 
     # 🔹 Scatter nuovi massimi vs rendimento annuo
-    scatter_fig = go.Figure()
     colors = ['red' if r < 0 else 'green' for r in yearly_data['yearly_return_pct']]
-    scatter_fig.add_trace(go.Scatter(
-        x=yearly_data['number_of_new_highs'],
-        y=yearly_data['yearly_return_pct'],
-        mode='markers',
-        marker=dict(color=colors, size=8),
-        name="Dati Storici"
-    ))
-    scatter_fig.add_hline(y=0, line_dash="dash", line_color="black")
-    scatter_fig.update_layout(title=f"{ticker}: Nuovi Massimi vs Rendimento Annuo",
-                              xaxis_title="Numero di Nuovi Massimi",
-                              yaxis_title="Rendimento (%)",
-                              height=500, paper_bgcolor='#121212',
-                              plot_bgcolor='#121212', font=dict(color='white'))
+    scatter_fig = figure(
+        [trace('scatter', yearly_data['number_of_new_highs'], yearly_data['yearly_return_pct'], "Dati Storici",
+               mode='markers', marker={'color': colors, 'size': 8})],
+        f"{ticker}: Nuovi Massimi vs Rendimento Annuo", "Numero di Nuovi Massimi", "Rendimento (%)",
+        lines=[hline(0, 'black')])
 
     return nuovi_massimi_fig, contatore_massimi_fig, rendimento_annuo_fig, scatter_fig
 
-# ✅ Funzione per registrare i callback nel server principale
-def register_callbacks(app):
-    """ Registra i callback dell'analisi dei nuovi massimi nell'app principale """
-    app.callback(
-        [dd.Output('grafico-nuovi-massimi', 'figure'),
-         dd.Output('grafico-contatore-massimi', 'figure'),
-         dd.Output('grafico-rendimento-annuo', 'figure'),
-         dd.Output('grafico-scatter', 'figure')],
-        [dd.Input('selected-ticker', 'value')]
-    )(update_graphs)
+def revalidate_page(ticker, interval):
+    """ Grafici aggiornati dalla sorgente per la riconvalida (vedi rivalidazione). """
+    figures, stale, _ = build_page(ticker, interval, REVALIDATE)
+    return figures, stale
 
 if __name__ == '__main__':
     import argparse
@@ -165,11 +231,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     if args.worker:
-        # Modalità worker: mantiene il processo in esecuzione
-        import time
-        while True:
-            time.sleep(1)
+        # Modalità worker: aggiorna le barre e precalcola le analisi dei ticker più usati
+        from prefetch import run_worker
+        run_worker('nuovi_massimi_anno', get_asset_data, N_BARS)
     else:
-        # Modalità normale: avvia il server
-        port = int(os.environ.get("PORT", 5000))
-        app.run_server(host='0.0.0.0', port=port)
+        # Modalità normale: avvia il server con la sola pagina, la ricerca e i suoi callback
+        from pagine import run_standalone_page
+        run_standalone_page('/nuovimaxanno')
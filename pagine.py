@@ -0,0 +1,186 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+import dash.dependencies as dd
+
+from lavori import register_background_callback
+from modalita_live import register_live_callbacks
+from rivalidazione import register_revalidation, stale_page_outputs
+
+# Attesa massima dello screener in corso prima di avviarne un altro (secondi)
+SCREENER_LOCK_TIMEOUT = int(os.environ.get("SCREENER_LOCK_TIMEOUT", 1800))
+
+# Grafici delle pagine (gli stessi id dei loro layout)
+ASSET_GRAPHS = ['grafico-rendimento-annuale', 'grafico-zscore']
+VOLATILITY_GRAPHS = ['grafico-rendimento-giornaliero', 'grafico-rendimento-settimanale',
+                     'grafico-rendimento-mensile', 'grafico-volatilita']
+VOLATILITY_LIVE_GRAPHS = ['grafico-rendimento-giornaliero', 'grafico-volatilita']
+HIGHS_GRAPHS = ['grafico-nuovi-massimi', 'grafico-contatore-massimi', 'grafico-rendimento-annuo', 'grafico-scatter']
+HIGHS_LIVE_GRAPHS = ['grafico-nuovi-massimi', 'grafico-contatore-massimi']
+
+# Moduli delle pagine già importati da questo processo e tempo del loro import (secondi)
+PAGE_MODULES = {}
+PAGE_LOAD_TIMES = {}
+
+_pages_lock = threading.Lock()
+
+
+def load_page(module_name):
+    """ Modulo della pagina, importato alla prima richiesta della sua pagina o di un suo callback. """
+    module = PAGE_MODULES.get(module_name)
+    if module is None:
+        with _pages_lock:
+            module = PAGE_MODULES.get(module_name)
+            if module is None:
+                started = time.perf_counter()
+                module = importlib.import_module(module_name)
+                PAGE_LOAD_TIMES[module_name] = time.perf_counter() - started
+                print(f"⏱️ Pagina {module_name} caricata in {PAGE_LOAD_TIMES[module_name] * 1000:.0f} ms")
+                PAGE_MODULES[module_name] = module
+    return module
+
+
+def page_function(module_name, function_name, *bound):
+    """ Callback che importa la pagina solo alla prima chiamata e poi chiama function_name(*bound, *args). """
+    def call(*args):
+        return getattr(load_page(module_name), function_name)(*bound, *args)
+    return call
+
+
+def register_asset_callbacks(app):
+    """ Callback dell'analisi dei rendimenti """
+    # Il recupero dei dati e i calcoli girano in background, fuori dal worker web
+    register_background_callback(
+        app, 'rendimenti_asset', page_function('rendimenti_asset', 'update_page'),
+        [dd.Output(graph_id, 'figure') for graph_id in ASSET_GRAPHS] + stale_page_outputs('asset'),
+        [dd.Input('selected-ticker', 'value')]
+    )
+
+    # Stale-while-revalidate: le barre scadute vengono aggiornate dopo aver mostrato i grafici
+    register_revalidation(app, 'rendimenti_asset', 'asset', ASSET_GRAPHS,
+                          page_function('rendimenti_asset', 'revalidate_page'))
+
+
+def register_volatility_callbacks(app):
+    """ Callback dell'analisi della volatilità """
+    # Il recupero dei dati e i calcoli girano in background, fuori dal worker web
+    register_background_callback(
+        app, 'rendimenti_volatilita', page_function('rendimenti_volatilita', 'update_page'),
+        [dd.Output(graph_id, 'figure') for graph_id in VOLATILITY_GRAPHS]
+        + [dd.Output('volatilita-live-state', 'data')] + stale_page_outputs('volatilita'),
+        [dd.Input('selected-ticker', 'value'), dd.Input('volatilita-live-interval', 'value')]
+    )
+
+    # Stale-while-revalidate: le barre scadute vengono aggiornate dopo aver mostrato i grafici
+    register_revalidation(app, 'rendimenti_volatilita', 'volatilita', VOLATILITY_GRAPHS,
+                          page_function('rendimenti_volatilita', 'revalidate_page'),
+                          interval_id='volatilita-live-interval')
+
+    # Modalità live: il timer accoda ai grafici giornaliero e della volatilità solo le barre nuove
+    register_live_callbacks(app, 'volatilita', VOLATILITY_LIVE_GRAPHS,
+                            page_function('rendimenti_volatilita', 'extend_graphs'))
+
+    # Zoom: ogni grafico ricarica a piena risoluzione solo l'intervallo visibile
+    for graph_id in VOLATILITY_GRAPHS:
+        app.callback(
+            dd.Output(graph_id, 'figure', allow_duplicate=True),
+            [dd.Input(graph_id, 'relayoutData')],
+            [dd.State('selected-ticker', 'value'), dd.State('volatilita-live-interval', 'value')],
+            prevent_initial_call=True
+        )(page_function('rendimenti_volatilita', 'zoom_graph', graph_id))
+
+
+def register_highs_callbacks(app):
+    """ Callback dell'analisi dei nuovi massimi """
+    # Il recupero dei dati e i calcoli girano in background, fuori dal worker web
+    register_background_callback(
+        app, 'nuovi_massimi_anno', page_function('nuovi_massimi_anno', 'update_page'),
+        [dd.Output(graph_id, 'figure') for graph_id in HIGHS_GRAPHS]
+        + [dd.Output('massimi-live-state', 'data')] + stale_page_outputs('massimi'),
+        [dd.Input('selected-ticker', 'value'), dd.Input('massimi-live-interval', 'value')]
+    )
+
+    # Stale-while-revalidate: le barre scadute vengono aggiornate dopo aver mostrato i grafici
+    register_revalidation(app, 'nuovi_massimi_anno', 'massimi', HIGHS_GRAPHS,
+                          page_function('nuovi_massimi_anno', 'revalidate_page'),
+                          interval_id='massimi-live-interval')
+
+    # Modalità live: il timer accoda ai grafici del prezzo e del conteggio solo le barre nuove
+    register_live_callbacks(app, 'massimi', HIGHS_LIVE_GRAPHS, page_function('nuovi_massimi_anno', 'extend_graphs'))
+
+
+def register_screener_callbacks(app):
+    """ Callback dello screener dei nuovi massimi """
+    # Lo screener gira in background; un solo lavoro alla volta per tutti gli utenti
+    register_background_callback(
+        app, 'screener_massimi', page_function('screener_massimi', 'start_screener'),
+        [dd.Output('screener-day', 'data'),
+         dd.Output('screener-status', 'children')],
+        [dd.Input('screener-run', 'n_clicks')],
+        dedupe_key=lambda n_clicks: 'screener',
+        progress_id='screener-progress',
+        lock_timeout=SCREENER_LOCK_TIMEOUT
+    )
+
+    # All'apertura della pagina la tabella del giorno, se già calcolata, si carica senza rilanciare lo screener
+    app.callback(
+        dd.Output('screener-day', 'data', allow_duplicate=True),
+        [dd.Input('url', 'pathname')],
+        prevent_initial_call='initial_duplicate'
+    )(page_function('screener_massimi', 'cached_screener_day'))
+
+    app.callback(
+        [dd.Output('screener-table', 'data'),
+         dd.Output('screener-table', 'page_count')],
+        [dd.Input('screener-day', 'data'),
+         dd.Input('screener-table', 'page_current'),
+         dd.Input('screener-table', 'page_size'),
+         dd.Input('screener-table', 'sort_by')]
+    )(page_function('screener_massimi', 'update_table'))
+
+
+# Pagine dell'app: percorso -> (modulo, testo del link nella home, registrazione dei callback)
+PAGES = {
+    '/asset': ('rendimenti_asset', 'Analisi Asset', register_asset_callbacks),
+    '/volatilita': ('rendimenti_volatilita', 'Analisi Volatilità', register_volatility_callbacks),
+    '/nuovimaxanno': ('nuovi_massimi_anno', 'Nuovi Massimi nell anno', register_highs_callbacks),
+    '/screener': ('screener_massimi', 'Screener Nuovi Massimi', register_screener_callbacks),
+}
+
+
+def register_page_callbacks(app):
+    """ Registra i callback di tutte le pagine senza importarle.
+
+    Il browser scarica l'elenco dei callback una volta sola, all'apertura dell'app: vanno
+    quindi dichiarati tutti subito, in ogni worker. I moduli delle pagine (calcoli, grafici,
+    accesso ai dati) vengono importati solo alla prima visita della pagina o alla prima
+    chiamata di un suo callback.
+    """
+    for _, _, register in PAGES.values():
+        register(app)
+
+
+def run_standalone_page(path, search=True):
+    """ Avvia da sola la pagina `path` (python <pagina>.py) sull'app Dash del suo modulo.
+
+    Nell'app completa barra degli indirizzi, ricerca e callback della pagina li aggiunge
+    app.py: qui vanno registrati sull'app della pagina, altrimenti resta senza callback.
+    """
+    from dash import dcc, html
+    from ricerca import register_search_callbacks
+
+    module_name, _, register = PAGES[path]
+    # Il modulo avviato come script è __main__: i callback usano quello invece di importarne una seconda copia
+    module = PAGE_MODULES.setdefault(module_name, sys.modules['__main__'])
+    app = module.app
+    app.layout = html.Div([dcc.Location(id='url'), module.layout])
+    if search:
+        register_search_callbacks(app)
+    register(app)
+    # L'app della pagina è creata con server=False: le route di Dash vanno aggiunte al suo server Flask
+    app.init_app()
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,217 @@
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from metriche import inc, observe, register_gauge
+
+# Richieste al secondo verso la sorgente e richieste consecutive ammesse (token bucket condiviso dai processi)
+FETCH_RATE = float(os.environ.get("FETCH_RATE", 2))
+FETCH_BURST = float(os.environ.get("FETCH_BURST", 5))
+# Richieste in attesa ammesse per classe di priorità e attesa massima prima di rinunciare (secondi)
+FETCH_QUEUE_INTERACTIVE = int(os.environ.get("FETCH_QUEUE_INTERACTIVE", 32))
+FETCH_QUEUE_BACKGROUND = int(os.environ.get("FETCH_QUEUE_BACKGROUND", 64))
+FETCH_TIMEOUT_INTERACTIVE = float(os.environ.get("FETCH_TIMEOUT_INTERACTIVE", 30))
+FETCH_TIMEOUT_BACKGROUND = float(os.environ.get("FETCH_TIMEOUT_BACKGROUND", 600))
+# Nuovi tentativi dopo un errore, con attesa esponenziale (base, massimo) e jitter
+FETCH_MAX_RETRIES = int(os.environ.get("FETCH_MAX_RETRIES", 3))
+FETCH_BACKOFF_BASE = float(os.environ.get("FETCH_BACKOFF_BASE", 1))
+FETCH_BACKOFF_MAX = float(os.environ.get("FETCH_BACKOFF_MAX", 60))
+
+# Classi di priorità: le richieste delle pagine passano prima di quelle dei lavori di precaricamento
+INTERACTIVE = 'interattiva'
+BACKGROUND = 'background'
+
+STATE_KEY = 'pianificatore|stato'
+
+_priority = ContextVar('fetch_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def fetch_priority(priority):
+    """ Le richieste alla sorgente fatte dentro il blocco hanno la priorità indicata. """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class FetchRejected(RuntimeError):
+    """ Richiesta non eseguita: coda della sua classe piena o attesa oltre il limite. """
+
+
+class _LocalState:
+    """ Stato del pianificatore in memoria, se diskcache non è disponibile (limite per processo). """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    @contextmanager
+    def transact(self):
+        with self._lock:
+            yield self._values
+
+
+class _DiskState:
+    """ Stato nella cache su disco dei lavori: il limite vale per tutti i processi della macchina
+    (worker web, lavori in background e processi dello screener). """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @contextmanager
+    def transact(self):
+        with self.cache.transact():
+            values = self.cache.get(STATE_KEY) or {}
+            yield values
+            self.cache.set(STATE_KEY, values)
+
+
+class FetchScheduler:
+    """ Pianificatore delle richieste alla sorgente: token bucket, priorità, code limitate e backoff.
+
+    Ogni richiesta consuma un gettone; i gettoni si ricaricano a `rate` al secondo fino a
+    `burst`. Le richieste in background aspettano finché c'è una richiesta interattiva in coda.
+    Chi attende è registrato con la propria scadenza, così un processo terminato a metà
+    attesa (es. un lavoro annullato) non lascia la coda occupata. Dopo un errore tutti i
+    processi sospendono le richieste per un'attesa esponenziale con jitter, che cresce a
+    ogni errore consecutivo e si azzera al primo successo.
+    """
+
+    def __init__(self, rate=FETCH_RATE, burst=FETCH_BURST, state=None):
+        self.rate = rate
+        self.burst = burst
+        self.queue_limits = {INTERACTIVE: FETCH_QUEUE_INTERACTIVE, BACKGROUND: FETCH_QUEUE_BACKGROUND}
+        self.timeouts = {INTERACTIVE: FETCH_TIMEOUT_INTERACTIVE, BACKGROUND: FETCH_TIMEOUT_BACKGROUND}
+        self._state = state
+        self._state_lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _get_state(self):
+        if self._state is None:
+            with self._state_lock:
+                if self._state is None:
+                    from lavori import get_jobs_cache
+                    cache = get_jobs_cache()
+                    self._state = _DiskState(cache) if cache is not None else _LocalState()
+        return self._state
+
+    def _refill(self, state, now):
+        """ Ricarica i gettoni e scarta chi attendeva oltre la propria scadenza. """
+        updated = state.get('updated', now)
+        state['tokens'] = min(self.burst, state.get('tokens', self.burst) + (now - updated) * self.rate)
+        state['updated'] = now
+        waiters = state.setdefault('waiters', {})
+        for waiter in [waiter for waiter, (_, deadline) in waiters.items() if deadline < now]:
+            del waiters[waiter]
+
+    def _try_take(self, state, priority, now):
+        """ Prende un gettone (restituisce 0) oppure i secondi da attendere prima di riprovare. """
+        if state.get('blocked_until', 0) > now:
+            return state['blocked_until'] - now
+        if priority == BACKGROUND and any(p == INTERACTIVE for p, _ in state['waiters'].values()):
+            return 1 / self.rate
+        if state['tokens'] >= 1:
+            state['tokens'] -= 1
+            return 0
+        return (1 - state['tokens']) / self.rate
+
+    def acquire(self, priority=None):
+        """ Attende un gettone; restituisce i secondi di attesa o solleva FetchRejected. """
+        priority = priority or current_priority()
+        started = time.time()
+        deadline = started + self.timeouts[priority]
+        waiter = f"{os.getpid()}-{threading.get_ident()}-{next(self._ids)}"
+        state_store = self._get_state()
+        with state_store.transact() as state:
+            self._refill(state, started)
+            full = sum(p == priority for p, _ in state['waiters'].values()) >= self.queue_limits[priority]
+            if not full:
+                state['waiters'][waiter] = (priority, deadline)
+        if full:
+            inc('quant_fetch_rejected_total', priority=priority, reason='coda_piena')
+            raise FetchRejected(f"Troppe richieste {priority} in coda verso la sorgente")
+        try:
+            while True:
+                now = time.time()
+                with state_store.transact() as state:
+                    self._refill(state, now)
+                    state['waiters'][waiter] = (priority, deadline)
+                    wait = self._try_take(state, priority, now)
+                if wait == 0:
+                    observe('quant_fetch_wait_seconds', now - started, priority=priority)
+                    return now - started
+                if now + wait > deadline:
+                    inc('quant_fetch_rejected_total', priority=priority, reason='attesa')
+                    raise FetchRejected(f"Attesa oltre {self.timeouts[priority]:g}s per una richiesta {priority}")
+                # Si riprova un po' prima o dopo il momento stimato, per non svegliare tutti insieme
+                time.sleep(min(wait, 1.0) * random.uniform(0.8, 1.2))
+        finally:
+            with state_store.transact() as state:
+                state.setdefault('waiters', {}).pop(waiter, None)
+
+    def _record_failure(self):
+        """ Sospende le richieste di tutti i processi per l'attesa esponenziale dell'errore. """
+        with self._get_state().transact() as state:
+            failures = state.get('failures', 0)
+            delay = min(FETCH_BACKOFF_BASE * 2 ** failures, FETCH_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+            state['failures'] = failures + 1
+            state['blocked_until'] = max(state.get('blocked_until', 0), time.time() + delay)
+        return delay
+
+    def _record_success(self):
+        state_store = self._get_state()
+        with state_store.transact() as state:
+            state['failures'] = 0
+
+    def call(self, fn, *args, **kwargs):
+        """ Esegue fn(*args, **kwargs) quando il limite lo consente, ritentando dopo gli errori.
+
+        Solo le eccezioni contano come errori della sorgente (nuovi tentativi e backoff globale).
+        Un risultato None è "nessun dato" (ad esempio un simbolo inesistente): viene restituito
+        subito, senza nuovi tentativi e senza toccare il conteggio degli errori consecutivi.
+        """
+        priority = current_priority()
+        for attempt in range(FETCH_MAX_RETRIES + 1):
+            self.acquire(priority)
+            try:
+                result = fn(*args, **kwargs)
+            except TimeoutError:
+                # Nessuna sessione libera nel pool: non è un errore della sorgente
+                raise
+            except Exception as e:
+                delay = self._record_failure()
+                if attempt == FETCH_MAX_RETRIES:
+                    raise
+                inc('quant_fetch_retries_total', priority=priority)
+                print(f"Errore nella richiesta alla sorgente, nuovo tentativo tra almeno {delay:.1f}s: {str(e)}")
+                continue
+            if result is not None:
+                self._record_success()
+            return result
+
+    def stats(self):
+        """ Gettoni disponibili, richieste in coda per priorità, errori consecutivi e sospensione residua. """
+        now = time.time()
+        with self._get_state().transact() as state:
+            self._refill(state, now)
+            queued = {priority: sum(p == priority for p, _ in state['waiters'].values())
+                      for priority in (INTERACTIVE, BACKGROUND)}
+            return {'tokens': state['tokens'], 'queued': queued, 'failures': state.get('failures', 0),
+                    'blocked_for': max(state.get('blocked_until', 0) - now, 0.0)}
+
+
+# Pianificatore condiviso dalle sorgenti del processo
+fetch_scheduler = FetchScheduler()
+
+register_gauge('quant_fetch_queue_depth', lambda: [
+    ({'priority': priority}, depth) for priority, depth in fetch_scheduler.stats()['queued'].items()])
@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from archivio_barre import BAR_COLUMNS, bar_store
+from cache_barre import bar_cache
+
+# Piramidi tenute in memoria dal processo (oltre a quelle salvate nell'archivio)
+PYRAMID_CACHE = int(os.environ.get("PYRAMID_CACHE", 32))
+
+# Livelli della piramide: settimane (da lunedì), mesi e anni di calendario
+LEVELS = ('W', 'M', 'Y')
+# Colonne di ogni livello: OHLCV più prima chiusura, orario dell'ultima barra e numero di barre del periodo
+PYRAMID_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'first_close', 'last_time', 'count']
+
+
+def period_starts(times, level):
+    """ Inizio (ns) del periodo di calendario di ogni barra; times in ns, anche prima del 1970. """
+    moments = times.view('M8[ns]')
+    if level == 'W':
+        days = moments.astype('M8[D]').view('i8')
+        # Il 1° gennaio 1970 era un giovedì: (giorni + 3) % 7 è 0 il lunedì
+        return (days - (days + 3) % 7) * 86_400_000_000_000
+    unit = {'M': 'M8[M]', 'Y': 'M8[Y]'}[level]
+    return moments.astype(unit).astype('M8[ns]').view('i8')
+
+
+def aggregate(times, columns, level):
+    """ Barre del livello `level` da barre ordinate (times in ns, columns: array OHLCV). """
+    labels = period_starts(times, level)
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)] - 1
+    return {
+        'time': labels[starts],
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': columns['close'][ends],
+        'volume': np.add.reduceat(columns['volume'], starts),
+        'first_close': columns['close'][starts],
+        'last_time': times[ends],
+        'count': (ends - starts + 1).astype('i8'),
+    }
+
+
+class BarPyramid:
+    """ Barre settimanali, mensili e annuali di calendario ricavate una volta dalle barre di una serie.
+
+    All'arrivo di barre nuove si riaggrega solo l'ultimo periodo di ogni livello (al più un
+    anno di barre), e se la serie è stata accorciata in testa solo il primo. Se la storia
+    non si aggancia più (riscritta, rettificata o estesa all'indietro) la si ricostruisce.
+    """
+
+    def __init__(self):
+        self.levels = {}  # livello -> dict di array (time + PYRAMID_COLUMNS)
+        self.first_time = None
+        # Penultima barra usata: l'ultima può essere ancora in formazione e cambiare
+        self.check_time = None
+        self.check_close = None
+        self.last_bar = None  # (orario, chiusura) dell'ultima barra usata
+        self.changed = True  # piramide diversa da quella salvata
+
+    @staticmethod
+    def _columns(bars):
+        close = bars['close'].to_numpy(dtype='f8')
+        # Con le sole chiusure apertura, massimo e minimo del periodo vengono dalle chiusure e il volume è ignoto
+        missing = {'open': close, 'high': close, 'low': close, 'volume': np.full(len(close), np.nan)}
+        return {column: bars[column].to_numpy(dtype='f8') if column in bars else missing[column]
+                for column in BAR_COLUMNS}
+
+    def _build(self, times, columns):
+        self.levels = {level: aggregate(times, columns, level) for level in LEVELS}
+        self._mark(times, columns)
+
+    def _mark(self, times, columns):
+        self.first_time = int(times[0])
+        self.last_bar = (int(times[-1]), float(columns['close'][-1]))
+        self.check_time = int(times[-2]) if len(times) >= 2 else None
+        self.check_close = float(columns['close'][-2]) if len(times) >= 2 else None
+        self.changed = True
+
+    def update(self, bars):
+        """ Porta la piramide alle barre `bars` (DataFrame OHLCV ordinato). """
+        if bars is None or bars.empty:
+            return self
+        times = bars.index.values.astype('M8[ns]').view('i8')
+        columns = self._columns(bars)
+        if (not self.levels or self.check_time is None or len(times) < 2 or times[0] < self.first_time
+                or any(len(self.levels[level]['time']) < 3 for level in LEVELS)):
+            self._build(times, columns)
+            return self
+
+        position = int(np.searchsorted(times, self.check_time))
+        if position >= len(times) or times[position] != self.check_time or columns['close'][position] != self.check_close:
+            self._build(times, columns)
+            return self
+        if times[0] == self.first_time and (int(times[-1]), float(columns['close'][-1])) == self.last_bar:
+            return self
+
+        for level in LEVELS:
+            current = self.levels[level]
+            if times[0] > self.first_time:
+                current = self._trim_head(current, times, columns, level)
+            # Ultimo periodo riaggregato da capo: comprende le barre nuove e quella in formazione
+            start = int(np.searchsorted(times, current['time'][-1]))
+            tail = aggregate(times[start:], {k: v[start:] for k, v in columns.items()}, level)
+            self.levels[level] = {k: np.concatenate([current[k][:-1], tail[k]]) for k in current}
+        self._mark(times, columns)
+        return self
+
+    @staticmethod
+    def _trim_head(current, times, columns, level):
+        """ Toglie i periodi prima della nuova prima barra e riaggrega quello in cui cade. """
+        first_label = period_starts(times[:1], level)[0]
+        keep = int(np.searchsorted(current['time'], first_label))
+        current = {k: v[keep:] for k, v in current.items()}
+        end = int(np.searchsorted(times, current['time'][1])) if len(current['time']) > 1 else len(times)
+        head = aggregate(times[:end], {k: v[:end] for k, v in columns.items()}, level)
+        return {k: np.concatenate([head[k], current[k][1:]]) for k in current}
+
+    def level(self, level, since=None):
+        """ Barre del livello come DataFrame indicizzato dall'inizio del periodo; con `since`
+        solo i periodi che terminano da `since` in poi (compreso quello in cui cade). """
+        values = self.levels[level]
+        start = 0
+        if since is not None:
+            start = int(np.searchsorted(values['last_time'], pd.Timestamp(since).as_unit('ns').value))
+        frame = pd.DataFrame({column: values[column][start:] for column in PYRAMID_COLUMNS},
+                             index=pd.DatetimeIndex(values['time'][start:].view('M8[ns]'), name='datetime'))
+        frame['last_time'] = frame['last_time'].to_numpy().view('M8[ns]')
+        return frame
+
+    def to_state(self):
+        """ Stato come dict di array numpy (per np.savez). """
+        if not self.levels or self.check_time is None:
+            return {}
+        state = {'marks': np.array([self.first_time, self.check_time, self.last_bar[0]], dtype='i8'),
+                 'closes': np.array([self.check_close, self.last_bar[1]], dtype='f8')}
+        for level, values in self.levels.items():
+            state.update({f"{level}_{column}": array for column, array in values.items()})
+        return state
+
+    def load_state(self, state):
+        """ Riprende da uno stato salvato con to_state. """
+        if 'marks' not in state or any(f"{level}_time" not in state for level in LEVELS):
+            return False
+        self.first_time, self.check_time, last_time = (int(value) for value in state['marks'])
+        self.check_close = float(state['closes'][0])
+        self.last_bar = (last_time, float(state['closes'][1]))
+        self.levels = {level: {column: state[f"{level}_{column}"] for column in ['time'] + PYRAMID_COLUMNS}
+                       for level in LEVELS}
+        self.changed = False
+        return True
+
+
+_pyramids = OrderedDict()
+_pyramids_lock = threading.Lock()
+
+
+def get_pyramid(key, bars):
+    """ Piramide della serie `key` (una per simbolo e intervallo), aggiornata alle barre
+    dell'archivio, che contiene la storia più lunga richiesta da qualunque pagina.
+
+    Se l'archivio non è allineato a `bars` (serie arrivata dalla cache condivisa o più
+    recente) si usano le barre ricevute, con tutte le colonne OHLCV prese dalla cache in
+    memoria se `bars` ne ha solo alcune. Lo stato è salvato accanto alle barre.
+    """
+    stored, _ = bar_store.read(key)
+    if stored is not None and stored.index[-1] == bars.index[-1]:
+        source = stored
+    elif all(column in bars for column in BAR_COLUMNS):
+        source = bars
+    else:
+        source = bar_cache.get(key, len(bars))
+        if source is None or source.index[-1] != bars.index[-1]:
+            # Colonne mancanti: piramide usa e getta, da non salvare al posto di quella completa
+            return BarPyramid().update(bars)
+    with _pyramids_lock:
+        pyramid = _pyramids.pop(key, None)
+        if pyramid is None:
+            pyramid = BarPyramid()
+            state = bar_store.read_state(key, 'piramide')
+            if state is not None:
+                pyramid.load_state(state)
+        _pyramids[key] = pyramid
+        while len(_pyramids) > PYRAMID_CACHE:
+            _pyramids.popitem(last=False)
+
+        pyramid.update(source)
+        if pyramid.changed:
+            try:
+                bar_store.write_state(key, 'piramide', pyramid.to_state())
+                pyramid.changed = False
+            except OSError as e:
+                print(f"Errore nel salvataggio della piramide di {key[0]}: {str(e)}")
+    return pyramid
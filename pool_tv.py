@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Dimensione del pool e politica delle sessioni, configurabili da ambiente
+TV_POOL_SIZE = int(os.environ.get("TV_POOL_SIZE", 4))
+TV_POOL_TIMEOUT = float(os.environ.get("TV_POOL_TIMEOUT", 30))
+TV_SESSION_MAX_IDLE = float(os.environ.get("TV_SESSION_MAX_IDLE", 600))
+TV_USERNAME = os.environ.get("TV_USERNAME")
+TV_PASSWORD = os.environ.get("TV_PASSWORD")
+
+
+def _connect():
+    """ Apre una nuova sessione TradingView (login solo se sono configurate le credenziali). """
+    from tvDatafeed import TvDatafeed
+    if TV_USERNAME and TV_PASSWORD:
+        return TvDatafeed(TV_USERNAME, TV_PASSWORD)
+    return TvDatafeed()
+
+
+def _is_healthy(session, idle_seconds):
+    """ Una sessione rimasta ferma troppo a lungo o senza token viene ricreata. """
+    return idle_seconds < TV_SESSION_MAX_IDLE and bool(getattr(session, 'token', None))
+
+
+class TvSessionPool:
+    """ Pool di sessioni TvDatafeed condiviso dai callback del processo.
+
+    Le sessioni vengono aperte solo quando servono, fino a `size` in uso contemporaneo;
+    oltre quel limite i callback aspettano che una sessione torni libera. Prima di essere
+    prestata una sessione inattiva viene controllata, e una sessione che ha sollevato
+    un errore viene scartata e sostituita da una nuova alla richiesta successiva.
+    """
+
+    def __init__(self, size=TV_POOL_SIZE, factory=None, health_check=None, timeout=TV_POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._factory = factory or _connect
+        self._health_check = health_check or _is_healthy
+        self._idle = []  # (sessione, ultimo utilizzo)
+        self._open = 0
+        self._cond = threading.Condition()
+        self.created = 0
+        self.discarded = 0
+        self.borrowed = 0
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    session, last_used = self._idle.pop()
+                    if self._health_check(session, time.monotonic() - last_used):
+                        self.borrowed += 1
+                        return session
+                    self._open -= 1
+                    self.discarded += 1
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Nessuna sessione TradingView libera")
+                self._cond.wait(remaining)
+
+        # La connessione si apre fuori dal lock, per non bloccare gli altri callback
+        try:
+            session = self._factory()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+            self.borrowed += 1
+        return session
+
+    def _release(self, session, healthy):
+        with self._cond:
+            if healthy:
+                self._idle.append((session, time.monotonic()))
+            else:
+                self._open -= 1
+                self.discarded += 1
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        """ Presta una sessione; se il blocco solleva un'eccezione la sessione viene scartata. """
+        session = self._acquire()
+        healthy = False
+        try:
+            yield session
+            healthy = True
+        finally:
+            self._release(session, healthy)
+
+    def get_hist(self, *args, **kwargs):
+        """ tv.get_hist su una sessione del pool; se la sessione è caduta riprova con una nuova.
+
+        tvDatafeed restituisce None sia per un simbolo che non esiste sia quando la richiesta
+        fallisce. Un risultato vuoto da una sessione ancora valida (token presente) significa
+        "nessun dato": la sessione torna nel pool e non si riprova. Si riconnette, una sola
+        volta per richiesta, solo se la sessione ha sollevato un errore o ha perso il token.
+        """
+        for attempt in (1, 2):
+            try:
+                with self.session() as tv:
+                    bars = tv.get_hist(*args, **kwargs)
+                    if (bars is None or bars.empty) and not self._health_check(tv, 0):
+                        raise ConnectionError("sessione TradingView senza token")
+                    return bars
+            except TimeoutError:
+                raise
+            except Exception as e:
+                if attempt == 2:
+                    raise
+                print(f"Sessione TradingView non valida, riconnessione: {str(e)}")
+
+    def reset(self):
+        """ Scarta le sessioni inattive: le prossime richieste ne apriranno di nuove. """
+        with self._cond:
+            self._open -= len(self._idle)
+            self.discarded += len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        """ Sessioni aperte, inattive, create, scartate e prestiti totali. """
+        with self._cond:
+            return {'size': self.size, 'open': self._open, 'idle': len(self._idle), 'created': self.created,
+                    'discarded': self.discarded, 'borrowed': self.borrowed}
+
+
+# Pool condiviso da tutte le pagine del processo
+tv_pool = TvSessionPool()
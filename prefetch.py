@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from cache_condivisa import shared_cache
+
+# Ticker da tenere sempre caldi (es. "NASDAQ:AAPL,MIL:ENI") più i più richiesti dagli utenti
+WATCHLIST = [t.strip() for t in os.environ.get("WATCHLIST", "").split(",") if t.strip()]
+PREFETCH_TOP_N = int(os.environ.get("PREFETCH_TOP_N", 20))
+# Orari di esecuzione in UTC, dopo la chiusura dei mercati (es. "17:00,22:30")
+PREFETCH_TIMES = os.environ.get("PREFETCH_TIMES", "22:30")
+
+
+def tickers_to_prefetch():
+    """ Watchlist configurata seguita dai ticker più richiesti, senza duplicati. """
+    tickers = WATCHLIST + shared_cache.top_requested(PREFETCH_TOP_N)
+    return list(dict.fromkeys(tickers))
+
+
+def next_run(now=None, times=PREFETCH_TIMES):
+    """ Prossimo orario di esecuzione (UTC) tra quelli configurati. """
+    now = now or datetime.now(timezone.utc)
+    runs = []
+    for value in times.split(","):
+        hour, minute = (int(part) for part in value.strip().split(":"))
+        run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        runs.append(run if run > now else run + timedelta(days=1))
+    return min(runs)
+
+
+def run_prefetch(name, compute, n_bars=None):
+    """ Aggiorna le barre e precalcola le analisi del modulo per ogni ticker da precaricare.
+
+    Con n_bars le barre di tutti i ticker vengono prima aggiornate in blocco con
+    get_bars_many (una richiesta alla sorgente per l'intera lista). `compute` è la
+    get_asset_data del modulo: passa da get_bars (che a quel punto trova le barre in
+    cache) e salva i risultati nella cache condivisa, dove il primo utente li troverà già pronti.
+    """
+    tickers = tickers_to_prefetch()
+    print(f"[{name}] Precaricamento di {len(tickers)} ticker")
+    if n_bars and tickers:
+        from dati_storici import get_bars_many
+
+        start = time.perf_counter()
+        try:
+            loaded = get_bars_many(tickers, n_bars)
+            print(f"[{name}] Barre aggiornate per {len(loaded)} ticker su {len(tickers)} "
+                  f"({time.perf_counter() - start:.1f}s)")
+        except Exception as e:
+            print(f"[{name}] Errore nell'aggiornamento in blocco delle barre: {str(e)}")
+    for ticker in tickers:
+        start = time.perf_counter()
+        try:
+            result = compute(ticker)
+        except Exception as e:
+            result = None
+            print(f"[{name}] Errore nel precaricamento di {ticker}: {str(e)}")
+        status = "ok" if result is not None else "nessun dato"
+        print(f"[{name}] {ticker}: {status} ({time.perf_counter() - start:.1f}s)")
+
+
+def run_worker(name, compute, n_bars=None):
+    """ Ciclo del processo worker: un giro subito all'avvio, poi agli orari configurati.
+    Le richieste alla sorgente del worker passano dopo quelle delle pagine; senza cache
+    condivisa il worker termina subito con un errore. """
+    from metriche import flush as flush_metrics
+    from pianificatore import BACKGROUND, fetch_priority
+
+    # Senza Redis il worker avrebbe una cache tutta sua: nessun ticker richiesto dagli utenti
+    # da precaricare e risultati che le pagine web non vedrebbero mai
+    if not shared_cache.is_shared:
+        print(f"[{name}] Errore: cache condivisa non disponibile (REDIS_URL non impostata o Redis "
+              f"non raggiungibile), il precaricamento non servirebbe alle pagine. Uscita.")
+        sys.exit(1)
+
+    while True:
+        with fetch_priority(BACKGROUND):
+            run_prefetch(name, compute, n_bars)
+        # Il worker resta fermo fino al prossimo giro: le misure del giro vanno scritte subito
+        flush_metrics()
+        wake_up = next_run()
+        print(f"[{name}] Prossimo precaricamento: {wake_up.isoformat()}")
+        time.sleep(max((wake_up - datetime.now(timezone.utc)).total_seconds(), 0))
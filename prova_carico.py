@@ -0,0 +1,310 @@
+""" Prova di carico del server Dash con sessioni simulate e dati sintetici.
+
+Avvia gunicorn su app.py (con il fornitore sintetico al posto di TradingView) per ogni
+configurazione richiesta di worker, classe di worker e thread; N sessioni simulate
+navigano su una pagina, digitano nella ricerca e scelgono ticker passando da
+/_dash-update-component, come il browser. Per ogni configurazione riporta throughput
+e latenze p50/p95/p99 per tipo di richiesta; i risultati finiscono anche in un file JSON.
+
+Uso:
+    python prova_carico.py --sessions 20 --duration 60 --configs sync:2,gthread:2:4,gthread:4:8
+    python prova_carico.py --url http://127.0.0.1:5000 --sessions 10   (server già avviato)
+
+Le configurazioni sono classe:worker[:thread]; le classi gevent ed eventlet richiedono
+i rispettivi pacchetti installati. La configurazione scelta si applica al processo web del
+Procfile senza modificarlo, con le variabili lette da gunicorn: WEB_CONCURRENCY=4 e
+GUNICORN_CMD_ARGS="-k gthread --threads 8".
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES = ['/volatilita', '/asset', '/nuovimaxanno']
+# Output del primo grafico di ogni pagina, per riconoscerne il callback tra le dipendenze
+PAGE_GRAPHS = {'/volatilita': 'grafico-rendimento-giornaliero', '/asset': 'grafico-rendimento-annuale',
+               '/nuovimaxanno': 'grafico-nuovi-massimi'}
+
+
+def synthetic_server():
+    """ Fabbrica per gunicorn ("prova_carico:synthetic_server()"): app.py con dati sintetici. """
+    from dati_sintetici import install_synthetic_provider
+    install_synthetic_provider(delay=float(os.environ.get("SYNTHETIC_DELAY", 0)))
+    from app import server
+    return server
+
+
+def parse_output(output):
+    """ Output di una dipendenza Dash ("..a.b...c.d.." oppure "a.b") come lista di {id, property}. """
+    parts = output.strip(".").split("...") if output.startswith("..") else [output]
+    outputs = []
+    for part in parts:
+        component_id, prop = part.rsplit(".", 1)
+        outputs.append({'id': component_id, 'property': prop.split("@")[0]})
+    return outputs
+
+
+class DashClient:
+    """ Client HTTP di una sessione: chiama i callback come fa il renderer di Dash. """
+
+    def __init__(self, base_url, dependencies, poll_interval, timeout):
+        import requests
+        self.http = requests.Session()
+        self.base_url = base_url.rstrip("/")
+        self.dependencies = dependencies
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def find(self, output_fragment, inputs):
+        """ Il callback con quell'output che ha come input tutte le proprietà date. """
+        for dependency in self.dependencies:
+            names = {f"{i['id']}.{i['property']}" for i in dependency['inputs']}
+            if output_fragment in dependency['output'] and set(inputs) <= names:
+                return dependency
+        raise KeyError(output_fragment)
+
+    def call(self, output_fragment, inputs, state=None):
+        """ Esegue un callback; per quelli in background interroga il lavoro fino al risultato. """
+        dependency = self.find(output_fragment, inputs)
+        outputs = parse_output(dependency['output'])
+        body = {
+            'output': dependency['output'],
+            'outputs': outputs if len(outputs) > 1 or dependency['output'].startswith("..") else outputs[0],
+            'inputs': [{**i, 'value': inputs.get(f"{i['id']}.{i['property']}")} for i in dependency['inputs']],
+            'state': [{**s, 'value': (state or {}).get(f"{s['id']}.{s['property']}")} for s in dependency['state']],
+            'changedPropIds': [f"{i['id']}.{i['property']}" for i in dependency['inputs']
+                               if f"{i['id']}.{i['property']}" in inputs],
+        }
+        url = f"{self.base_url}/_dash-update-component"
+        response = self.http.post(url, json=body, timeout=self.timeout)
+        if response.status_code == 204:
+            return None
+        response.raise_for_status()
+        data = response.json()
+        deadline = time.monotonic() + self.timeout
+        while 'cacheKey' in data and 'response' not in data:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"lavoro in background oltre {self.timeout} s")
+            time.sleep(self.poll_interval)
+            response = self.http.post(f"{url}?cacheKey={data['cacheKey']}&job={data['job']}", json=body,
+                                      timeout=self.timeout)
+            if response.status_code == 204:
+                return None
+            response.raise_for_status()
+            polled = response.json()
+            data = {**data, **polled} if 'response' not in polled else polled
+        return data
+
+
+def run_session(client, tickers, stop_at, think_time, record, rng):
+    """ Una sessione: apre una pagina, cerca digitando lettera per lettera e sceglie un ticker. """
+    def timed(kind, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+            record(kind, time.perf_counter() - started, None)
+        except Exception as e:
+            record(kind, time.perf_counter() - started, str(e))
+
+    while time.monotonic() < stop_at:
+        page = rng.choice(PAGES)
+        timed('navigazione', lambda: client.call('page-content.children', {'url.pathname': page}))
+
+        ticker = tickers[min(int(rng.paretovariate(1.2)) - 1, len(tickers) - 1)]
+        symbol = ticker.split(":")[1]
+        for i in range(1, len(symbol) + 1):
+            timed('ricerca', lambda: client.call('search-dropdown.options',
+                                                 {'search-dropdown.search_value': symbol[:i]},
+                                                 {'search-dropdown.options': []}))
+            time.sleep(think_time / 4)
+
+        timed('selezione', lambda: client.call('ticker-store.data', {'search-dropdown.value': ticker},
+                                               {'search-dropdown.options': [], 'ticker-store.data': None}))
+        timed('grafici', lambda: client.call(PAGE_GRAPHS[page], {'selected-ticker.value': ticker}))
+        time.sleep(think_time)
+
+
+def run_load(base_url, sessions, duration, tickers, think_time, poll_interval, timeout, seed=0):
+    """ Esegue `sessions` sessioni per `duration` secondi e raccoglie latenze ed errori. """
+    import requests
+    dependencies = requests.get(f"{base_url}/_dash-dependencies", timeout=timeout).json()
+
+    samples = []
+    lock = threading.Lock()
+
+    def record(kind, seconds, error):
+        with lock:
+            samples.append((kind, seconds, error))
+
+    stop_at = time.monotonic() + duration
+    threads = []
+    started = time.perf_counter()
+    for i in range(sessions):
+        client = DashClient(base_url, dependencies, poll_interval, timeout)
+        rng = random.Random(seed + i)
+        thread = threading.Thread(target=run_session, args=(client, tickers, stop_at, think_time, record, rng),
+                                  daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed)
+
+
+def summarize(samples, elapsed):
+    """ Throughput e percentili delle latenze (ms), in totale e per tipo di richiesta. """
+    def stats(values, errors):
+        values = np.asarray(values)
+        if len(values) == 0:
+            return {'count': 0, 'errors': errors}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        return {'count': int(len(values)), 'errors': errors, 'throughput_rps': len(values) / elapsed,
+                'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': values.max() * 1000}
+
+    by_kind = {}
+    for kind, seconds, error in samples:
+        entry = by_kind.setdefault(kind, ([], []))
+        (entry[1] if error else entry[0]).append(error or seconds)
+    result = {'elapsed_s': elapsed,
+              'totale': stats([s for _, s, e in samples if not e], sum(1 for *_, e in samples if e))}
+    for kind, (values, errors) in sorted(by_kind.items()):
+        result[kind] = stats(values, len(errors))
+        if errors:
+            result[kind]['first_error'] = errors[0]
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(config, workdir, delay, timeout):
+    """ Avvia gunicorn con la configurazione classe:worker[:thread]; restituisce (processo, url). """
+    parts = config.split(":")
+    worker_class, workers = parts[0], parts[1] if len(parts) > 1 else "1"
+    threads = parts[2] if len(parts) > 2 else "1"
+    port = free_port()
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([REPO_DIR, os.environ.get('PYTHONPATH', '')]),
+           'BAR_STORE_DIR': os.path.join(workdir, "bar_store"), 'JOBS_CACHE_DIR': os.path.join(workdir, "jobs_cache"),
+           'SYNTHETIC_DELAY': str(delay), 'SEARCH_DEBUG': "0",
+           # Mai la cache condivisa vera: le barre sintetiche e i contatori dei ticker restano nel processo
+           'REDIS_URL': "memory://",
+           # Sorgente sintetica senza limiti di richieste (FETCH_RATE dall'ambiente se impostato)
+           'FETCH_RATE': os.environ.get('FETCH_RATE', "1000000"), 'FETCH_BURST': os.environ.get('FETCH_BURST', "1000000")}
+    command = [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}", "-k", worker_class,
+               "-w", workers, "--threads", threads, "--timeout", str(int(timeout) + 30),
+               "prova_carico:synthetic_server()"]
+    log = open(os.path.join(workdir, f"gunicorn-{config.replace(':', '_')}.log"), "w")
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    wait_ready(url, process, int(workers), timeout)
+    return process, url
+
+
+def wait_ready(url, process, workers, timeout):
+    """ Aspetta che il server risponda e scalda ogni worker (caricamento delle pagine). """
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn è terminato durante l'avvio")
+        try:
+            if requests.get(f"{url}/_dash-dependencies", timeout=5).ok:
+                break
+        except requests.RequestException:
+            time.sleep(0.2)
+    else:
+        raise TimeoutError("gunicorn non risponde")
+    # Le richieste finiscono su worker diversi: più richieste che worker, tutte prima della misura
+    for _ in range(workers * 4):
+        requests.get(f"{url}/_dash-dependencies", timeout=timeout)
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def print_result(config, result):
+    print(f"\n=== {config} ({result['elapsed_s']:.0f} s) ===")
+    print(f"{'richiesta':<12} {'n':>6} {'err':>4} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, stats in result.items():
+        if kind == 'elapsed_s' or not stats.get('count'):
+            continue
+        print(f"{kind:<12} {stats['count']:>6} {stats['errors']:>4} {stats['throughput_rps']:>7.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico con sessioni simulate")
+    parser.add_argument('--configs', default="sync:2,gthread:2:4",
+                        help="Configurazioni gunicorn classe:worker[:thread], separate da virgole")
+    parser.add_argument('--url', help="Server già avviato da provare (ignora --configs)")
+    parser.add_argument('--sessions', type=int, default=10, help="Sessioni simultanee")
+    parser.add_argument('--duration', type=float, default=30, help="Durata di ogni prova (secondi)")
+    parser.add_argument('--tickers', type=int, default=50, help="Ticker distinti scelti dalle sessioni")
+    parser.add_argument('--universe', type=int, default=20000, help="Righe dell'universo sintetico")
+    parser.add_argument('--think-time', type=float, default=1.0, help="Pausa dopo ogni ticker (secondi)")
+    parser.add_argument('--poll-interval', type=float, default=0.25, help="Intervallo di attesa dei lavori")
+    parser.add_argument('--delay', type=float, default=0.2, help="Latenza simulata di TradingView (secondi)")
+    parser.add_argument('--timeout', type=float, default=60, help="Timeout di una richiesta (secondi)")
+    parser.add_argument('--output', help="File JSON dei risultati")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    from dati_sintetici import synthetic_universe
+
+    workdir = tempfile.mkdtemp(prefix="quantrea-carico-")
+    universe = synthetic_universe(args.universe)
+    # Il server legge all_tickers.csv dalla sua cartella di lavoro
+    universe.to_csv(os.path.join(workdir, "all_tickers.csv"), index=False)
+    tickers = (universe['Exchange'] + ":" + universe['Ticker']).head(args.tickers).tolist()
+
+    results = {}
+    try:
+        for config in ([args.url] if args.url else args.configs.split(",")):
+            process = None
+            try:
+                if args.url:
+                    url = args.url
+                else:
+                    process, url = start_gunicorn(config, workdir, args.delay, args.timeout)
+                results[config] = run_load(url, args.sessions, args.duration, tickers, args.think_time,
+                                           args.poll_interval, args.timeout)
+                print_result(config, results[config])
+            except Exception as e:
+                print(f"Errore nella prova {config}: {str(e)}")
+            finally:
+                if process is not None:
+                    stop_gunicorn(process)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if results:
+        best = max(results, key=lambda c: results[c]['totale'].get('throughput_rps', 0))
+        print(f"\n✅ Throughput migliore: {best} "
+              f"({results[best]['totale'].get('throughput_rps', 0):.1f} richieste/s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'sessions': args.sessions, 'duration_s': args.duration, 'delay_s': args.delay,
+                       'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,24 @@
-import os
 import dash
 from dash import html, dcc
-import dash.dependencies as dd
-import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-from scipy.stats import zscore
-from tvDatafeed import TvDatafeed, Interval
-from ricerca import get_search_layout, register_search_callbacks
+from tvDatafeed import Interval
+from ricerca import get_search_layout
+from dati_storici import FRESH, REVALIDATE, STALE_OK, load_bars, series_key
+from cache_condivisa import shared_cache
+from memo_analisi import analytics_memo
+from lavori import report_progress
+from metriche import timed
+from piramide_barre import BarPyramid, get_pyramid
+from grafici import empty_figure, figure, hline, trace
+from rivalidazione import get_stale_layout, stale_outputs
+
+# Barre giornaliere richieste per l'analisi
+N_BARS = 50000
 
 # Inizializzazione dell'app Dash (Worker)
 app = dash.Dash(__name__, server=False)
 
-# Connessione a TradingView
-tv = TvDatafeed()
-
 # Layout della pagina per i rendimenti degli asset
 layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'padding': '20px'}, children=[
     html.H1("Analisi Rendimenti Asset", style={'textAlign': 'center', 'color': 'cyan'}),
@@ -28,6 +32,9 @@ layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'paddin
     # Messaggio di caricamento AJAX
     html.Div(id='loading-message', style={'color': 'yellow', 'marginTop': '10px', 'textAlign': 'center', 'display': 'none'}),
 
+    # Avviso dei dati salvati non aggiornati (fuori dallo spinner: i grafici restano visibili)
+    get_stale_layout('asset'),
+
     # Spinner di caricamento
     dcc.Loading(
         id="loading-spinner",
@@ -43,90 +50,113 @@ layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'paddin
 
 app.layout = layout
 
-# ✅ Registra i callback della ricerca direttamente nel worker
-register_search_callbacks(app)
+def compute_analytics(asset_data, key=None):
+    """ Rendimenti annuali, loro media, deviazione standard e z-score.
 
-# Funzione per ottenere i dati dello S&P 500 da TradingView
-def get_asset_data(ticker):
-    try:
-        if not ticker:
-            return None
+    Le chiusure annuali vengono dalla piramide delle barre della serie `key` (senza
+    chiave se ne costruisce una al momento dalle sole barre ricevute).
+    """
+    # scipy.stats costa circa un secondo all'avvio: viene importato solo al primo calcolo
+    from scipy.stats import zscore
 
-        exchange, symbol = ticker.split(":") if ":" in ticker else ("", ticker)
-        asset_data = tv.get_hist(symbol=symbol, exchange=exchange, interval=Interval.in_daily, n_bars=50000)
+    if not asset_data.index.is_monotonic_increasing:
+        asset_data = asset_data.sort_index()
+    pyramid = get_pyramid(key, asset_data) if key is not None else BarPyramid().update(asset_data)
 
-        if asset_data is None or asset_data.empty:
-            return None
+    # Rendimenti annuali
+    years = pyramid.level('Y', since=asset_data.index[0])
+    annual_data = pd.Series(years['close'].to_numpy(), index=pd.Index(years.index.year, name='Year'))
+    annual_data = annual_data.pct_change().dropna()
 
-        asset_data.index = pd.to_datetime(asset_data.index)
-        asset_data = asset_data.sort_index()
+    annualized_return = annual_data.mean()
+    annualized_std = annual_data.std()
+    annual_data_zscore = zscore(annual_data)
+
+    results = pd.DataFrame({
+        'Year': annual_data.index,
+        'Annual Return': annual_data.values,
+        'Z-Score': annual_data_zscore
+    })
+
+    return results, annualized_return, annualized_std
 
-        # Rendimenti annuali
-        asset_data['Year'] = asset_data.index.year
-        annual_data = asset_data.groupby('Year')['close'].last().pct_change().dropna()
-        annual_data = annual_data.squeeze()
+# Funzione per ottenere i dati dello S&P 500 da TradingView
+def load_asset_data(ticker, policy=FRESH):
+    """ Analisi del ticker e barre scadute, con la politica di caricamento `policy` (vedi dati_storici.load_bars). """
+    try:
+        if not ticker:
+            return None, False
 
-        annualized_return = annual_data.mean()
-        annualized_std = annual_data.std()
-        annual_data_zscore = zscore(annual_data)
+        with timed('rendimenti_asset', 'fetch'):
+            asset_data, stale = load_bars(ticker, N_BARS, Interval.in_daily, ['close'], policy)
 
-        results = pd.DataFrame({
-            'Year': annual_data.index,
-            'Annual Return': annual_data.values,
-            'Z-Score': annual_data_zscore
-        })
+        if asset_data is None or asset_data.empty:
+            return None, stale
 
-        return results, annualized_return, annualized_std
+        # Il calcolo viene rifatto solo quando arriva una barra nuova
+        with timed('rendimenti_asset', 'compute'):
+            key = series_key(ticker, Interval.in_daily)
+            return analytics_memo.get_or_compute('rendimenti_asset', ticker, asset_data,
+                                                 lambda bars: compute_analytics(bars, key),
+                                                 params={'n_bars': N_BARS}), stale
 
     except Exception as e:
         print(f"Errore nel recupero dati: {str(e)}")
-        return None
+        return None, False
+
+def get_asset_data(ticker):
+    return load_asset_data(ticker)[0]
 
 # ✅ Callback per aggiornare i grafici dopo la selezione del ticker
 def update_graphs(ticker):
+    return build_page(ticker)[0]
+
+def build_page(ticker, policy=FRESH):
+    """ Grafici della pagina e barre scadute (True se disegnati con le barre salvate in attesa dell'aggiornamento). """
     if not ticker:
-        return go.Figure(), go.Figure()
+        return (empty_figure(), empty_figure()), False
 
-    data = get_asset_data(ticker)
+    report_progress(f"📡 Recupero dati di {ticker}...")
+    data, stale = load_asset_data(ticker, policy)
 
     if data is None:
-        return go.Figure(), go.Figure()
+        # Riconvalida senza dati: restano i grafici già mostrati (stale-if-error)
+        return (empty_figure(), empty_figure()), stale or policy == REVALIDATE
+
+    # Contano solo i ticker con dati: i ticker incompleti digitati nella ricerca non vanno precaricati
+    if policy != REVALIDATE:
+        shared_cache.record_request(ticker)
+
+    report_progress("📊 Costruzione dei grafici...")
+    with timed('rendimenti_asset', 'figure'):
+        return build_figures(data, ticker), stale
 
+def update_page(ticker):
+    """ Grafici subito, anche con le barre salvate scadute, e stato della loro riconvalida in background. """
+    figures, stale = build_page(ticker, STALE_OK)
+    return (*figures, *stale_outputs(ticker, Interval.in_daily, stale))
+
+def build_figures(data, ticker):
+    """ Grafico dei rendimenti annuali e degli z-score. """
     results, annualized_return, annualized_std = data
 
-    rendimento_annuale_fig = go.Figure(data=[
-        go.Bar(x=results['Year'], y=results['Annual Return'] * 100, name="Rendimento Annuale", marker_color='blue')
-    ])
-    rendimento_annuale_fig.add_hline(y=annualized_return * 100, line_dash="dash", line_color="red",
-                                     annotation_text="Media", annotation_position="top right")
-    rendimento_annuale_fig.add_hline(y=(annualized_return + annualized_std) * 100, line_dash="dash", line_color="green")
-    rendimento_annuale_fig.add_hline(y=(annualized_return - annualized_std) * 100, line_dash="dash", line_color="green")
-
-    rendimento_annuale_fig.update_layout(title=f"Rendimento Annuale - {ticker}", xaxis_title="Anno",
-                                         yaxis_title="Rendimento (%)", height=500, paper_bgcolor='#121212',
-                                         plot_bgcolor='#121212', font=dict(color='white'))
-
-    zscore_fig = go.Figure(data=[
-        go.Scatter(x=results['Year'], y=results['Z-Score'], mode='lines+markers', name="Z-Score", line=dict(color='orange'))
-    ])
-    zscore_fig.add_hline(y=0, line_dash="dash", line_color="white")
-    zscore_fig.add_hline(y=1, line_dash="dash", line_color="gray")
-    zscore_fig.add_hline(y=-1, line_dash="dash", line_color="gray")
-
-    zscore_fig.update_layout(title=f"Z-Score dei Rendimenti - {ticker}", xaxis_title="Anno",
-                             yaxis_title="Z-Score", height=500, paper_bgcolor='#121212',
-                             plot_bgcolor='#121212', font=dict(color='white'))
+    rendimento_annuale_fig = figure(
+        [trace('bar', results['Year'], results['Annual Return'] * 100, "Rendimento Annuale", marker={'color': 'blue'})],
+        f"Rendimento Annuale - {ticker}", "Anno", "Rendimento (%)",
+        lines=[hline(annualized_return * 100, 'red', annotation="Media"),
+               hline((annualized_return + annualized_std) * 100, 'green'),
+               hline((annualized_return - annualized_std) * 100, 'green')])
+
+    zscore_fig = figure(
+        [trace('scatter', results['Year'], results['Z-Score'], "Z-Score", mode='lines+markers', line={'color': 'orange'})],
+        f"Z-Score dei Rendimenti - {ticker}", "Anno", "Z-Score",
+        lines=[hline(0, 'white'), hline(1, 'gray'), hline(-1, 'gray')])
 
     return rendimento_annuale_fig, zscore_fig
 
-# ✅ Funzione per registrare i callback nel server principale
-def register_callbacks(app):
-    """ Registra i callback dell'analisi dei rendimenti nell'app principale """
-    app.callback(
-        [dd.Output('grafico-rendimento-annuale', 'figure'),
-         dd.Output('grafico-zscore', 'figure')],
-        [dd.Input('selected-ticker', 'value')]
-    )(update_graphs)
+def revalidate_page(ticker, interval):
+    """ Grafici aggiornati dalla sorgente per la riconvalida (vedi rivalidazione). """
+    return build_page(ticker, REVALIDATE)
 
 if __name__ == '__main__':
     import argparse
@@ -135,11 +165,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     if args.worker:
-        # Modalità worker: mantiene il processo in esecuzione
-        import time
-        while True:
-            time.sleep(1)
+        # Modalità worker: aggiorna le barre e precalcola le analisi dei ticker più usati
+        from prefetch import run_worker
+        run_worker('rendimenti_asset', get_asset_data, N_BARS)
     else:
-        # Modalità normale: avvia il server
-        port = int(os.environ.get("PORT", 5000))
-        app.run_server(host='0.0.0.0', port=port)
+        # Modalità normale: avvia il server con la sola pagina, la ricerca e i suoi callback
+        from pagine import run_standalone_page
+        run_standalone_page('/asset')
@@ -1,21 +1,32 @@
-import os
 import dash
 from dash import html, dcc  # Modificato qui
-import dash.dependencies as dd
-import plotly.graph_objects as go
+from dash.exceptions import PreventUpdate
 import pandas as pd
 import numpy as np
-from tvDatafeed import TvDatafeed, Interval
-from ricerca import get_search_layout, register_search_callbacks
+from tvDatafeed import Interval
+from ricerca import get_search_layout
+from dati_storici import FRESH, LIVE, REVALIDATE, STALE_OK, load_bars, series_key
+from cache_condivisa import shared_cache
+from memo_analisi import analytics_memo
+from lavori import report_progress
+from metriche import timed
+from decimazione import CHART_MAX_POINTS, CHART_ZOOM_MAX_POINTS, decimate
+from grafici import empty_figure, figure, trace
+from statistiche_mobili import update_rolling_stats
+from piramide_barre import BarPyramid, get_pyramid
+from cache_barre import INTERVAL_SECONDS
+from modalita_live import (LIVE_N_BARS, confirmed, extend_data, get_live_layout, interval_label, is_live,
+                           live_state, new_rows, parse_interval)
+from rivalidazione import get_stale_layout, stale_outputs
+
+# Barre giornaliere richieste per l'analisi
+N_BARS = 100000
 
 
 
 # Inizializzazione dell'app Dash
 app = dash.Dash(__name__, server=False)
 
-# Connessione a TradingView
-tv = TvDatafeed()
-
 # Layout dell'app, ora usa la ricerca con selezione automatica
 layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'padding': '20px'}, children=[
     html.H1(" Analisi Volatilità Asset", style={'textAlign': 'center', 'color': 'cyan'}),
@@ -23,9 +34,15 @@ layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'paddin
     # Sezione di ricerca con valore selezionato
     get_search_layout(),
 
+    # Vista giornaliera o live su un intervallo intraday
+    get_live_layout('volatilita'),
+
     # Messaggio di caricamento AJAX
     html.Div(id='loading-message', style={'color': 'yellow', 'marginTop': '10px', 'textAlign': 'center', 'display': 'none'}),
 
+    # Avviso dei dati salvati non aggiornati (fuori dallo spinner: i grafici restano visibili)
+    get_stale_layout('volatilita'),
+
     # Spinner di caricamento
     dcc.Loading(
         id="loading-spinner",
@@ -60,81 +77,176 @@ layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'paddin
 
 app.layout = layout
 
+def compute_analytics(asset_data, key=None, periods_per_year=365):
+    """ Rendimenti giornalieri, settimanali e mensili e volatilità annualizzata a 30 giorni.
+
+    I rendimenti settimanali e mensili sono quelli delle settimane e dei mesi di calendario,
+    presi dalla piramide delle barre e messi sull'ultima barra di ogni periodo.
+    Con la chiave della serie nell'archivio la piramide e le statistiche mobili ripartono
+    dallo stato salvato accanto alle barre: si calcolano solo le barre arrivate dall'ultima volta.
+    """
+    if key is None:
+        pyramid = BarPyramid().update(asset_data)
+        asset_data['Rendimento_Giornaliero'] = asset_data['close'].pct_change()
+        asset_data['Volatilità_Giornaliera'] = asset_data['Rendimento_Giornaliero'].rolling(window=30).std() * np.sqrt(periods_per_year)
+    else:
+        pyramid = get_pyramid(key, asset_data)
+        stats = update_rolling_stats(key, 'rendimenti_volatilita', asset_data, sum_windows=(), std_windows=(30,))
+        asset_data['Rendimento_Giornaliero'] = stats['returns']
+        asset_data['Volatilità_Giornaliera'] = stats['std_30'] * np.sqrt(periods_per_year)
+
+    for column, level in (('Rendimento_Settimanale', 'W'), ('Rendimento_Mensile', 'M')):
+        periods = pyramid.level(level, since=asset_data.index[0])
+        returns = pd.Series(periods['close'].pct_change().to_numpy(), index=pd.DatetimeIndex(periods['last_time']))
+        asset_data[column] = returns.reindex(asset_data.index)
+    return asset_data
+
 # Funzione per ottenere i dati SOLO da TradingView
-def get_asset_data(ticker):
+def get_asset_data(ticker, interval=Interval.in_daily, refresh=False):
+    """ Barre e analisi del ticker; con refresh (modalità live) scarica subito le barre nuove. """
+    return load_asset_data(ticker, interval, LIVE if refresh else FRESH)[0]
+
+def load_asset_data(ticker, interval=Interval.in_daily, policy=FRESH):
+    """ Barre e analisi del ticker e barre scadute, con la politica di caricamento `policy` (vedi dati_storici.load_bars). """
     try:
         if not ticker:
-            return None
+            return None, False
 
-        exchange, symbol = ticker.split(":") if ":" in ticker else ("", ticker)
-        asset_data = tv.get_hist(symbol=symbol, exchange=exchange, interval=Interval.in_daily, n_bars=100000)
+        n_bars = LIVE_N_BARS if is_live(interval) else N_BARS
+        with timed('rendimenti_volatilita', 'fetch'):
+            asset_data, stale = load_bars(ticker, n_bars, interval, ['close'], policy)
 
         if asset_data is None or asset_data.empty:
-            return None
-
-        asset_data['Rendimento_Giornaliero'] = asset_data['close'].pct_change()
-        asset_data['Rendimento_Settimanale'] = asset_data['Rendimento_Giornaliero'].rolling(5).sum()
-        asset_data['Rendimento_Mensile'] = asset_data['Rendimento_Giornaliero'].rolling(22).sum()
-        asset_data['Volatilità_Giornaliera'] = asset_data['Rendimento_Giornaliero'].rolling(window=30).std() * np.sqrt(365)
+            return None, stale
 
-        return asset_data
+        # Il calcolo viene rifatto solo quando arriva una barra nuova
+        with timed('rendimenti_volatilita', 'compute'):
+            key = series_key(ticker, interval)
+            periods_per_year = 365 * 86400 / INTERVAL_SECONDS.get(interval.value, 86400)
+            return analytics_memo.get_or_compute('rendimenti_volatilita', ticker, asset_data,
+                                                 lambda bars: compute_analytics(bars, key, periods_per_year),
+                                                 params={'n_bars': n_bars, 'interval': interval.value}), stale
     except Exception as e:
         print(f"Errore nel recupero dati: {str(e)}")  # Aggiunto log dell'errore
-        return None
+        return None, False
+
+# Grafici della pagina: id, colonna, tipo di traccia, scala, titolo, nome della traccia, colore, assi
+CHARTS = [
+    ('grafico-rendimento-giornaliero', 'Rendimento_Giornaliero', 'bar', 100, "Rendimento Giornaliero",
+     "Rendimento Giornaliero", 'blue', "Anno", "Rendimento (%)"),
+    ('grafico-rendimento-settimanale', 'Rendimento_Settimanale', 'bar', 100, "Rendimento Settimanale",
+     "Rendimento Settimanale", 'green', "Anno", "Rendimento (%)"),
+    ('grafico-rendimento-mensile', 'Rendimento_Mensile', 'bar', 100, "Rendimento Mensile",
+     "Rendimento Mensile", 'orange', "Anno", "Rendimento (%)"),
+    ('grafico-volatilita', 'Volatilità_Giornaliera', 'line', 1, "Volatilità",
+     "Volatilità Annualizzata", 'red', "Data", "Volatilità"),
+]
+
+# In modalità live si accodano punti solo ai grafici per barra: settimana e mese in corso cambiano a ogni barra
+LIVE_CHARTS = [chart for chart in CHARTS if chart[1] in ('Rendimento_Giornaliero', 'Volatilità_Giornaliera')]
+
+def build_figure(chart, data, ticker, x_range=None, interval=Interval.in_daily):
+    """ Costruisce un grafico con al massimo CHART_MAX_POINTS punti; zoomato invia tutti i
+    punti visibili, fino a CHART_ZOOM_MAX_POINTS. """
+    _, column, kind, scale, title, trace_name, color, xaxis_title, yaxis_title = chart
+    # I rendimenti settimanali e mensili ci sono solo sull'ultima barra del periodo
+    series = data[column].dropna()
+    if x_range is not None:
+        series = series.loc[x_range[0]:x_range[1]]
+    max_points = CHART_MAX_POINTS if x_range is None else CHART_ZOOM_MAX_POINTS
+    x, y = decimate(series.index, series.to_numpy() * scale, kind, max_points)
+
+    # In modalità live le tracce restano liste: extendData non accoda agli array base64
+    typed = not is_live(interval)
+    if kind == 'bar':
+        data = trace('bar', x, y, trace_name, typed, marker={'color': color})
+    else:
+        # WebGL per le linee; le barre non hanno una variante WebGL
+        data = trace('scattergl', x, y, trace_name, typed, mode='lines', line={'color': color})
+    if is_live(interval):
+        title = f"{title} ({interval_label(interval)})"
+    return figure([data], f"{title} - {ticker}", xaxis_title, yaxis_title, dates=True, x_range=x_range,
+                  uirevision=ticker)
 
 # Callback per aggiornare automaticamente i grafici dopo la selezione del ticker
-def update_graphs(ticker):
+def update_graphs(ticker, interval_value=None):
+    return build_page(ticker, parse_interval(interval_value))[0]
+
+def build_page(ticker, interval, policy=FRESH):
+    """ Grafici della pagina, barre scadute (True se disegnati con le barre salvate in attesa
+    dell'aggiornamento) e dati usati per disegnarli (None se non ci sono). """
     if not ticker:
-        return go.Figure(), go.Figure(), go.Figure(), go.Figure()
+        return tuple(empty_figure() for _ in CHARTS), False, None
+
+    report_progress(f"📡 Recupero dati di {ticker}...")
+    data, stale = load_asset_data(ticker, interval, policy)
+
+    if data is None:
+        # Riconvalida senza dati: restano i grafici già mostrati (stale-if-error)
+        return tuple(empty_figure() for _ in CHARTS), stale or policy == REVALIDATE, None
+
+    # Contano solo i ticker con dati: i ticker incompleti digitati nella ricerca non vanno precaricati
+    if policy != REVALIDATE:
+        shared_cache.record_request(ticker)
+
+    report_progress("📊 Costruzione dei grafici...")
+    with timed('rendimenti_volatilita', 'figure'):
+        return tuple(build_figure(chart, confirmed(data, interval), ticker, interval=interval) for chart in CHARTS), stale, data
 
-    data = get_asset_data(ticker)
+def update_page(ticker, interval_value):
+    """ Grafici, stato della modalità live (ultima barra disegnata) e della riconvalida.
 
+    Nella vista giornaliera le barre salvate scadute vengono disegnate subito e aggiornate
+    in background; la modalità live ha già il suo aggiornamento periodico.
+    """
+    interval = parse_interval(interval_value)
+    figures, stale, data = build_page(ticker, interval, FRESH if is_live(interval) else STALE_OK)
+    # Lo stato live viene dalle stesse barre dei grafici, così il timer riparte dall'ultima disegnata
+    return (*figures, live_state(ticker, interval, data) if data is not None else None,
+            *stale_outputs(ticker, interval, stale))
+
+def extend_graphs(ticker, interval, state):
+    """ Modalità live: solo i punti delle barre confermate dopo l'ultima già disegnata. """
+    data = get_asset_data(ticker, interval, refresh=True)
+    if data is None:
+        return None
+    rows = new_rows(data, state)
+    if rows.empty:
+        return None
+    extensions = [extend_data(rows[chart[1]] * chart[3]) for chart in LIVE_CHARTS]
+    return extensions, live_state(ticker, interval, data)
+
+def zoom_range(relayout_data):
+    """ Intervallo visibile richiesto dallo zoom, 'full' per il ritorno alla vista completa, altrimenti None. """
+    if not relayout_data:
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return pd.Timestamp(relayout_data['xaxis.range[0]']), pd.Timestamp(relayout_data['xaxis.range[1]'])
+    if 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range']
+        return pd.Timestamp(start), pd.Timestamp(end)
+    if relayout_data.get('xaxis.autorange'):
+        return 'full'
+    return None
+
+def zoom_graph(graph_id, relayout_data, ticker, interval_value):
+    """ Callback dello zoom del grafico graph_id: rimanda il solo intervallo visibile a piena risoluzione. """
+    x_range = zoom_range(relayout_data)
+    if not ticker or x_range is None:
+        raise PreventUpdate
+    interval = parse_interval(interval_value)
+    # Lo zoom non aspetta la sorgente: usa le barre già mostrate, anche se in attesa dell'aggiornamento
+    data, _ = load_asset_data(ticker, interval, STALE_OK)
     if data is None:
-        return go.Figure(), go.Figure(), go.Figure(), go.Figure()
-
-    rendimento_giornaliero_fig = go.Figure(data=[
-        go.Bar(x=data.index, y=data['Rendimento_Giornaliero'] * 100, name="Rendimento Giornaliero", marker_color='blue')
-    ])
-    rendimento_giornaliero_fig.update_layout(title=f"Rendimento Giornaliero - {ticker}", xaxis_title="Anno",
-                                             yaxis_title="Rendimento (%)", height=500, paper_bgcolor='#121212',
-                                             plot_bgcolor='#121212', font=dict(color='white'))
-
-    rendimento_settimanale_fig = go.Figure(data=[
-        go.Bar(x=data.index, y=data['Rendimento_Settimanale'] * 100, name="Rendimento Settimanale", marker_color='green')
-    ])
-    rendimento_settimanale_fig.update_layout(title=f"Rendimento Settimanale - {ticker}", xaxis_title="Anno",
-                                             yaxis_title="Rendimento (%)", height=500, paper_bgcolor='#121212',
-                                             plot_bgcolor='#121212', font=dict(color='white'))
-
-    rendimento_mensile_fig = go.Figure(data=[
-        go.Bar(x=data.index, y=data['Rendimento_Mensile'] * 100, name="Rendimento Mensile", marker_color='orange')
-    ])
-    rendimento_mensile_fig.update_layout(title=f"Rendimento Mensile - {ticker}", xaxis_title="Anno",
-                                         yaxis_title="Rendimento (%)", height=500, paper_bgcolor='#121212',
-                                         plot_bgcolor='#121212', font=dict(color='white'))
-
-    volatilita_fig = go.Figure(data=[
-        go.Scatter(x=data.index, y=data['Volatilità_Giornaliera'], mode='lines', name="Volatilità Annualizzata",
-                   line=dict(color='red'))
-    ])
-    volatilita_fig.update_layout(title=f"Volatilità - {ticker}", xaxis_title="Data", yaxis_title="Volatilità",
-                                 height=500, paper_bgcolor='#121212', plot_bgcolor='#121212', font=dict(color='white'))
-
-    return rendimento_giornaliero_fig, rendimento_settimanale_fig, rendimento_mensile_fig, volatilita_fig
-
-# ✅ Funzione per registrare i callback nell'app principale (usata in app.py)
-def register_callbacks(app):
-    """ Registra i callback dell'analisi della volatilità nell'app principale """
-    app.callback(
-        [dd.Output('grafico-rendimento-giornaliero', 'figure'),
-         dd.Output('grafico-rendimento-settimanale', 'figure'),
-         dd.Output('grafico-rendimento-mensile', 'figure'),
-         dd.Output('grafico-volatilita', 'figure')],
-        [dd.Input('selected-ticker', 'value')]
-    )(update_graphs)  # Usa la funzione di aggiornamento dei grafici
-
-# Registra le funzioni di ricerca
-register_search_callbacks(app)
+        raise PreventUpdate
+    chart = next(chart for chart in CHARTS if chart[0] == graph_id)
+    return build_figure(chart, confirmed(data, interval), ticker, None if x_range == 'full' else x_range,
+                        interval)
+
+def revalidate_page(ticker, interval):
+    """ Grafici aggiornati dalla sorgente per la riconvalida (vedi rivalidazione). """
+    figures, stale, _ = build_page(ticker, interval, REVALIDATE)
+    return figures, stale
 
 if __name__ == '__main__':
     import argparse
@@ -143,11 +255,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     if args.worker:
-        # Modalità worker: mantiene il processo in esecuzione
-        import time
-        while True:
-            time.sleep(1)
+        # Modalità worker: aggiorna le barre e precalcola le analisi dei ticker più usati
+        from prefetch import run_worker
+        run_worker('rendimenti_volatilita', get_asset_data, N_BARS)
     else:
-        # Modalità normale: avvia il server
-        port = int(os.environ.get("PORT", 5000))
-        app.run_server(host='0.0.0.0', port=port)
+        # Modalità normale: avvia il server con la sola pagina, la ricerca e i suoi callback
+        from pagine import run_standalone_page
+        run_standalone_page('/volatilita')
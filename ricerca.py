@@ -4,12 +4,229 @@ import dash.dependencies as dd
 from dash.exceptions import PreventUpdate
 import pandas as pd
 import dash
+import gzip
+import hashlib
+import json
+import os
+import threading
 from datetime import datetime
+from flask import Response, request
+from indice_ticker import SEARCH_MAX_RESULTS, TickerIndex
 
-def load_tickers_from_csv(path="all_tickers.csv"):
+TICKERS_CSV = "all_tickers.csv"
+
+# Con SEARCH_DEBUG=1 tornano le stampe di debug a ogni tasto premuto
+SEARCH_DEBUG = os.environ.get("SEARCH_DEBUG", "0") == "1"
+
+# Con SEARCH_CLIENTSIDE=1 la ricerca avviene nel browser sull'universo dei ticker scaricato una volta:
+# mentre si digita non parte nessuna richiesta al server
+SEARCH_CLIENTSIDE = os.environ.get("SEARCH_CLIENTSIDE", "0") == "1"
+SEARCH_UNIVERSE_URL = "/ricerca/universo.json"
+# Secondi per cui il browser riusa l'universo senza chiedere al server se è cambiato (poi risposta 304 se uguale)
+SEARCH_UNIVERSE_MAX_AGE = int(os.environ.get("SEARCH_UNIVERSE_MAX_AGE", 3600))
+
+# Indice di ricerca in memoria, ricostruito solo quando il CSV cambia
+_ticker_index = None
+_ticker_index_mtime = None
+_ticker_index_lock = threading.Lock()
+
+# Universo per la ricerca nel browser: (mtime del CSV, etag, JSON, JSON compresso con gzip)
+_universe_asset = None
+_universe_lock = threading.Lock()
+
+def load_tickers_from_csv(path=TICKERS_CSV):
     """ Carica il CSV con i ticker. """
     return pd.read_csv(path)
 
+# Ricerca nel browser: stessi livelli di rilevanza di TickerIndex (ticker esatto, prefisso del
+# ticker, prefisso di una parola della descrizione, sottostringa) sull'universo scaricato una volta
+CLIENTSIDE_SEARCH = """
+function(searchValue, currentOptions) {
+    const ricerca = window.quantRicerca = window.quantRicerca || {};
+    if (!ricerca.search) {
+        const lowerBound = function(keys, order, query) {
+            let low = 0, high = order.length;
+            while (low < high) {
+                const middle = (low + high) >> 1;
+                if (keys[order[middle]] < query) { low = middle + 1; } else { high = middle; }
+            }
+            return low;
+        };
+        const sortedRows = function(keys) {
+            return keys.map(function(_, row) { return row; }).sort(function(a, b) {
+                return keys[a] < keys[b] ? -1 : keys[a] > keys[b] ? 1 : a - b;
+            });
+        };
+        ricerca.load = function(url) {
+            ricerca.universe = ricerca.universe || fetch(url).then(function(response) {
+                if (!response.ok) { throw new Error(response.status); }
+                return response.json();
+            }).then(function(data) {
+                data.lowerTickers = data.tickers.map(function(t) { return t.toLowerCase(); });
+                data.lowerDescriptions = data.descriptions.map(function(d) { return d.toLowerCase(); });
+                data.tickerOrder = sortedRows(data.lowerTickers);
+                data.words = [];
+                data.wordRows = [];
+                data.lowerDescriptions.forEach(function(text, row) {
+                    new Set(text.match(/[\\p{L}\\p{N}_]+/gu) || []).forEach(function(word) {
+                        data.words.push(word);
+                        data.wordRows.push(row);
+                    });
+                });
+                data.wordOrder = sortedRows(data.words);
+                return data;
+            }).catch(function(error) {
+                ricerca.universe = null;
+                throw error;
+            });
+            return ricerca.universe;
+        };
+        ricerca.search = function(data, query) {
+            const results = [], seen = new Set();
+            const add = function(row) {
+                if (!seen.has(row)) {
+                    seen.add(row);
+                    const exchange = data.exchanges[data.exchange[row]];
+                    results.push({label: data.tickers[row] + ' - ' + data.descriptions[row] + ' (' + exchange + ')',
+                                  value: exchange + ':' + data.tickers[row]});
+                }
+                return results.length >= data.limit;
+            };
+            const prefix = function(keys, order, rows) {
+                for (let i = lowerBound(keys, order, query); i < order.length && keys[order[i]].startsWith(query); i++) {
+                    if (add(rows ? rows[order[i]] : order[i])) { return true; }
+                }
+                return false;
+            };
+            let position = lowerBound(data.lowerTickers, data.tickerOrder, query);
+            for (; position < data.tickerOrder.length && data.lowerTickers[data.tickerOrder[position]] === query; position++) {
+                if (add(data.tickerOrder[position])) { return results; }
+            }
+            if (prefix(data.lowerTickers, data.tickerOrder, null) || prefix(data.words, data.wordOrder, data.wordRows)) {
+                return results;
+            }
+            for (let row = 0; row < data.lowerTickers.length; row++) {
+                if ((data.lowerTickers[row].includes(query) || data.lowerDescriptions[row].includes(query)) && add(row)) {
+                    break;
+                }
+            }
+            return results;
+        };
+    }
+
+    const kept = currentOptions ? currentOptions.length : 0;
+    if (!searchValue && kept) {
+        return [currentOptions, "", "Mantenute " + kept + " opzioni correnti"];
+    }
+    if (!searchValue || searchValue.length < 3) {
+        return [kept ? currentOptions : [], "Digita almeno 3 caratteri per cercare...",
+                kept ? "Mantenute " + kept + " opzioni correnti" : "Ricerca: attendo 3+ caratteri"];
+    }
+    const query = searchValue.trim().toLowerCase();
+    return ricerca.load("%s").then(function(data) {
+        const options = query ? ricerca.search(data, query) : [];
+        if (!options.length) {
+            if (kept) {
+                return [currentOptions, "⚠️ Nessun nuovo risultato trovato.", "Mantenute " + kept + " opzioni correnti"];
+            }
+            return [[], "⚠️ Nessun risultato trovato.", "Nessun risultato per: " + searchValue];
+        }
+        return [options, "", "Trovati " + options.length + " risultati per: " + searchValue];
+    }).catch(function(error) {
+        return [currentOptions || [], "⚠️ Elenco dei ticker non disponibile (" + error.message + ")", ""];
+    });
+}
+""" % SEARCH_UNIVERSE_URL
+
+# Passaggi del ticker scelto (dropdown -> store -> campo del ticker) e del ticker digitato a mano
+CLIENTSIDE_STORE_SELECTED = """
+function(value) {
+    if (value === null || value === undefined) { throw window.dash_clientside.PreventUpdate; }
+    return [value, "Store aggiornato con: " + value];
+}
+"""
+CLIENTSIDE_SELECTED_TICKER = """
+function(storedValue) {
+    if (storedValue === null || storedValue === undefined) { throw window.dash_clientside.PreventUpdate; }
+    return [storedValue, "Ticker selezionato: " + storedValue, "Selected-ticker aggiornato con: " + storedValue];
+}
+"""
+CLIENTSIDE_MANUAL_INPUT = """
+function(manualValue) {
+    if (!manualValue) { throw window.dash_clientside.PreventUpdate; }
+    return [manualValue, "Store aggiornato manualmente con: " + manualValue];
+}
+"""
+
+def _csv_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def get_ticker_index(path=TICKERS_CSV):
+    """ Restituisce l'indice dei ticker, ricostruendolo se il CSV è stato modificato. """
+    global _ticker_index, _ticker_index_mtime
+    mtime = _csv_mtime(path)
+    if _ticker_index is not None and mtime == _ticker_index_mtime:
+        return _ticker_index
+    with _ticker_index_lock:
+        if _ticker_index is None or mtime != _ticker_index_mtime:
+            if mtime is None:
+                print(f"⚠️ File dei ticker non trovato: {path}")
+                _ticker_index = TickerIndex(pd.DataFrame(columns=['Ticker', 'Descrizione', 'Exchange']))
+            else:
+                _ticker_index = TickerIndex(load_tickers_from_csv(path))
+            _ticker_index_mtime = mtime
+    return _ticker_index
+
+def get_universe_asset(path=TICKERS_CSV):
+    """ Universo dei ticker per la ricerca nel browser: (etag, JSON, JSON compresso con gzip).
+
+    Colonne compatte (gli exchange una volta sola, poi un indice per riga), rigenerate
+    e ricompresse solo quando il CSV cambia.
+    """
+    global _universe_asset
+    mtime = _csv_mtime(path)
+    asset = _universe_asset
+    if asset is not None and asset[0] == mtime:
+        return asset[1:]
+    with _universe_lock:
+        if _universe_asset is None or _universe_asset[0] != mtime:
+            df = load_tickers_from_csv(path) if mtime is not None else pd.DataFrame(columns=['Ticker', 'Descrizione', 'Exchange'])
+            codes, exchanges = pd.factorize(df['Exchange'].fillna('').astype(str))
+            payload = json.dumps({
+                'limit': SEARCH_MAX_RESULTS,
+                'exchanges': exchanges.tolist(),
+                'tickers': df['Ticker'].fillna('').astype(str).tolist(),
+                'descriptions': df['Descrizione'].fillna('').astype(str).tolist(),
+                'exchange': codes.tolist(),
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            etag = hashlib.sha1(payload).hexdigest()[:16]
+            _universe_asset = (mtime, etag, payload, gzip.compress(payload, compresslevel=9, mtime=0))
+    return _universe_asset[1:]
+
+def serve_universe():
+    """ Universo dei ticker come risorsa statica: compresso se il browser accetta gzip, con ETag e Cache-Control. """
+    etag, payload, compressed = get_universe_asset()
+    use_gzip = 'gzip' in request.accept_encodings
+    # La versione compressa è una rappresentazione diversa della risorsa: ha un suo etag
+    variant = f"{etag}-gz" if use_gzip else etag
+    headers = {'Cache-Control': f"public, max-age={SEARCH_UNIVERSE_MAX_AGE}", 'Vary': 'Accept-Encoding'}
+    if variant in request.if_none_match:
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(compressed if use_gzip else payload, mimetype='application/json', headers=headers)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(variant)
+    return response
+
+def debug_print(message):
+    """ Stampa di debug dei callback di ricerca, disattivabile con SEARCH_DEBUG=0. """
+    if SEARCH_DEBUG:
+        print(message)
+
 def get_search_layout():
     """ Layout con dropdown per la ricerca. """
     return html.Div([
@@ -39,7 +256,59 @@ def get_search_layout():
         html.Div(id='debug-selected-value', style={'color': 'orange', 'fontSize': '12px'})
     ], style={'textAlign': 'center', 'marginBottom': '20px'})
 
-def register_search_callbacks(app):
+def register_clientside_search(app):
+    """ Ricerca nel browser: l'universo è servito una volta come risorsa statica e filtrato da un
+    clientside_callback; anche i passaggi del ticker scelto restano nel browser, così al server
+    arrivano solo i callback delle pagine sul ticker selezionato. """
+    # La rotta è una sola per server anche se più app Dash lo condividono
+    if 'ricerca_universo' not in app.server.view_functions:
+        app.server.add_url_rule(SEARCH_UNIVERSE_URL, 'ricerca_universo', serve_universe)
+    get_universe_asset()
+
+    app.clientside_callback(
+        CLIENTSIDE_SEARCH,
+        [dd.Output('search-dropdown', 'options'),
+         dd.Output('search-status', 'children'),
+         dd.Output('debug-dropdown-value', 'children')],
+        [dd.Input('search-dropdown', 'search_value')],
+        [dd.State('search-dropdown', 'options')]
+    )
+    app.clientside_callback(
+        CLIENTSIDE_STORE_SELECTED,
+        [dd.Output('ticker-store', 'data'),
+         dd.Output('debug-store-value', 'children')],
+        [dd.Input('search-dropdown', 'value')],
+        prevent_initial_call=True
+    )
+    app.clientside_callback(
+        CLIENTSIDE_SELECTED_TICKER,
+        [dd.Output('selected-ticker', 'value'),
+         dd.Output('debug-info', 'children'),
+         dd.Output('debug-selected-value', 'children')],
+        [dd.Input('ticker-store', 'data')],
+        prevent_initial_call=True
+    )
+    app.clientside_callback(
+        CLIENTSIDE_MANUAL_INPUT,
+        [dd.Output('ticker-store', 'data', allow_duplicate=True),
+         dd.Output('debug-store-value', 'children', allow_duplicate=True)],
+        [dd.Input('selected-ticker', 'value')],
+        prevent_initial_call=True
+    )
+
+def register_search_callbacks(app, clientside=None):
+    """ Registra i callback della ricerca (una sola volta, sull'app principale).
+
+    Con clientside (di default SEARCH_CLIENTSIDE) la ricerca avviene nel browser,
+    altrimenti ogni tasto premuto interroga l'indice in memoria del server.
+    """
+    if SEARCH_CLIENTSIDE if clientside is None else clientside:
+        register_clientside_search(app)
+        return
+
+    # Indice costruito all'avvio, non alla prima ricerca
+    get_ticker_index()
+
     @app.callback(
         [dd.Output('search-dropdown', 'options'),
          dd.Output('search-status', 'children'),
@@ -49,39 +318,34 @@ def register_search_callbacks(app):
     )
     def update_dropdown_options(search_value, current_options):
         ctx = dash.callback_context
-        print(f"\n🔍 DEBUG update_dropdown_options - Timestamp: {datetime.now()}")
-        print(f"🔍 DEBUG update_dropdown_options - Trigger completo: {ctx.triggered}")
-        print(f"🔍 DEBUG update_dropdown_options - search_value: {search_value}")
-        print(f"🔍 DEBUG update_dropdown_options - opzioni correnti: {len(current_options) if current_options else 0}")
+        debug_print(f"\n🔍 DEBUG update_dropdown_options - Timestamp: {datetime.now()}")
+        debug_print(f"🔍 DEBUG update_dropdown_options - Trigger completo: {ctx.triggered}")
+        debug_print(f"🔍 DEBUG update_dropdown_options - search_value: {search_value}")
+        debug_print(f"🔍 DEBUG update_dropdown_options - opzioni correnti: {len(current_options) if current_options else 0}")
         
         # Se non c'è valore di ricerca e abbiamo già delle opzioni, le manteniamo
         if not search_value and current_options:
-            print("🔄 DEBUG: Mantengo le opzioni correnti")
+            debug_print("🔄 DEBUG: Mantengo le opzioni correnti")
             return current_options, "", f"Mantenute {len(current_options)} opzioni correnti"
         
         # Se il valore di ricerca è troppo corto ma abbiamo opzioni, le manteniamo
         if search_value and len(search_value) < 3 and current_options:
-            print("🔄 DEBUG: Mantengo le opzioni durante la digitazione")
+            debug_print("🔄 DEBUG: Mantengo le opzioni durante la digitazione")
             return current_options, "Digita almeno 3 caratteri per cercare...", f"Mantenute {len(current_options)} opzioni correnti"
         
         # Se non abbiamo né ricerca valida né opzioni correnti
         if not search_value or len(search_value) < 3:
             return [], "Digita almeno 3 caratteri per cercare...", "Ricerca: attendo 3+ caratteri"
         
-        df = load_tickers_from_csv()
-        mask = (df['Ticker'].str.contains(search_value, case=False, na=False) |
-                df['Descrizione'].str.contains(search_value, case=False, na=False))
-        filtered_df = df[mask]
+        options = get_ticker_index().search(search_value)
         
-        if filtered_df.empty:
+        if not options:
             # Se non troviamo risultati ma abbiamo opzioni, manteniamo quelle
             if current_options:
-                print("🔄 DEBUG: Mantengo le opzioni - nessun nuovo risultato")
+                debug_print("🔄 DEBUG: Mantengo le opzioni - nessun nuovo risultato")
                 return current_options, "⚠️ Nessun nuovo risultato trovato.", f"Mantenute {len(current_options)} opzioni correnti"
             return [], "⚠️ Nessun risultato trovato.", f"Nessun risultato per: {search_value}"
         
-        options = [{'label': f"{row['Ticker']} - {row['Descrizione']} ({row['Exchange']})", 
-                    'value': f"{row['Exchange']}:{row['Ticker']}"} for _, row in filtered_df.iterrows()]
         return options, "", f"Trovati {len(options)} risultati per: {search_value}"
 
     @app.callback(
@@ -94,17 +358,17 @@ def register_search_callbacks(app):
     )
     def store_selected_value(value, current_options, current_store):
         ctx = dash.callback_context
-        print(f"\n💾 DEBUG store_selected_value - Timestamp: {datetime.now()}")
-        print(f"💾 DEBUG store_selected_value - Trigger completo: {ctx.triggered}")
-        print(f"💾 DEBUG store_selected_value - Tutti gli inputs: {ctx.inputs}")
-        print(f"💾 DEBUG store_selected_value - Tutti gli states: {ctx.states}")
-        print(f"💾 DEBUG store_selected_value - value ricevuto: {value}")
-        print(f"💾 DEBUG store_selected_value - tipo del value: {type(value)}")
-        print(f"💾 DEBUG store_selected_value - opzioni correnti: {len(current_options) if current_options else 0}")
-        print(f"💾 DEBUG store_selected_value - valore corrente store: {current_store}")
+        debug_print(f"\n💾 DEBUG store_selected_value - Timestamp: {datetime.now()}")
+        debug_print(f"💾 DEBUG store_selected_value - Trigger completo: {ctx.triggered}")
+        debug_print(f"💾 DEBUG store_selected_value - Tutti gli inputs: {ctx.inputs}")
+        debug_print(f"💾 DEBUG store_selected_value - Tutti gli states: {ctx.states}")
+        debug_print(f"💾 DEBUG store_selected_value - value ricevuto: {value}")
+        debug_print(f"💾 DEBUG store_selected_value - tipo del value: {type(value)}")
+        debug_print(f"💾 DEBUG store_selected_value - opzioni correnti: {len(current_options) if current_options else 0}")
+        debug_print(f"💾 DEBUG store_selected_value - valore corrente store: {current_store}")
         
         if value is None:
-            print("⚠️ DEBUG store_selected_value - PreventUpdate per value None")
+            debug_print("⚠️ DEBUG store_selected_value - PreventUpdate per value None")
             raise PreventUpdate
         return value, f"Store aggiornato con: {value}"
 
@@ -117,13 +381,13 @@ def register_search_callbacks(app):
     )
     def update_selected_ticker(stored_value):
         ctx = dash.callback_context
-        print(f"\n📝 DEBUG update_selected_ticker - Timestamp: {datetime.now()}")
-        print(f"📝 DEBUG update_selected_ticker - Trigger completo: {ctx.triggered}")
-        print(f"📝 DEBUG update_selected_ticker - stored_value: {stored_value}")
-        print(f"📝 DEBUG update_selected_ticker - tipo dello stored_value: {type(stored_value)}")
+        debug_print(f"\n📝 DEBUG update_selected_ticker - Timestamp: {datetime.now()}")
+        debug_print(f"📝 DEBUG update_selected_ticker - Trigger completo: {ctx.triggered}")
+        debug_print(f"📝 DEBUG update_selected_ticker - stored_value: {stored_value}")
+        debug_print(f"📝 DEBUG update_selected_ticker - tipo dello stored_value: {type(stored_value)}")
         
         if stored_value is None:
-            print("⚠️ DEBUG update_selected_ticker - PreventUpdate per stored_value None")
+            debug_print("⚠️ DEBUG update_selected_ticker - PreventUpdate per stored_value None")
             raise PreventUpdate
             
         return stored_value, f"Ticker selezionato: {stored_value}", f"Selected-ticker aggiornato con: {stored_value}"
@@ -136,12 +400,12 @@ def register_search_callbacks(app):
     )
     def handle_manual_input(manual_value):
         ctx = dash.callback_context
-        print(f"\n✍️ DEBUG handle_manual_input - Timestamp: {datetime.now()}")
-        print(f"✍️ DEBUG handle_manual_input - Trigger completo: {ctx.triggered}")
-        print(f"✍️ DEBUG handle_manual_input - manual_value: {manual_value}")
-        print(f"✍️ DEBUG handle_manual_input - tipo del manual_value: {type(manual_value)}")
+        debug_print(f"\n✍️ DEBUG handle_manual_input - Timestamp: {datetime.now()}")
+        debug_print(f"✍️ DEBUG handle_manual_input - Trigger completo: {ctx.triggered}")
+        debug_print(f"✍️ DEBUG handle_manual_input - manual_value: {manual_value}")
+        debug_print(f"✍️ DEBUG handle_manual_input - tipo del manual_value: {type(manual_value)}")
         
         if not manual_value:
-            print("⚠️ DEBUG handle_manual_input - PreventUpdate per manual_value vuoto")
+            debug_print("⚠️ DEBUG handle_manual_input - PreventUpdate per manual_value vuoto")
             raise PreventUpdate
         return manual_value, f"Store aggiornato manualmente con: {manual_value}"
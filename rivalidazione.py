@@ -0,0 +1,84 @@
+import dash.dependencies as dd
+from dash import dcc, html, no_update
+from dash.exceptions import PreventUpdate
+
+from lavori import register_background_callback
+from modalita_live import parse_interval
+
+# Avvisi della pagina mentre i grafici mostrano le barre salvate scadute
+STALE_MESSAGE = "🕒 Dati salvati non aggiornati: aggiornamento in corso..."
+STALE_ERROR_MESSAGE = "⚠️ Sorgente dati non raggiungibile: i grafici mostrano gli ultimi dati salvati"
+
+# Applica nel browser le figure riconvalidate, solo se ticker e intervallo sono ancora quelli della pagina
+CLIENTSIDE_APPLY_FRESH = """
+function(fresh, ticker, interval) {
+    if (!fresh || fresh.ticker !== ticker || (interval !== undefined && fresh.interval !== interval)) {
+        throw window.dash_clientside.PreventUpdate;
+    }
+    return fresh.figures;
+}
+"""
+
+
+def get_stale_layout(prefix):
+    """ Avviso dei dati scaduti, dati da riconvalidare e figure aggiornate della pagina `prefix`.
+
+    Va messo fuori da dcc.Loading: durante la riconvalida i grafici scaduti restano visibili.
+    """
+    return html.Div(style={'textAlign': 'center', 'marginTop': '10px'}, children=[
+        html.Span(id=f'{prefix}-stale-status', style={'color': 'orange'}),
+        dcc.Store(id=f'{prefix}-stale-state'),
+        dcc.Store(id=f'{prefix}-fresh-figures')
+    ])
+
+
+def stale_outputs(ticker, interval, stale):
+    """ Stato da riconvalidare e avviso della pagina; con dati aggiornati lo stato non cambia
+    (nessun lavoro di riconvalida) e l'avviso sparisce. """
+    if not stale:
+        return no_update, ""
+    return {'ticker': ticker, 'interval': interval.value}, STALE_MESSAGE
+
+
+def stale_page_outputs(prefix):
+    """ Output di stale_outputs per il callback principale della pagina. """
+    return [dd.Output(f'{prefix}-stale-state', 'data'), dd.Output(f'{prefix}-stale-status', 'children')]
+
+
+def register_revalidation(app, name, prefix, graph_ids, revalidate, interval_id=None):
+    """ Stale-while-revalidate della pagina `prefix`.
+
+    Quando il callback principale ha disegnato barre scadute (stato in `{prefix}-stale-state`)
+    un lavoro in background silenzioso chiama revalidate(ticker, interval), che restituisce
+    (figure di graph_ids, ancora scadute). Le figure aggiornate arrivano al browser in
+    `{prefix}-fresh-figures` e un callback clientside le mette nei grafici; se la sorgente
+    non risponde (stale-if-error) restano i grafici già mostrati con un avviso.
+    """
+    def run_revalidation(state):
+        if not state:
+            raise PreventUpdate
+        figures, stale = revalidate(state['ticker'], parse_interval(state['interval']))
+        if stale:
+            return None, STALE_ERROR_MESSAGE
+        return {**state, 'figures': list(figures)}, ""
+
+    register_background_callback(
+        app, f"{name}_riconvalida", run_revalidation,
+        [dd.Output(f'{prefix}-fresh-figures', 'data'),
+         dd.Output(f'{prefix}-stale-status', 'children', allow_duplicate=True)],
+        [dd.Input(f'{prefix}-stale-state', 'data')],
+        # Uno alla volta con gli altri lavori dello stesso ticker
+        dedupe_key=lambda state: state['ticker'] if state else None,
+        progress_id=None, prevent_initial_call=True
+    )
+
+    states = [dd.State('selected-ticker', 'value')]
+    if interval_id is not None:
+        states.append(dd.State(interval_id, 'value'))
+    app.clientside_callback(
+        CLIENTSIDE_APPLY_FRESH,
+        [dd.Output(graph_id, 'figure', allow_duplicate=True) for graph_id in graph_ids],
+        [dd.Input(f'{prefix}-fresh-figures', 'data')],
+        states,
+        prevent_initial_call=True
+    )
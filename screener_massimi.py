@@ -0,0 +1,194 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import dash
+from dash import html, dcc, dash_table
+from dash.exceptions import PreventUpdate
+import pandas as pd
+from tvDatafeed import Interval
+from ricerca import load_tickers_from_csv
+from dati_storici import get_bars_many
+from cache_condivisa import shared_cache
+from calcolo_massimi import new_highs_batch
+from lavori import get_jobs_cache, report_progress, PROGRESS_HIDDEN
+from pianificatore import BACKGROUND, fetch_priority
+from metriche import flush as flush_metrics
+
+# Parametri dello screener, configurabili da ambiente
+SCREENER_WORKERS = int(os.environ.get("SCREENER_WORKERS", os.cpu_count() or 2))
+SCREENER_CHUNK = int(os.environ.get("SCREENER_CHUNK", 50))
+SCREENER_N_BARS = int(os.environ.get("SCREENER_N_BARS", 300))
+SCREENER_RESULT_TTL = 86400
+PAGE_SIZE = 50
+
+COLUMNS = ['Ticker', 'Descrizione', 'Exchange', 'Nuovi Massimi', 'Rendimento YTD (%)', 'Ultima Chiusura']
+
+# Risultati del giorno già calcolati da questo processo
+_results = {}
+
+# Inizializzazione dell'app Dash (Worker)
+app = dash.Dash(__name__, server=False)
+
+# Layout della pagina dello screener
+layout = html.Div(style={'backgroundColor': '#121212', 'color': 'white', 'padding': '20px'}, children=[
+    html.H1("Screener Nuovi Massimi nell'Anno", style={'textAlign': 'center', 'color': 'cyan'}),
+
+    html.Div([
+        html.Button("Avvia screener", id='screener-run', n_clicks=0),
+        html.Div(id='screener-status', style={'color': 'yellow', 'marginTop': '10px'}),
+        # Avanzamento del lavoro in background
+        html.Div(id='screener-progress', style=PROGRESS_HIDDEN)
+    ], style={'textAlign': 'center', 'marginBottom': '20px'}),
+
+    # Giorno dei risultati mostrati
+    dcc.Store(id='screener-day'),
+
+    dcc.Loading(
+        id="loading-screener",
+        type="circle",
+        children=[
+            dash_table.DataTable(
+                id='screener-table',
+                columns=[{'name': c, 'id': c} for c in COLUMNS],
+                page_current=0,
+                page_size=PAGE_SIZE,
+                page_action='custom',
+                sort_action='custom',
+                sort_mode='single',
+                sort_by=[],
+                style_header={'backgroundColor': '#1e1e1e', 'color': 'white', 'fontWeight': 'bold'},
+                style_cell={'backgroundColor': '#121212', 'color': 'white', 'textAlign': 'left'}
+            )
+        ]
+    )
+])
+
+app.layout = layout
+
+def _load_chunk(tickers, n_bars, year):
+    """ Eseguita nei processi del pool: chiusure dell'anno `year` per un blocco di ticker,
+    scaricate con una sola richiesta in blocco alla sorgente, dopo quelle delle pagine. """
+    closes = {}
+    try:
+        with fetch_priority(BACKGROUND):
+            bars_by_ticker = get_bars_many(tickers, n_bars=n_bars, interval=Interval.in_daily,
+                                           columns=['close'])
+    except Exception as e:
+        print(f"Errore nel recupero dati del blocco di {len(tickers)} ticker: {str(e)}")
+        return closes
+    finally:
+        # I processi del pool terminano senza atexit: le misure delle richieste vanno scritte adesso
+        flush_metrics()
+    for ticker, bars in bars_by_ticker.items():
+        close = bars['close']
+        close = close[close.index.year == year]
+        if not close.empty:
+            closes[ticker] = close.copy()
+    return closes
+
+def _screener_key(day):
+    return f"screener:{day.date()}"
+
+def get_screener_results(day):
+    """ Tabella dello screener del giorno se già calcolata (qui o da un altro processo), altrimenti None.
+
+    Lo screener gira in un lavoro in background: la tabella arriva al worker web dalla cache
+    su disco dei lavori (stessa macchina) o dalla cache condivisa (altre macchine, con Redis).
+    """
+    key = _screener_key(day)
+    if key in _results:
+        return _results[key]
+    jobs_cache = get_jobs_cache()
+    table = jobs_cache.get(key) if jobs_cache is not None else None
+    if table is None:
+        table = shared_cache.get_object(key)
+    if table is not None:
+        _results.clear()
+        _results[key] = table
+    return table
+
+def run_screener(universe=None, day=None):
+    """ Nuovi massimi dell'anno in corso e rendimento YTD per tutto l'universo dei ticker.
+
+    Le barre vengono caricate da un pool di processi a blocchi di SCREENER_CHUNK ticker;
+    i conteggi sono calcolati in blocco con new_highs_batch. Il risultato vale per tutto
+    il giorno di borsa ed è salvato nella cache dei lavori e in quella condivisa.
+    """
+    day = (day or pd.Timestamp.now()).normalize()
+    table = get_screener_results(day)
+    if table is not None:
+        return table
+
+    universe = load_tickers_from_csv() if universe is None else universe
+    universe = universe.assign(value=universe['Exchange'].astype(str) + ':' + universe['Ticker'].astype(str))
+    tickers = universe['value'].drop_duplicates().tolist()
+    chunks = [tickers[i:i + SCREENER_CHUNK] for i in range(0, len(tickers), SCREENER_CHUNK)]
+
+    closes = {}
+    with ProcessPoolExecutor(max_workers=SCREENER_WORKERS) as pool:
+        for done, part in enumerate(pool.map(_load_chunk, chunks, repeat(SCREENER_N_BARS), repeat(day.year)), 1):
+            closes.update(part)
+            report_progress(f"📡 Caricati {min(done * SCREENER_CHUNK, len(tickers))} simboli su {len(tickers)}...")
+
+    if closes:
+        frame = pd.DataFrame(closes)
+        new_highs, yearly_return_pct = new_highs_batch(frame)
+        stats = pd.DataFrame({
+            'value': frame.columns,
+            'Nuovi Massimi': new_highs.iloc[-1].to_numpy(),
+            'Rendimento YTD (%)': yearly_return_pct.iloc[-1].round(2).to_numpy(),
+            'Ultima Chiusura': frame.ffill().iloc[-1].round(4).to_numpy()
+        })
+        table = universe.drop_duplicates('value').merge(stats, on='value')
+        table = table.sort_values('Nuovi Massimi', ascending=False)[COLUMNS].reset_index(drop=True)
+    else:
+        table = pd.DataFrame(columns=COLUMNS)
+
+    key = _screener_key(day)
+    jobs_cache = get_jobs_cache()
+    if jobs_cache is not None:
+        jobs_cache.set(key, table, expire=SCREENER_RESULT_TTL)
+    shared_cache.set_object(key, table, ttl=SCREENER_RESULT_TTL)
+    _results.clear()
+    _results[key] = table
+    return table
+
+# ✅ Callback per avviare lo screener
+def start_screener(n_clicks):
+    if not n_clicks:
+        raise PreventUpdate
+    day = pd.Timestamp.now().normalize()
+    try:
+        table = run_screener(day=day)
+    except Exception as e:
+        print(f"Errore nello screener: {str(e)}")
+        return dash.no_update, f"⚠️ Errore nello screener: {str(e)}"
+    return str(day.date()), f"{len(table)} simboli analizzati ({day.date()})"
+
+# ✅ Callback all'apertura della pagina: risultati di oggi se lo screener è già stato eseguito
+def cached_screener_day(pathname):
+    day = pd.Timestamp.now().normalize()
+    if get_screener_results(day) is None:
+        raise PreventUpdate
+    return str(day.date())
+
+# ✅ Callback per la pagina e l'ordinamento della tabella (lato server)
+def update_table(day, page_current, page_size, sort_by):
+    if not day:
+        raise PreventUpdate
+    table = get_screener_results(pd.Timestamp(day))
+    if table is None:
+        raise PreventUpdate
+
+    if sort_by:
+        table = table.sort_values(sort_by[0]['column_id'], ascending=sort_by[0]['direction'] == 'asc',
+                                  na_position='last')
+    start = page_current * page_size
+    page_count = max(-(-len(table) // page_size), 1)
+    return table.iloc[start:start + page_size].to_dict('records'), page_count
+
+if __name__ == '__main__':
+    # Avvia il server con la sola pagina dello screener e i suoi callback
+    from pagine import run_standalone_page
+    run_standalone_page('/screener', search=False)
@@ -0,0 +1,57 @@
+import threading
+
+
+class _Call:
+    """ Esecuzione in corso per una chiave: i thread in attesa ne condividono il risultato. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Coalescenza delle chiamate concorrenti con la stessa chiave.
+
+    Il primo thread che chiede una chiave esegue la funzione; quelli che arrivano
+    mentre è ancora in corso aspettano e ricevono lo stesso risultato (o la stessa
+    eccezione). I contatori dicono quante esecuzioni sono state risparmiate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """ Esecuzioni reali, chiamate servite da un'esecuzione già in corso e chiavi attive. """
+        with self._lock:
+            return {'executions': self.executions, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
@@ -0,0 +1,212 @@
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from archivio_barre import bar_store
+
+# Stati tenuti in memoria dal processo (oltre a quelli salvati nell'archivio)
+ROLLING_STATS_CACHE = int(os.environ.get("ROLLING_STATS_CACHE", 32))
+
+
+class RollingWindow:
+    """ Somma, media e varianza degli ultimi `size` valori, aggiornate in O(1) a ogni valore.
+
+    Media e somma dei quadrati degli scarti (m2) seguono Welford, con l'uscita del valore
+    più vecchio quando la finestra è piena. I NaN occupano un posto nella finestra ma non
+    entrano nelle somme: come in pandas (min_periods = finestra) il risultato è NaN
+    finché nella finestra ce n'è uno.
+    """
+
+    def __init__(self, size, values=()):
+        self.size = size
+        self.values = deque(maxlen=size)
+        self.count = 0  # valori non NaN nella finestra
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        for value in values:
+            self.push(value)
+
+    def _add(self, value):
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value):
+        if self.count == 1:
+            self.count, self.total, self.mean, self.m2 = 0, 0.0, 0.0, 0.0
+            return
+        self.count -= 1
+        self.total -= value
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (value - self.mean)
+
+    def push(self, value):
+        if len(self.values) == self.size and not math.isnan(self.values[0]):
+            self._remove(self.values[0])
+        self.values.append(value)
+        if not math.isnan(value):
+            self._add(value)
+
+    @property
+    def full(self):
+        return self.count == self.size
+
+    def sum(self):
+        return self.total if self.full else math.nan
+
+    def std(self):
+        """ Deviazione standard campionaria (ddof=1), come Series.rolling().std(). """
+        return math.sqrt(max(self.m2, 0.0) / (self.size - 1)) if self.full and self.size > 1 else math.nan
+
+    def copy(self):
+        return RollingWindow(self.size, self.values)
+
+
+class IncrementalRollingStats:
+    """ Rendimenti semplici di una serie di chiusure con somme e deviazioni standard mobili,
+    calcolati solo per le barre nuove.
+
+    Restano in memoria i risultati di tutte le barre tranne l'ultima, che può essere ancora
+    in formazione, e le finestre dopo l'ultima barra confermata: update() conferma le barre
+    arrivate nel frattempo e calcola l'ultima su una copia delle finestre. Se la serie non
+    si aggancia più allo stato (storia riscritta, rettificata o estesa all'indietro) si
+    ricalcola tutto con pandas. I risultati sono: 'returns', 'sum_<n>' e 'std_<n>'.
+    """
+
+    def __init__(self, sum_windows=(5, 22), std_windows=(30,)):
+        self.sum_windows = tuple(sum_windows)
+        self.std_windows = tuple(std_windows)
+        self.sizes = sorted(set(self.sum_windows + self.std_windows))
+        self.reset()
+
+    def reset(self):
+        self.last_time = None  # orario (ns) dell'ultima barra confermata
+        self.last_close = math.nan
+        self.outputs = None  # risultati delle barre confermate
+        self.windows = {}
+        self.changed = True  # stato diverso da quello salvato
+
+    @property
+    def names(self):
+        return (['returns'] + [f"sum_{size}" for size in self.sum_windows]
+                + [f"std_{size}" for size in self.std_windows])
+
+    def _row(self, windows, value):
+        """ Risultati di una barra con rendimento `value`, dopo averlo inserito nelle finestre. """
+        for window in windows.values():
+            window.push(value)
+        return ([value] + [windows[size].sum() for size in self.sum_windows]
+                + [windows[size].std() for size in self.std_windows])
+
+    def _full(self, times, close):
+        returns = pd.Series(close).pct_change()
+        outputs = {'returns': returns.to_numpy()}
+        for size in self.sum_windows:
+            outputs[f"sum_{size}"] = returns.rolling(size).sum().to_numpy()
+        for size in self.std_windows:
+            outputs[f"std_{size}"] = returns.rolling(size).std().to_numpy()
+
+        self.reset()
+        if len(close) >= 2:
+            committed = returns.to_numpy()[:-1]
+            self.windows = {size: RollingWindow(size, committed[-size:]) for size in self.sizes}
+            self.outputs = {name: values[:-1].copy() for name, values in outputs.items()}
+            self.last_time, self.last_close = int(times[-2]), float(close[-2])
+        return outputs
+
+    def update(self, times, close):
+        """ Risultati per tutte le barre (times in ns, ordinati): calcola solo quelle dopo lo stato. """
+        n = len(close)
+        if self.outputs is None or n <= 2 * self.sizes[-1]:
+            return self._full(times, close)
+
+        # Posizione dell'ultima barra confermata: deve esserci, con la stessa chiusura
+        position = int(np.searchsorted(times, self.last_time))
+        if position > n - 2 or times[position] != self.last_time or close[position] != self.last_close:
+            return self._full(times, close)
+        # Righe confermate che precedono l'inizio della serie richiesta (finestra di n barre che scorre)
+        dropped = len(self.outputs['returns']) - 1 - position
+        if dropped < 0:
+            return self._full(times, close)
+
+        self.changed = position < n - 2 or dropped > 0
+        if self.changed:
+            new_rows = np.array([self._row(self.windows, close[i] / close[i - 1] - 1)
+                                 for i in range(position + 1, n - 1)], dtype='f8').reshape(-1, len(self.names))
+            for j, name in enumerate(self.names):
+                self.outputs[name] = np.concatenate([self.outputs[name][dropped:], new_rows[:, j]])
+        if dropped:
+            # Come nel calcolo completo: la prima barra non ha rendimento e le finestre iniziali sono incomplete
+            self.outputs['returns'][0] = math.nan
+            for size in self.sum_windows:
+                self.outputs[f"sum_{size}"][:size] = math.nan
+            for size in self.std_windows:
+                self.outputs[f"std_{size}"][:size] = math.nan
+        self.last_time, self.last_close = int(times[n - 2]), float(close[n - 2])
+
+        # L'ultima barra su una copia delle finestre: alla prossima chiamata potrebbe essere cambiata
+        last = self._row({size: window.copy() for size, window in self.windows.items()},
+                         close[n - 1] / close[n - 2] - 1)
+        return {name: np.append(self.outputs[name], value) for name, value in zip(self.names, last)}
+
+    def to_state(self):
+        """ Stato come dict di array numpy (per np.savez). """
+        if self.outputs is None:
+            return {}
+        state = {'config': np.array(self.sum_windows + (0,) + self.std_windows, dtype='i8'),
+                 'last_time': np.array([self.last_time], dtype='i8'),
+                 'last_close': np.array([self.last_close], dtype='f8')}
+        state.update({f"out_{name}": values for name, values in self.outputs.items()})
+        state.update({f"win_{size}": np.array(window.values, dtype='f8') for size, window in self.windows.items()})
+        return state
+
+    def load_state(self, state):
+        """ Riprende da uno stato salvato con to_state (ignorato se di un'altra configurazione). """
+        config = np.array(self.sum_windows + (0,) + self.std_windows, dtype='i8')
+        if 'config' not in state or not np.array_equal(state['config'], config):
+            return False
+        self.last_time = int(state['last_time'][0])
+        self.last_close = float(state['last_close'][0])
+        self.outputs = {name: state[f"out_{name}"] for name in self.names}
+        # Le somme delle finestre si ricostruiscono dai valori: niente deriva numerica tra un salvataggio e l'altro
+        self.windows = {size: RollingWindow(size, state[f"win_{size}"]) for size in self.sizes}
+        self.changed = False
+        return True
+
+
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def update_rolling_stats(key, name, bars, sum_windows=(5, 22), std_windows=(30,)):
+    """ Statistiche mobili delle chiusure di `bars` (serie `key` dell'archivio), riprendendo
+    dallo stato `name` salvato accanto alle barre e salvando quello nuovo. """
+    with _engines_lock:
+        engine_key = (key, name, tuple(sum_windows), tuple(std_windows))
+        stats = _engines.pop(engine_key, None)
+        if stats is None:
+            stats = IncrementalRollingStats(sum_windows, std_windows)
+            state = bar_store.read_state(key, name)
+            if state is not None:
+                stats.load_state(state)
+        _engines[engine_key] = stats
+        while len(_engines) > ROLLING_STATS_CACHE:
+            _engines.popitem(last=False)
+
+        outputs = stats.update(bars.index.values.astype('M8[ns]').view('i8'), bars['close'].to_numpy(dtype='f8'))
+        # Se è cambiata solo l'ultima barra (ancora in formazione) lo stato salvato è ancora valido
+        if stats.changed:
+            try:
+                bar_store.write_state(key, name, stats.to_state())
+                stats.changed = False
+            except OSError as e:
+                print(f"Errore nel salvataggio delle statistiche mobili di {key[0]}: {str(e)}")
+    return outputs
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from archivio_barre import BAR_COLUMNS, BarStore
+
+KEY = ('NASDAQ:AAPL', '1D')
+
+
+def bars(start, n, close=None):
+    index = pd.date_range(start, periods=n, freq='D', name='datetime').astype('M8[ns]')
+    close = np.arange(n, dtype='f8') + 100 if close is None else np.asarray(close, dtype='f8')
+    return pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': 1e3},
+                        index=index)[BAR_COLUMNS]
+
+
+def generation_files(store):
+    return sorted(name for name in os.listdir(store._series_dir(KEY)) if name.startswith('close.'))
+
+
+def test_serie_mancante(tmp_path):
+    store = BarStore(str(tmp_path))
+    assert store.read(KEY) == (None, None)
+    assert store.append(KEY, bars('2024-01-01', 3)) is False
+
+
+def test_scrittura_e_lettura(tmp_path):
+    store = BarStore(str(tmp_path))
+    frame = bars('2024-01-01', 5)
+    store.write(KEY, frame, n_bars=5)
+
+    stored, meta = store.read(KEY)
+    pd.testing.assert_frame_equal(stored, frame, check_freq=False)
+    assert meta['length'] == 5 and meta['n_bars'] == 5 and meta['generation'] == 1
+
+
+def test_accodamento_senza_nuova_generazione(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.write(KEY, bars('2024-01-01', 5), n_bars=5)
+    # Le barre già salvate vengono ignorate, quelle nuove accodate agli stessi file
+    assert store.append(KEY, pd.concat([bars('2024-01-02', 2), bars('2024-01-06', 2, close=[4, 5])]))
+
+    stored, meta = store.read(KEY)
+    assert meta['length'] == 7 and meta['generation'] == 1
+    assert stored['close'].tolist() == [100, 101, 102, 103, 104, 4, 5]
+    assert generation_files(store) == ['close.1.f8']
+
+
+def test_sostituzione_ultima_barra_in_nuova_generazione(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.write(KEY, bars('2024-01-01', 3), n_bars=3)
+    before, _ = store.read(KEY)
+
+    # L'ultima barra (ancora in formazione) cambia chiusura e ne arriva una nuova
+    assert store.append(KEY, bars('2024-01-03', 2, close=[110, 111]))
+
+    stored, meta = store.read(KEY)
+    assert meta['length'] == 4 and meta['generation'] == 2
+    assert stored['close'].tolist() == [100, 101, 110, 111]
+    assert generation_files(store) == ['close.2.f8']
+    # Un lettore che aveva già mappato la generazione precedente continua a vederla intatta
+    assert before['close'].tolist() == [100, 101, 102]
+
+
+def test_riscrittura_elimina_la_generazione_precedente(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.write(KEY, bars('2024-01-01', 3), n_bars=3)
+    store.write(KEY, bars('2023-01-01', 10), n_bars=10)
+
+    stored, meta = store.read(KEY)
+    assert len(stored) == 10 and meta['generation'] == 2
+    assert generation_files(store) == ['close.2.f8']
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from barre_compatte import BAR_PRICE_TICK, CompactBars, compact_column
+
+
+def test_prezzi_bassi_in_float32():
+    prices = np.round(np.linspace(1, 1000, 5000), 4)
+    column = compact_column(prices, BAR_PRICE_TICK / 2)
+    assert column.dtype == np.float32
+    assert np.all(np.abs(column.astype('f8') - prices) <= BAR_PRICE_TICK / 2)
+
+
+def test_prezzi_alti_restano_in_float64():
+    # Sopra 1024 il passo del float32 supera lo scatto: 4 decimali non sopravvivono alla conversione
+    prices = np.array([65432.1234, 65432.1235, 5012.3456])
+    column = compact_column(prices, BAR_PRICE_TICK / 2)
+    assert column.dtype == np.float64
+    np.testing.assert_array_equal(column, prices)
+
+
+def test_volumi_grandi_restano_in_float64():
+    index = pd.date_range('2024-01-01', periods=3, freq='D')
+    frame = pd.DataFrame({'close': [10.5, 10.75, 11.0], 'volume': [1e3, 2 ** 24 + 1, 5e3]}, index=index)
+    bars = CompactBars.from_frame(frame)
+    assert bars.columns['close'].dtype == np.float32
+    assert bars.columns['volume'].dtype == np.float64
+    assert bars.to_frame()['volume'].iloc[1] == 2 ** 24 + 1
+
+
+def test_valori_oltre_il_float32_restano_in_float64():
+    column = compact_column(np.array([1.0, 1e40, np.nan]), BAR_PRICE_TICK / 2)
+    assert column.dtype == np.float64
@@ -0,0 +1,34 @@
+import time
+
+import cache_condivisa
+from cache_condivisa import MemoryRedis, SharedCache
+
+
+def test_classifica_dei_ticker_richiesti():
+    cache = SharedCache(url='memory://')
+    for ticker in ['NASDAQ:AAPL', 'NASDAQ:MSFT', 'NASDAQ:AAPL', 'NYSE:IBM', 'NASDAQ:AAPL', 'NASDAQ:MSFT']:
+        cache.record_request(ticker)
+    assert cache.top_requested(2) == ['NASDAQ:AAPL', 'NASDAQ:MSFT']
+    assert cache.top_requested(0) == []
+
+
+def test_conteggi_vecchi_non_contano(monkeypatch):
+    monkeypatch.setattr(cache_condivisa, 'POPULAR_DAYS', 3)
+    cache = SharedCache(url='memory://')
+    # Richieste di ieri e di prima della finestra di POPULAR_DAYS giorni
+    cache.client.zincrby(cache._popular_key(1), 5, 'NASDAQ:MSFT')
+    cache.client.zincrby(cache._popular_key(3), 100, 'NASDAQ:AAPX')
+    cache.record_request('NASDAQ:AAPL')
+    cache.record_request('NASDAQ:MSFT')
+
+    assert cache.top_requested(5) == ['NASDAQ:MSFT', 'NASDAQ:AAPL']
+
+
+def test_conteggio_del_giorno_scade():
+    client = MemoryRedis()
+    client.zincrby('popular', 1, 'NASDAQ:AAPL')
+    assert client.expire('popular', 0.01)
+    assert client.zrevrange('popular', 0, -1, withscores=True) == [(b'NASDAQ:AAPL', 1.0)]
+    time.sleep(0.02)
+    assert client.zrevrange('popular', 0, -1) == []
+    assert not client.expire('popular', 10)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from calcolo_massimi import new_high_kernel, new_highs_batch, year_starts
+
+
+def reference(close):
+    """ Calcolo precedente con groupby per anno (una serie senza barre mancanti). """
+    frame = pd.DataFrame({'Close': close, 'year': close.index.year})
+    frame['rolling_max_year'] = frame.groupby('year')['Close'].cummax()
+    frame['rolling_max_shifted_year'] = frame.groupby('year')['rolling_max_year'].shift(1)
+    frame['is_new_high_year'] = frame['Close'] > frame['rolling_max_shifted_year']
+    frame['new_high_count_year'] = frame.groupby('year')['is_new_high_year'].cumsum()
+    yearly = frame.groupby('year').agg(number_of_new_highs=('is_new_high_year', 'sum'),
+                                       first_close=('Close', 'first'), last_close=('Close', 'last'))
+    yearly['yearly_return_pct'] = 100.0 * (yearly['last_close'] / yearly['first_close'] - 1)
+    return frame, yearly
+
+
+def random_closes(n, seed, start='2019-06-01'):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=n, freq='D')
+    return pd.Series(100 * np.exp(np.cumsum(rng.normal(0, 0.02, n))), index=index)
+
+
+def test_year_starts():
+    index = pd.DatetimeIndex(['2022-12-30', '2022-12-31', '2023-01-02', '2023-06-01', '2024-01-01'])
+    assert year_starts(index).tolist() == [0, 2, 4]
+    assert year_starts(pd.DatetimeIndex([])).tolist() == []
+
+
+def test_kernel_come_groupby():
+    close = random_closes(2000, seed=1)
+    frame, yearly = reference(close)
+
+    is_new_high, count, number, first, last = new_high_kernel(close.to_numpy(), year_starts(close.index))
+
+    np.testing.assert_array_equal(is_new_high[0], frame['is_new_high_year'].to_numpy())
+    np.testing.assert_array_equal(count[0], frame['new_high_count_year'].to_numpy())
+    np.testing.assert_array_equal(number[0], yearly['number_of_new_highs'].to_numpy())
+    np.testing.assert_array_equal(first[0], yearly['first_close'].to_numpy())
+    np.testing.assert_array_equal(last[0], yearly['last_close'].to_numpy())
+
+
+def test_batch_come_groupby_per_simbolo():
+    # Simboli con storie di lunghezza diversa: NaN dove un simbolo non ha ancora la barra
+    closes = pd.DataFrame({'A': random_closes(1500, seed=2), 'B': random_closes(900, seed=3, start='2020-08-15'),
+                           'C': random_closes(1500, seed=4)})
+    closes.loc[closes.index[700:710], 'C'] = np.nan
+
+    new_highs, yearly_return_pct = new_highs_batch(closes)
+
+    for symbol in closes:
+        _, yearly = reference(closes[symbol].dropna())
+        counts = new_highs[symbol].loc[yearly.index]
+        np.testing.assert_array_equal(counts.to_numpy(), yearly['number_of_new_highs'].to_numpy())
+        np.testing.assert_allclose(yearly_return_pct[symbol].loc[yearly.index].to_numpy(),
+                                   yearly['yearly_return_pct'].to_numpy())
+    # Gli anni in cui B non esiste ancora restano senza rendimento
+    assert np.isnan(yearly_return_pct.loc[2019, 'B'])
+    assert new_highs.loc[2019, 'B'] == 0
@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from dash import no_update
+
+from dati_sintetici import install_synthetic_provider
+
+# Senza tvDatafeed installato serve il modulo sostitutivo (Interval) prima di importare dati_storici
+install_synthetic_provider()
+
+import dati_storici  # noqa: E402
+from archivio_barre import BarStore  # noqa: E402
+from cache_barre import bar_cache  # noqa: E402
+from cache_condivisa import SharedCache  # noqa: E402
+from dati_storici import STALE_OK, REVALIDATE, load_bars, series_key  # noqa: E402
+from rivalidazione import STALE_MESSAGE, stale_outputs  # noqa: E402
+from tvDatafeed import Interval  # noqa: E402
+
+TICKER = 'NASDAQ:AAPL'
+
+
+def bars(n, end):
+    index = pd.date_range(end=end, periods=n, freq='D', name='datetime').astype('M8[ns]')
+    close = np.arange(n, dtype='f8') + 100
+    return pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close, 'volume': 1e3}, index=index)
+
+
+class FakeProvider:
+    """ Sorgente finta: ultime n barre di `history`, oppure l'eccezione `error`. """
+
+    def __init__(self, history):
+        self.history = history
+        self.error = None
+        self.calls = 0
+
+    def get_history(self, ticker, interval, n_bars):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.history.iloc[-n_bars:]
+
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    """ Archivio vuoto in tmp_path, cache in memoria vuota, nessun Redis e sorgente finta. """
+    today = pd.Timestamp.now().normalize()
+    provider = FakeProvider(bars(60, today))
+    monkeypatch.setattr(dati_storici, 'bar_store', BarStore(str(tmp_path)))
+    monkeypatch.setattr(dati_storici, 'shared_cache', SharedCache(url=''))
+    monkeypatch.setattr(dati_storici, 'get_provider', lambda: provider)
+    bar_cache.clear()
+    yield provider
+    bar_cache.clear()
+
+
+def store_expired(n, end):
+    """ Serie salvata e scaduta: scaricata un giorno fa con l'ultima barra di `end`. """
+    key = series_key(TICKER, Interval.in_daily)
+    store = dati_storici.bar_store
+    store.write(key, bars(n, end), n_bars=n)
+    directory = store._series_dir(key)
+    meta = store._read_meta(directory)
+    store._write_meta(directory, {**meta, 'fetched_at': time.time() - 86400})
+
+
+def test_serie_scaduta_servita_senza_attendere_la_sorgente(provider):
+    store_expired(50, pd.Timestamp.now().normalize() - pd.Timedelta(days=3))
+
+    for _ in range(2):
+        frame, stale = load_bars(TICKER, 50, Interval.in_daily, policy=STALE_OK)
+        assert stale and len(frame) == 50
+    # Né scaricata né messa in cache: resta scaduta finché non la si riconvalida
+    assert provider.calls == 0
+
+
+def test_riconvalida_aggiorna_la_serie(provider):
+    store_expired(50, pd.Timestamp.now().normalize() - pd.Timedelta(days=3))
+
+    frame, stale = load_bars(TICKER, 50, Interval.in_daily, policy=REVALIDATE)
+    assert not stale
+    assert frame.index[-1] == provider.history.index[-1]
+
+    frame, stale = load_bars(TICKER, 50, Interval.in_daily, policy=STALE_OK)
+    assert not stale and frame.index[-1] == provider.history.index[-1]
+
+
+def test_riconvalida_con_sorgente_in_errore_resta_scaduta(provider):
+    end = pd.Timestamp.now().normalize() - pd.Timedelta(days=3)
+    store_expired(50, end)
+    provider.error = ConnectionError('sorgente non disponibile')
+
+    frame, stale = load_bars(TICKER, 50, Interval.in_daily, policy=REVALIDATE)
+    # Stale-if-error: le barre salvate, ancora segnalate come scadute
+    assert stale and frame.index[-1] == end
+
+
+def test_serie_assente_scaricata(provider):
+    frame, stale = load_bars(TICKER, 30, Interval.in_daily, policy=STALE_OK)
+    assert not stale and len(frame) == 30
+    assert provider.calls == 1
+
+
+def test_stato_della_pagina():
+    assert stale_outputs(TICKER, Interval.in_daily, False) == (no_update, "")
+    assert stale_outputs(TICKER, Interval.in_daily, True) == ({'ticker': TICKER, 'interval': '1D'}, STALE_MESSAGE)
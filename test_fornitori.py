@@ -0,0 +1,41 @@
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from fornitori import YFinanceProvider
+
+
+class FakeInterval:
+    def __init__(self, value):
+        self.value = value
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """ yfinance finto: registra gli argomenti di ogni download e restituisce due barre a 1 minuto. """
+    calls = []
+
+    def download(symbols, **kwargs):
+        calls.append(kwargs)
+        index = pd.date_range(pd.Timestamp.now().normalize(), periods=2, freq='min')
+        return pd.DataFrame({'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': 1.0, 'Volume': 1.0}, index=index)
+
+    monkeypatch.setitem(sys.modules, 'yfinance', types.SimpleNamespace(download=download))
+    return calls
+
+
+def test_intervallo_non_disponibile_su_yahoo(downloads):
+    assert YFinanceProvider().get_history_many(['NASDAQ:AAPL'], FakeInterval('4H'), n_bars=100) == {}
+    assert downloads == []
+
+
+def test_inizio_limitato_alla_storia_di_yahoo(downloads):
+    # 5000 barre a 1 minuto sarebbero più dei 7 giorni che Yahoo serve per questo intervallo
+    result = YFinanceProvider().get_history_many(['NASDAQ:AAPL'], FakeInterval('1'), n_bars=5000)
+
+    assert len(result['NASDAQ:AAPL']) == 2
+    start = pd.Timestamp(downloads[0]['start'])
+    assert downloads[0]['interval'] == '1m'
+    assert start >= pd.Timestamp.now().normalize() - pd.Timedelta(days=7)
@@ -0,0 +1,55 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from grafici import encode_array, figure, hline, trace
+
+
+def decode(encoded):
+    return np.frombuffer(base64.b64decode(encoded['bdata']), dtype=encoded['dtype'])
+
+
+def test_float_in_base64():
+    values = np.array([1.5, np.nan, -2.25])
+    encoded = encode_array(values)
+    assert encoded['dtype'] == 'f8'
+    np.testing.assert_array_equal(decode(encoded), values)
+
+
+def test_interi_a_64_bit_ridotti():
+    assert encode_array(np.array([2020, 2021, 2022]))['dtype'] == 'i4'
+    # Fuori dal campo di i4 plotly.js non ha gli interi a 64 bit: si passa a f8
+    large = encode_array(np.array([0, 2 ** 40]))
+    assert large['dtype'] == 'f8'
+    np.testing.assert_array_equal(decode(large), [0, 2 ** 40])
+
+
+def test_date_in_millisecondi():
+    index = pd.DatetimeIndex(['1969-12-31', '2024-01-02 09:30', None])
+    encoded = encode_array(index)
+    expected = [-86_400_000, pd.Timestamp('2024-01-02 09:30').value / 1e6, np.nan]
+    np.testing.assert_array_equal(decode(encoded), expected)
+    # Senza typed (tracce estese dalla modalità live) si usano liste di interi
+    assert encode_array(index[:2], typed=False) == [-86_400_000, int(expected[1])]
+
+
+def test_valori_non_numerici_restano_liste():
+    assert encode_array(np.array(['a', 'b'])) == ['a', 'b']
+    assert encode_array(np.array([True, False])) == [True, False]
+    assert encode_array(np.array([1.0, 2.0]), typed=False) == [1.0, 2.0]
+
+
+def test_figura_come_plotly():
+    x, y = pd.date_range('2024-01-01', periods=3), np.array([1.0, 2.0, 3.0])
+    fig = figure([trace('scatter', x, y, "Prezzo", mode='lines')], "Titolo", "Data", "Prezzo", dates=True,
+                 lines=[hline(2.0, 'red', annotation="Media")])
+
+    # I validatori di plotly accettano la figura così come viene inviata al browser
+    validated = go.Figure(fig)
+    np.testing.assert_array_equal(decode(validated.data[0].y), y)
+    np.testing.assert_array_equal(decode(validated.data[0].x), x.values.astype('M8[ms]').astype('i8'))
+    assert validated.layout.xaxis.type == 'date'
+    assert validated.layout.shapes[0].y0 == 2.0
+    assert validated.layout.annotations[0].text == "Media"
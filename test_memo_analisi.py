@@ -0,0 +1,96 @@
+import diskcache
+import pandas as pd
+import pytest
+
+import memo_analisi
+from cache_condivisa import SharedCache
+from memo_analisi import AnalyticsMemo
+
+
+def bars(n, last_close=None):
+    index = pd.date_range('2024-01-01', periods=n, freq='D', name='datetime')
+    frame = pd.DataFrame({'close': [float(i) for i in range(n)]}, index=index)
+    if last_close is not None:
+        frame.iloc[-1, 0] = last_close
+    return frame
+
+
+class Counter:
+    """ Calcolo finto: conta le chiamate e restituisce la media delle chiusure. """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, frame):
+        self.calls += 1
+        return {'media': float(frame['close'].mean()), 'barre': len(frame)}
+
+
+@pytest.fixture(autouse=True)
+def shared(monkeypatch):
+    cache = SharedCache(url='memory://')
+    monkeypatch.setattr(memo_analisi, 'shared_cache', cache)
+    return cache
+
+
+def test_stesse_barre_nessun_ricalcolo():
+    memo, compute = AnalyticsMemo(), Counter()
+    first = memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+    second = memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+
+    assert first == second == {'media': 4.5, 'barre': 10}
+    assert compute.calls == 1
+    assert memo.stats() == {'entries': 1, 'hits': 1, 'misses': 1}
+
+
+def test_barra_nuova_invalida_il_risultato():
+    memo, compute = AnalyticsMemo(), Counter()
+    memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+    result = memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(11), compute)
+
+    assert result['barre'] == 11
+    assert compute.calls == 2
+    # Il risultato della barra precedente viene scartato subito
+    assert memo.stats()['entries'] == 1
+
+
+def test_ultima_barra_aggiornata_invalida_il_risultato():
+    memo, compute = AnalyticsMemo(), Counter()
+    memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+    result = memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10, last_close=19.0), compute)
+
+    assert result['media'] == 5.5
+    assert compute.calls == 2
+
+
+def test_parametri_diversi_chiavi_diverse():
+    memo, compute = AnalyticsMemo(), Counter()
+    memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute, params={'n_bars': 10})
+    memo.get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute, params={'n_bars': 20})
+
+    assert compute.calls == 2
+    assert memo.stats()['entries'] == 2
+
+
+def test_risultato_di_un_altro_worker_dalla_cache_condivisa():
+    compute = Counter()
+    AnalyticsMemo().get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+    result = AnalyticsMemo().get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+
+    assert result == {'media': 4.5, 'barre': 10}
+    assert compute.calls == 1
+
+
+def test_senza_redis_risultato_dalla_cache_dei_lavori(monkeypatch, tmp_path):
+    # Ripiego locale al processo al posto di Redis: i risultati passano dalla cache su disco dei lavori
+    monkeypatch.setattr(memo_analisi, 'shared_cache', SharedCache(url=''))
+    jobs_cache = diskcache.Cache(str(tmp_path))
+    monkeypatch.setattr(memo_analisi, 'get_jobs_cache', lambda: jobs_cache)
+
+    compute = Counter()
+    AnalyticsMemo().get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+    result = AnalyticsMemo().get_or_compute('pagina', 'NASDAQ:AAPL', bars(10), compute)
+
+    assert result == {'media': 4.5, 'barre': 10}
+    assert compute.calls == 1
+    jobs_cache.close()
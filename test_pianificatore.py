@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+import fornitori
+import pianificatore
+import pool_tv
+from fornitori import TradingViewProvider
+from pianificatore import FetchScheduler, _LocalState
+from pool_tv import TvSessionPool
+
+
+class StubSession:
+    """ Sessione tvDatafeed finta: restituisce le risposte in `replies` in ordine (None come tvDatafeed
+    per un simbolo inesistente, un'eccezione viene sollevata). """
+
+    token = 'token'
+    replies = []
+    calls = 0
+
+    def get_hist(self, **kwargs):
+        StubSession.calls += 1
+        reply = StubSession.replies.pop(0) if StubSession.replies else None
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def bars(n=3):
+    index = pd.date_range('2024-01-01', periods=n, freq='D', name='datetime')
+    return pd.DataFrame({'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1.0}, index=index)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    StubSession.replies, StubSession.calls = [], 0
+    scheduler = FetchScheduler(rate=1000, burst=1000, state=_LocalState())
+    monkeypatch.setattr(pianificatore, 'FETCH_BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(pianificatore, 'FETCH_MAX_RETRIES', 2)
+    monkeypatch.setattr(fornitori, 'fetch_scheduler', scheduler)
+    monkeypatch.setattr(pool_tv, 'tv_pool', TvSessionPool(size=1, factory=StubSession))
+    return scheduler
+
+
+def test_simbolo_inesistente_non_blocca_le_richieste(scheduler):
+    assert TradingViewProvider().get_history('NASDAQ:AAPLX', None, 10) is None
+
+    # Nessun nuovo tentativo del pianificatore e nessun backoff globale
+    stats = scheduler.stats()
+    assert stats['failures'] == 0
+    assert stats['blocked_for'] == 0
+
+
+def test_nuovo_tentativo_dopo_errore(scheduler):
+    error = ConnectionError('socket chiuso')
+    StubSession.replies = [error, error, bars()]
+
+    result = TradingViewProvider().get_history('NASDAQ:AAPL', None, 10)
+
+    assert len(result) == 3
+    assert StubSession.calls == 3
+    # Il successo azzera gli errori consecutivi
+    assert scheduler.stats()['failures'] == 0
+
+
+def test_errori_ripetuti_attivano_il_backoff(scheduler):
+    StubSession.replies = [ConnectionError('socket chiuso')] * 6
+
+    with pytest.raises(ConnectionError):
+        TradingViewProvider().get_history('NASDAQ:AAPL', None, 10)
+
+    stats = scheduler.stats()
+    assert stats['failures'] == 3
+    assert stats['blocked_for'] > 0
+
+
+def test_risposta_vuota_non_scarta_la_sessione(scheduler):
+    pool = pool_tv.tv_pool
+
+    assert pool.get_hist(symbol='AAPLX', exchange='NASDAQ') is None
+    assert pool.get_hist(symbol='AAPLY', exchange='NASDAQ') is None
+
+    # Una sola sessione, riutilizzata: nessuna riconnessione per i simboli senza dati
+    assert StubSession.calls == 2
+    stats = pool.stats()
+    assert stats['created'] == 1
+    assert stats['discarded'] == 0
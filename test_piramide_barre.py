@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from piramide_barre import LEVELS, BarPyramid
+
+
+def ohlcv(n, seed=0, start='2021-11-15'):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=n, freq='D', name='datetime')
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame({'open': close * 0.99, 'high': close * 1.02, 'low': close * 0.97, 'close': close,
+                         'volume': rng.integers(1000, 5000, n).astype('f8')}, index=index)
+
+
+def assert_same_levels(pyramid, bars):
+    rebuilt = BarPyramid().update(bars)
+    for level in LEVELS:
+        for column, values in rebuilt.levels[level].items():
+            np.testing.assert_array_equal(pyramid.levels[level][column], values, err_msg=f"{level} {column}")
+
+
+def test_livello_mensile_come_resample():
+    bars = ohlcv(400)
+    monthly = BarPyramid().update(bars).level('M')
+    expected = bars.resample('MS').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+                                        'volume': 'sum'})
+    np.testing.assert_array_equal(monthly.index.values, expected.index.values.astype('M8[ns]'))
+    for column in expected:
+        np.testing.assert_allclose(monthly[column].to_numpy(), expected[column].to_numpy(), err_msg=column)
+
+
+def test_barre_nuove_come_ricostruzione():
+    bars = ohlcv(500)
+    pyramid = BarPyramid().update(bars.iloc[:300])
+    # Una barra alla volta, attraverso fine settimana, mese e anno, con l'ultima ancora in formazione
+    for end in range(301, 500, 7):
+        forming = bars.iloc[:end].copy()
+        forming.iloc[-1, forming.columns.get_loc('close')] *= 1.01
+        assert_same_levels(pyramid.update(forming), forming)
+        assert_same_levels(pyramid.update(bars.iloc[:end]), bars.iloc[:end])
+
+
+def test_storia_accorciata_in_testa():
+    bars = ohlcv(600)
+    pyramid = BarPyramid().update(bars.iloc[:400])
+    for end in (410, 450, 600):
+        window = bars.iloc[end - 400:end]
+        assert_same_levels(pyramid.update(window), window)
+
+
+def test_storia_rettificata_ricostruita():
+    bars = ohlcv(400)
+    pyramid = BarPyramid().update(bars.iloc[:350])
+    adjusted = bars.copy()
+    adjusted.iloc[:360] /= 2
+    assert_same_levels(pyramid.update(adjusted), adjusted)
+
+
+def test_ripresa_da_stato_salvato():
+    bars = ohlcv(400)
+    saved = BarPyramid().update(bars.iloc[:300]).to_state()
+
+    pyramid = BarPyramid()
+    assert pyramid.load_state(saved)
+    assert not pyramid.changed
+    assert_same_levels(pyramid.update(bars), bars)
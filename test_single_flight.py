@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, n):
+    """ n thread chiedono la stessa chiave mentre fn è bloccata; restituisce risultati ed errori. """
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def wait_coalesced(flight, n):
+    for _ in range(1000):
+        if flight.stats()['coalesced'] >= n:
+            return
+        time.sleep(0.005)
+
+
+def test_chiamate_concorrenti_eseguite_una_volta():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 'barre'
+
+    threads, results, errors = run_concurrently(flight, 'NASDAQ:AAPL', fetch, 5)
+    wait_coalesced(flight, 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ['barre'] * 5 and errors == []
+    assert flight.stats() == {'executions': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_errore_condiviso_e_chiave_liberata():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ConnectionError('sorgente non disponibile')
+
+    threads, results, errors = run_concurrently(flight, 'NASDAQ:AAPL', fetch, 3)
+    wait_coalesced(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [] and len(errors) == 3
+    assert all(isinstance(e, ConnectionError) for e in errors)
+    # Dopo l'errore la chiave non resta occupata: la chiamata successiva riesegue
+    assert flight.do('NASDAQ:AAPL', lambda: 'barre') == 'barre'
+    assert flight.stats()['executions'] == 2
+
+
+def test_chiavi_diverse_non_si_aspettano():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do('c', int, 'x')
+    assert flight.stats() == {'executions': 3, 'coalesced': 0, 'in_flight': 0}
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from statistiche_mobili import IncrementalRollingStats, RollingWindow
+
+
+def expected(close, sum_windows=(5, 22), std_windows=(30,)):
+    """ Calcolo completo con pandas. """
+    returns = pd.Series(close).pct_change()
+    outputs = {'returns': returns.to_numpy()}
+    for size in sum_windows:
+        outputs[f"sum_{size}"] = returns.rolling(size).sum().to_numpy()
+    for size in std_windows:
+        outputs[f"std_{size}"] = returns.rolling(size).std().to_numpy()
+    return outputs
+
+
+def assert_same(outputs, close):
+    for name, values in expected(close).items():
+        np.testing.assert_allclose(outputs[name], values, rtol=1e-9, atol=1e-12, err_msg=name)
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2020-01-01', periods=n, freq='D').values.astype('M8[ns]').view('i8')
+    return times, 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+
+
+def test_finestra_come_pandas_con_nan():
+    values = np.array([0.1, np.nan, 0.3, -0.2, 0.5, 0.05, -0.1, 0.2])
+    window = RollingWindow(3)
+    sums, stds = [], []
+    for value in values:
+        window.push(value)
+        sums.append(window.sum())
+        stds.append(window.std())
+    np.testing.assert_allclose(sums, pd.Series(values).rolling(3).sum().to_numpy())
+    np.testing.assert_allclose(stds, pd.Series(values).rolling(3).std().to_numpy())
+
+
+def test_barre_nuove_come_calcolo_completo():
+    times, close = series(400)
+    stats = IncrementalRollingStats()
+    assert_same(stats.update(times[:300], close[:300]), close[:300])
+
+    # Una barra alla volta, con l'ultima che cambia prima di essere confermata
+    for end in range(301, 400):
+        forming = close[:end].copy()
+        forming[-1] *= 1.01
+        assert_same(stats.update(times[:end], forming), forming)
+        assert_same(stats.update(times[:end], close[:end]), close[:end])
+
+
+def test_finestra_di_barre_che_scorre():
+    times, close = series(500)
+    stats = IncrementalRollingStats()
+    stats.update(times[:300], close[:300])
+    # Sempre le ultime 300 barre: le più vecchie escono dall'inizio della serie
+    for end in (305, 320, 400):
+        assert_same(stats.update(times[end - 300:end], close[end - 300:end]), close[end - 300:end])
+
+
+def test_storia_rettificata_ricalcola_tutto():
+    times, close = series(300)
+    stats = IncrementalRollingStats()
+    stats.update(times[:250], close[:250])
+
+    adjusted = close.copy()
+    adjusted[:260] /= 2  # split: le chiusure salvate, compresa l'ultima confermata, vengono rettificate
+    assert_same(stats.update(times, adjusted), adjusted)
+
+
+def test_ripresa_da_stato_salvato():
+    times, close = series(400)
+    stats = IncrementalRollingStats()
+    stats.update(times[:300], close[:300])
+
+    resumed = IncrementalRollingStats()
+    assert resumed.load_state(stats.to_state())
+    assert not resumed.changed
+    assert_same(resumed.update(times, close), close)
+    # Configurazione diversa: lo stato salvato viene ignorato
+    assert not IncrementalRollingStats(sum_windows=(10,)).load_state(stats.to_state())